@@ -1,28 +1,41 @@
 import os
 import re
+import sys
 import json
+import base64
+import time
 import signal
 import logging
+import threading
 from copy import copy
+from collections import Counter
 from pathlib import Path
 from textwrap import wrap
 from datetime import datetime
-from dnslib.server import DNSServer
+import iterative
+from dnslib.server import DNSServer, DNSLogger
+from dnslib.rrl import RateLimiter
+from dnslib.metrics import ServerMetrics
+from dnslib.structlogger import StructuredLogger
+from dnslib.capture import CaptureLogger
 from dnslib.proxy import ProxyResolver
-from dnslib import DNSLabel, QTYPE, RR, dns
-from dnslib.dns import DNSRecord, DNSQuestion
-from flask import Flask, request, render_template
+from dnslib.zoneindex import ZoneIndex
+from dnslib.compiledzone import CompiledZone, compile_zone, is_compiled
+from dnslib import DNSLabel, QTYPE, RCODE, RR, dns
+from dnslib.lex import WordLexer
+from dnslib.dns import DNSRecord, DNSQuestion, DNSError as DNSParseError
+from flask import Flask, Response, request, render_template
 
 
 SERIAL_NO = int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())
 
 handler = logging.StreamHandler()
-handler.setLevel(logging.INFO)
+handler.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s', datefmt='%H:%M:%S'))
 
 logger = logging.getLogger(__name__)
 logger.addHandler(handler)
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 
 TYPE_LOOKUP = {
     'A': (dns.A, QTYPE.A),
@@ -30,17 +43,26 @@ TYPE_LOOKUP = {
     'CAA': (dns.CAA, QTYPE.CAA),
     'CNAME': (dns.CNAME, QTYPE.CNAME),
     'DNSKEY': (dns.DNSKEY, QTYPE.DNSKEY),
+    'DS': (dns.DS, QTYPE.DS),
+    'HTTPS': (dns.HTTPS, QTYPE.HTTPS),
     'MX': (dns.MX, QTYPE.MX),
     'NAPTR': (dns.NAPTR, QTYPE.NAPTR),
     'NS': (dns.NS, QTYPE.NS),
+    'NSEC': (dns.NSEC, QTYPE.NSEC),
+    'NSEC3': (dns.NSEC3, QTYPE.NSEC3),
+    'NSEC3PARAM': (dns.NSEC3PARAM, QTYPE.NSEC3PARAM),
     'PTR': (dns.PTR, QTYPE.PTR),
     'RRSIG': (dns.RRSIG, QTYPE.RRSIG),
     'SOA': (dns.SOA, QTYPE.SOA),
     'SRV': (dns.SRV, QTYPE.SRV),
+    'SVCB': (dns.SVCB, QTYPE.SVCB),
+    'TLSA': (dns.TLSA, QTYPE.TLSA),
     'TXT': (dns.TXT, QTYPE.TXT),
     'SPF': (dns.TXT, QTYPE.TXT),
 }
 
+ZONE_FORMAT_TYPES = {'DS', 'HTTPS', 'NSEC', 'NSEC3', 'NSEC3PARAM', 'SVCB', 'TLSA'}
+
 
 class Record:
     def __init__(self, rname, rtype, args):
@@ -56,6 +78,13 @@ class Record:
             # wrap long TXT records as per dnslib's docs.
             args = wrap(args[0], 255),
 
+        if rtype in ZONE_FORMAT_TYPES and len(args) == 1 and isinstance(args[0], str):
+            # DNSSEC/SVCB records are given in zone file format
+            # e.g. Record('example.com', 'HTTPS', ('1 . alpn="h2,h3"',))
+            rdata = rd_cls.fromZone([value for _, value in WordLexer(args[0])])
+        else:
+            rdata = rd_cls(*args)
+
         if self._rtype in (QTYPE.NS, QTYPE.SOA):
             ttl = 3600 * 24
         else:
@@ -64,94 +93,225 @@ class Record:
         self.rr = RR(
             rname=self._rname,
             rtype=self._rtype,
-            rdata=rd_cls(*args),
+            rdata=rdata,
             ttl=ttl,
         )
 
-    def match(self, q):
-        return q.qname == self._rname and (q.qtype == QTYPE.ANY or q.qtype == self._rtype)
-
-    def sub_match(self, q):
-        return self._rtype == QTYPE.SOA and q.qname.matchSuffix(self._rname)
-
     def __str__(self):
         return str(self.rr)
 
 
+def zone_lines(zone_file):
+    current_line = ''
+    for line in zone_file.open():
+        if line.startswith('#'):
+            continue
+        line = line.rstrip('\r\n\t ')
+        if not line.startswith(' ') and current_line:
+            yield current_line
+            current_line = ''
+        current_line += line.lstrip('\r\n\t ')
+    if current_line:
+        yield current_line
+
+
+def parse_zone_line(line):
+    try:
+        rname, rtype, args_ = line.split(maxsplit=2)
+
+        if args_.startswith('['):
+            args = tuple(json.loads(args_))
+        else:
+            args = (args_,)
+        return Record(rname, rtype, args)
+    except Exception as e:
+        raise RuntimeError(f'Error processing line ({e.__class__.__name__}: {e}) "{line.strip()}"') from e
+
+
+def load_zones(zone_file):
+    # assert zone_file.exists(), f'zone files "{zone_file}" does not exist'
+    logger.info('loading zone file "%s":', zone_file)
+    zones = []
+    for line in zone_lines(zone_file):
+        record = parse_zone_line(line)
+        zones.append((line, record))
+        logger.info(' %2d: %s', len(zones), record)
+    logger.info('%d zone resource records generated from zone file', len(zones))
+    return zones
+
+
+def compile_zones(zone_file, image):
+    count = compile_zone((record.rr for _, record in load_zones(zone_file)), str(image))
+    logger.info('%d zone resource records compiled to "%s"', count, image)
+
+
 class Resolver(ProxyResolver):
     def __init__(self, upstream, zone_file):
         super().__init__(upstream, 53, 5)
-        self.records = self.load_zones(zone_file)
-
-    def zone_lines(self):
-        current_line = ''
-        for line in zone_file.open():
-            if line.startswith('#'):
-                continue
-            line = line.rstrip('\r\n\t ')
-            if not line.startswith(' ') and current_line:
-                yield current_line
-                current_line = ''
-            current_line += line.lstrip('\r\n\t ')
-        if current_line:
-            yield current_line
-
-    def load_zones(self, zone_file):
-        # assert zone_file.exists(), f'zone files "{zone_file}" does not exist'
-        logger.info('loading zone file "%s":', zone_file)
-        zones = []
-        for line in self.zone_lines():
+        self.zone_file = zone_file
+        self.reload_lock = threading.Lock()
+        self.zone_stats = {
+            'reloads': 0,
+            'reload_errors': 0,
+            'reload_seconds': 0.0,
+            'records': 0,
+            'added': 0,
+            'removed': 0,
+        }
+        self.zone, self.zone_records = self.load_zone()
+        self.zone_stats['records'] = len(self.zone)
+        # shared with the DNS servers (query/rcode counts etc.), served on /metrics
+        self.metrics = ServerMetrics()
+        self.results = self.metrics.counter('dns_resolver_results_total', 'Queries by how they were answered',
+                                            ('result',))
+        self.upstream_seconds = self.metrics.histogram('dns_upstream_seconds', 'Upstream query latency',
+                                                       ('server',))
+        self.metrics.gauge('dns_zone', 'Zone records and reload stats', ('stat',),
+                           fn=lambda: {(k,): v for k, v in self.zone_stats.items()})
+
+    def load_zone(self):
+        # returns the zone index and the RRs generated by each zone file line
+        # (used to work out what changed when the file is reloaded)
+        if is_compiled(self.zone_file):
+            # served straight from the mmap'd image, nothing is parsed
+            zone = CompiledZone(str(self.zone_file))
+            logger.info('%d zone resource records mapped from compiled zone "%s"', len(zone), self.zone_file)
+            return zone, {}
+        zone_records = {}
+        for line, record in load_zones(self.zone_file):
+            zone_records.setdefault(line, []).append(record.rr)
+        return ZoneIndex(rr for rrs in zone_records.values() for rr in rrs), zone_records
+
+    def diff_zone(self):
+        # only re-index the lines that changed, unless most of the file did
+        lines = Counter(zone_lines(self.zone_file))
+        current = Counter({line: len(rrs) for line, rrs in self.zone_records.items()})
+        removed = current - lines
+        added = lines - current
+        if isinstance(self.zone, CompiledZone) or sum(removed.values()) + sum(added.values()) > len(lines) // 2:
+            zone, zone_records = self.load_zone()
+            return zone, zone_records, len(zone), len(self.zone)
+
+        zone = self.zone.copy()
+        zone_records = self.zone_records.copy()
+        for line, n in removed.items():
+            rrs = zone_records.pop(line)
+            for rr in rrs[-n:]:
+                zone.remove(rr)
+            if rrs[:-n]:
+                zone_records[line] = rrs[:-n]
+        for line, n in added.items():
+            rrs = [parse_zone_line(line).rr for _ in range(n)]
+            zone.add(*rrs)
+            zone_records[line] = zone_records.get(line, []) + rrs
+        return zone, zone_records, sum(added.values()), sum(removed.values())
+
+    def reload_zone(self):
+        # builds the new index while queries are served from the current one,
+        # then swaps the reference (resolve only reads self.zone once per query)
+        with self.reload_lock:
+            start = time.perf_counter()
             try:
-                rname, rtype, args_ = line.split(maxsplit=2)
-
-                if args_.startswith('['):
-                    args = tuple(json.loads(args_))
+                if is_compiled(self.zone_file):
+                    zone, zone_records = self.load_zone()
+                    added, removed = len(zone), len(self.zone)
                 else:
-                    args = (args_,)
-                record = Record(rname, rtype, args)
-                zones.append(record)
-                logger.info(' %2d: %s', len(zones), record)
+                    zone, zone_records, added, removed = self.diff_zone()
             except Exception as e:
-                raise RuntimeError(f'Error processing line ({e.__class__.__name__}: {e}) "{line.strip()}"') from e
-        logger.info('%d zone resource records generated from zone file', len(zones))
-        return zones
+                self.zone_stats['reload_errors'] += 1
+                logger.error('error reloading zone file "%s", keeping current zone: %s', self.zone_file, e)
+                return False
+            self.zone, self.zone_records = zone, zone_records
+            elapsed = time.perf_counter() - start
+            self.zone_stats.update(
+                reloads=self.zone_stats['reloads'] + 1,
+                reload_seconds=elapsed,
+                records=len(zone),
+                added=added,
+                removed=removed,
+            )
+        logger.info('reloaded zone file "%s" in %.1fms: %d zone resource records (+%d -%d)',
+                    self.zone_file, elapsed * 1000, len(zone), added, removed)
+        return True
+
+    def soa_records(self, zone, qname):
+        # SOA records for the name itself or any higher level zone
+        labels = qname.label
+        for i in range(max(len(labels), 1)):
+            for rr in zone.get(DNSLabel(labels[i:])):
+                if rr.rtype == QTYPE.SOA:
+                    yield rr
 
     def resolve(self, request, handler):
-        type_name = QTYPE[request.q.qtype]
+        qtype = request.q.qtype
+        type_name = QTYPE.get(qtype)
         reply = request.reply()
-        for record in self.records:
-            if record.match(request.q):
-                reply.add_answer(record.rr)
+        zone = self.zone
+        for rr in zone.get(request.q.qname):
+            if qtype == QTYPE.ANY or qtype == rr.rtype:
+                reply.add_answer(rr)
 
         if reply.rr:
-            logger.info('found zone for %s[%s], %d replies', request.q.qname, type_name, len(reply.rr))
+            logger.debug('found zone for %s[%s], %d replies', request.q.qname, type_name, len(reply.rr))
+            self.results.inc(('zone',))
             return reply
 
         # no direct zone so look for an SOA record for a higher level zone
-        for record in self.records:
-            if record.sub_match(request.q):
-                reply.add_answer(record.rr)
+        for rr in self.soa_records(zone, request.q.qname):
+            reply.add_answer(rr)
 
         if reply.rr:
-            logger.info('found higher level SOA resource for %s[%s]', request.q.qname, type_name)
+            logger.debug('found higher level SOA resource for %s[%s]', request.q.qname, type_name)
+            self.results.inc(('soa',))
             return reply
 
-        logger.info('no local zone found, proxying %s[%s]', request.q.qname, type_name)
+        logger.debug('no local zone found, proxying %s[%s]', request.q.qname, type_name)
+        start = time.perf_counter()
         response = super().resolve(request, handler)
+        self.upstream_seconds.observe(time.perf_counter() - start, (self.address,))
         if response.header.get_rcode() == 3: #NXERROR
-            for record in self.records:
+            rtype = response.q.qtype
+            for rr in zone:
                 #Check the query type (e.g. A or MX) matches
-                if record.rr.rtype == response.q.qtype:
-                    newrec = copy(record.rr) #Copy the record so we can change it safely
+                if rr.rtype == rtype:
+                    newrec = copy(rr) #Copy the record so we can change it safely
                     newrec.rname = request.q.qname #Overwrite the name with the request's name
                     reply.add_answer(newrec)
             if reply.rr:
-                logger.info('no proxying zone, returning spoof local zone %s[%s]', request.q.qname, type_name)
+                logger.debug('no proxying zone, returning spoof local zone %s[%s]', request.q.qname, type_name)
+                self.results.inc(('spoofed',))
                 return reply
-            else:
-                return response
-        else:
-            return response
+        self.results.inc(('proxied',))
+        return response
+
+
+class ZoneWatcher(threading.Thread):
+    # polls the zone file's mtime/size (inotify isn't available in the stdlib)
+    # and reloads the resolver's zone when it changes
+    def __init__(self, resolver, interval):
+        super().__init__(name='zone-watcher', daemon=True)
+        self.resolver = resolver
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def stat(self):
+        try:
+            st = self.resolver.zone_file.stat()
+        except OSError:
+            # editors often replace the file, try again next time
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def run(self):
+        last = self.stat()
+        while not self.stopped.wait(self.interval):
+            current = self.stat()
+            if current is not None and current != last:
+                last = current
+                self.resolver.reload_zone()
+
+    def stop(self):
+        self.stopped.set()
 
 
 def handle_sig(signum, frame):
@@ -166,82 +326,251 @@ class DNSError(Exception):
     pass
 
 
+class DoHHandler:
+    # stands in for the DNSHandler passed to resolve(); DoH has no UDP size
+    # limit so the resolver is told it's a stream transport (proxied queries
+    # go upstream over TCP and are never truncated)
+    protocol = 'tcp'
+
+    def __init__(self, client_address):
+        self.client_address = (client_address, 0)
+
+
+class QueryService:
+    # Handles the queries made through the web pages (DoH and the index form).
+    # Created once at startup with the resolver the DNS servers use, so a
+    # request only builds the query and formats the reply: the library QTYPE
+    # table and compiled patterns are shared, and queries are resolved
+    # in-process rather than sent to our own server over the loopback. Without
+    # a resolver (app imported rather than run) queries go to address:port.
+    answer_section = re.compile(r";; ANSWER SECTION:\n(.*)", re.DOTALL)
+
+    def __init__(self, resolver=None, address='127.0.0.1', port=5053, history_dir='.'):
+        self.resolver = resolver
+        self.address = address
+        self.port = port
+        self.history_dir = Path(history_dir)
+
+    def resolve(self, query, client_address, protocol='https'):
+        resolver = self.resolver
+        if resolver is None:
+            try:
+                reply = DNSRecord.parse(query.send(self.address, self.port, tcp=False))
+                if reply.header.tc:
+                    # Truncated - retry in TCP mode
+                    reply = DNSRecord.parse(query.send(self.address, self.port, tcp=True))
+            except (OSError, DNSParseError) as e:
+                reply = self.servfail(query, e)
+            return reply
+        if query.questions:
+            resolver.metrics.queries.inc((QTYPE.get(query.q.qtype), protocol))
+        try:
+            reply = resolver.resolve(query, DoHHandler(client_address))
+        except (OSError, DNSParseError) as e:
+            # upstream unreachable or sent a bad answer
+            reply = self.servfail(query, e)
+        resolver.metrics.responses.inc((RCODE.get(reply.header.rcode), protocol))
+        return reply
+
+    @staticmethod
+    def servfail(query, error):
+        logger.warning('error resolving query, returning SERVFAIL: %s', error)
+        reply = query.reply()
+        reply.header.rcode = RCODE.SERVFAIL
+        return reply
+
+    @staticmethod
+    def read_lines(path):
+        with open(path, 'r') as f:
+            # skip blank lines and comments
+            return [line for line in (line.strip() for line in f) if line and not line.startswith('#')]
+
+    def history(self, mode):
+        return self.read_lines(self.history_dir / f'{mode}.txt')
+
+    def iterative(self, domain):
+        # iterative.iter_query writes its steps to tmp.txt (and iter.txt)
+        open('tmp.txt', 'w').close()
+        iterative.iter_query(domain)
+        return self.read_lines('tmp.txt')
+
+    def recursive(self, domain, query_type, client_address=None):
+        qtype = QTYPE.reverse.get(query_type.upper())
+        if qtype is None:
+            raise DNSError(f'QTYPE: Invalid reverse lookup: [{query_type}]')
+        reply = self.resolve(DNSRecord(q=DNSQuestion(domain, qtype)), client_address, 'http')
+        out = self.answer_section.findall(str(reply))
+        if not out:
+            return ['No answer section']
+        lines = out[0].splitlines()
+        with open(self.history_dir / 'recur.txt', 'a+') as f:
+            for line in lines:
+                print(line, file=f)
+        return lines
+
+
+app.config['QUERY_SERVICE'] = QueryService()
+
+
+def doh_resolve(query):
+    # resolve in-process, without the loopback query to our own DNS server
+    return app.config['QUERY_SERVICE'].resolve(query, request.remote_addr, 'https')
+
+
+def doh_max_age(reply):
+    # RFC 8484 section 5.1: freshness is the smallest TTL in the response, or
+    # for negative answers the smaller of the SOA TTL and SOA minimum
+    ttls = [rr.ttl for rr in reply.rr + reply.auth + reply.ar if rr.rtype != QTYPE.OPT]
+    if not reply.rr:
+        ttls += [rr.rdata.times[4] for rr in reply.auth if rr.rtype == QTYPE.SOA]
+    return min(ttls) if ttls else 0
+
+
+def doh_response(reply, body, mimetype):
+    response = Response(body, mimetype=mimetype)
+    response.headers['Cache-Control'] = f'max-age={doh_max_age(reply)}'
+    return response
+
+
+def doh_json(reply):
+    # JSON format used by the Google/Cloudflare DNS JSON APIs
+    def rrs(section):
+        return [{'name': str(rr.rname), 'type': rr.rtype, 'TTL': rr.ttl, 'data': rr.rdata.toZone()}
+                for rr in section if rr.rtype != QTYPE.OPT]
+    header = reply.header
+    result = {
+        'Status': header.rcode,
+        'TC': bool(header.tc),
+        'RD': bool(header.rd),
+        'RA': bool(header.ra),
+        'AD': bool(header.bitmap & 0x20),
+        'CD': bool(header.bitmap & 0x10),
+        'Question': [{'name': str(q.qname), 'type': q.qtype} for q in reply.questions],
+    }
+    for key, section in (('Answer', reply.rr), ('Authority', reply.auth), ('Additional', reply.ar)):
+        records = rrs(section)
+        if records:
+            result[key] = records
+    return json.dumps(result)
+
+
+@app.route('/dns-query', methods=['GET', 'POST'])
+def dns_query():
+    # RFC 8484 DNS over HTTPS (wire format), or the JSON API when given ?name=
+    if request.method == 'GET' and 'name' in request.args:
+        qtype = request.args.get('type', 'A').upper()
+        if qtype.isdigit():
+            qtype = int(qtype)
+        else:
+            qtype = QTYPE.reverse.get(qtype)
+            if qtype is None:
+                return Response('invalid type', status=400)
+        try:
+            query = DNSRecord(q=DNSQuestion(request.args['name'], qtype))
+        except Exception:
+            return Response('invalid name', status=400)
+        if request.args.get('cd', '').lower() in ('1', 'true'):
+            query.header.bitmap |= 0x10  # CD bit
+        reply = doh_resolve(query)
+        return doh_response(reply, doh_json(reply), 'application/dns-json')
+
+    if request.method == 'POST':
+        if request.mimetype != 'application/dns-message':
+            return Response('unsupported media type', status=415)
+        data = request.get_data()
+    else:
+        param = request.args.get('dns')
+        if not param:
+            return Response('missing dns parameter', status=400)
+        try:
+            # base64url without padding
+            data = base64.urlsafe_b64decode(param + '=' * (-len(param) % 4))
+        except ValueError:
+            return Response('invalid dns parameter', status=400)
+    try:
+        query = DNSRecord.parse(data)
+    except DNSParseError:
+        return Response('invalid dns message', status=400)
+    reply = doh_resolve(query)
+    return doh_response(reply, reply.pack(), 'application/dns-message')
+
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format - only when the DNS servers run in
+    # this process (app imported by a WSGI server has no resolver)
+    resolver = app.config.get('DNS_RESOLVER')
+    if resolver is None:
+        return Response('no DNS server metrics', status=404)
+    return Response(resolver.metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'GET' and 'site' in request.values and 'type' in request.values:
+        service = app.config['QUERY_SERVICE']
         query_domain = request.values.get('site')
-        query_type = request.values.get('type').upper()
         query_mode = request.values.get('mode')
-        show_history = request.values.get('history')
-        if show_history == 'true':
-            f = open('%s.txt' % query_mode, 'r')
-            result = list()
-            for line in f.readlines():
-                line = line.strip()
-                if not len(line) or line.startswith('#'):  # 判断是否是空行或注释行
-                    continue
-                result.append(line)
-            lines = result
-            return render_template('index.html', lines=lines)
+        if request.values.get('history') == 'true':
+            return render_template('index.html', lines=service.history(query_mode))
         if query_mode == 'iter':
-            open('tmp.txt', 'w').close()
-            import iterative
-            iterative.iter_query(query_domain)
-            f = open('tmp.txt', 'r')
-            result = list()
-            for line in f.readlines():
-                line = line.strip()
-                if not len(line) or line.startswith('#'):  # 判断是否是空行或注释行
-                    continue
-                result.append(line)
-            return render_template('index.html', result=result)
-        address = '127.0.0.1'
-        port = 5053
-        from dnslib.bimap import Bimap
-        QTYPE = Bimap('QTYPE',
-                      {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX',
-                       16: 'TXT', 17: 'RP', 18: 'AFSDB', 24: 'SIG', 25: 'KEY', 28: 'AAAA',
-                       29: 'LOC', 33: 'SRV', 35: 'NAPTR', 36: 'KX', 37: 'CERT', 38: 'A6',
-                       39: 'DNAME', 41: 'OPT', 42: 'APL', 43: 'DS', 44: 'SSHFP',
-                       45: 'IPSECKEY', 46: 'RRSIG', 47: 'NSEC', 48: 'DNSKEY', 49: 'DHCID',
-                       50: 'NSEC3', 51: 'NSEC3PARAM', 52: 'TLSA', 55: 'HIP', 99: 'SPF',
-                       249: 'TKEY', 250: 'TSIG', 251: 'IXFR', 252: 'AXFR', 255: 'ANY',
-                       257: 'CAA', 32768: 'TA', 32769: 'DLV'},
-                      DNSError)
-        q = DNSRecord(q=DNSQuestion(query_domain, getattr(QTYPE, query_type)))
-        a_pkt = q.send(address, port, tcp=False)
-        a = DNSRecord.parse(a_pkt)
-        if a.header.tc:
-            # Truncated - retry in TCP mode
-            a_pkt = q.send(address, port, tcp=True)
-            a = DNSRecord.parse(a_pkt)
-        out = str(a)
-        pattern = re.compile(r";; ANSWER SECTION:\n(.*)", re.DOTALL)
-        out = pattern.findall(out)
-        if out:
-            lines = out[0].splitlines()
-            for line in lines:
-                print(line, file=open('recur.txt', 'a+'))
-            return render_template('index.html', lines=lines)
-        else:
-            not_found = ['No answer section']
-            return render_template('index.html', lines=not_found)
+            return render_template('index.html', result=service.iterative(query_domain))
+        lines = service.recursive(query_domain, request.values.get('type'), request.remote_addr)
+        return render_template('index.html', lines=lines)
     return render_template('index.html')
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['compile-zone']:
+        # python app.py compile-zone [zone file] [image]
+        zone_file = Path(sys.argv[2] if len(sys.argv) > 2 else os.getenv('ZONE_FILE', './zones.txt'))
+        image = Path(sys.argv[3] if len(sys.argv) > 3 else zone_file.with_suffix('.zone'))
+        compile_zones(zone_file, image)
+        exit(0)
+
     signal.signal(signal.SIGTERM, handle_sig)
 
     port = int(os.getenv('PORT', 5053))
     upstream = os.getenv('UPSTREAM', '8.8.8.8')
     zone_file = Path(os.getenv('ZONE_FILE', './zones.txt'))
+    zone_reload = float(os.getenv('ZONE_RELOAD', 2))
+    # Response rate limit (responses/sec per client network/name, 0 = off)
+    rrl_rate = float(os.getenv('RRL_RATE', 0))
     resolver = Resolver(upstream, zone_file)
-    udp_server = DNSServer(resolver, port=port)
-    tcp_server = DNSServer(resolver, port=port, tcp=True)
+    app.config['DNS_RESOLVER'] = resolver
+    app.config['QUERY_SERVICE'] = QueryService(resolver)
+    # structured query log (json/binary) written by a background thread, 1 in LOG_SAMPLE queries
+    log_format = os.getenv('LOG_FORMAT')
+    dns_logger = None
+    if log_format:
+        log_file = os.getenv('LOG_FILE')
+        log_out = open(log_file, 'ab' if log_format == 'binary' else 'a') if log_file else None
+        dns_logger = StructuredLogger(out=log_out, format=log_format, sample=int(os.getenv('LOG_SAMPLE', 1)))
+    # raw packet capture (dnstap or pcapng), rotated at CAPTURE_MAX_BYTES
+    capture_file = os.getenv('CAPTURE_FILE')
+    if capture_file:
+        dns_logger = CaptureLogger(capture_file, format=os.getenv('CAPTURE_FORMAT', 'dnstap'),
+                                   max_bytes=int(os.getenv('CAPTURE_MAX_BYTES', 100 << 20)),
+                                   logger=dns_logger or DNSLogger())
+    udp_server = DNSServer(resolver, port=port, rrl=RateLimiter(rrl_rate) if rrl_rate > 0 else None,
+                           metrics=resolver.metrics, logger=dns_logger)
+    tcp_server = DNSServer(resolver, port=port, tcp=True, metrics=resolver.metrics, logger=dns_logger)
+    # DNS over TLS (enabled if certificate given, reloaded when the files change)
+    dot_cert = os.getenv('DOT_CERT')
+    dot_server = None
+    if dot_cert:
+        dot_port = int(os.getenv('DOT_PORT', 853))
+        dot_server = DNSServer(resolver, port=dot_port, certfile=dot_cert, keyfile=os.getenv('DOT_KEY'),
+                               metrics=resolver.metrics, logger=dns_logger)
 
     logger.info('starting DNS server on port %d, upstream DNS server "%s"', port, upstream)
     udp_server.start_thread()
     tcp_server.start_thread()
+    if dot_server:
+        logger.info('starting DNS over TLS server on port %d', dot_port)
+        dot_server.start_thread()
+    if zone_reload > 0:
+        ZoneWatcher(resolver, zone_reload).start()
     app.run(debug=True, use_reloader=False, host='127.0.0.1')
     # try:
     #     while udp_server.isAlive():
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+    A/AAAA address handling
+
+    Loads a generated zone of A/AAAA records (1M addresses by default -
+    half IPv4, half IPv6) and times per address:
+
+        zone_load           - RR.fromZone on the whole zone
+        rdata_a/rdata_aaaa  - A/AAAA rdata from text (as in a zone load)
+        pack_a/pack_aaaa    - rdata packed to a buffer
+        text_a/text_aaaa    - rdata formatted as text
+
+    each compared with a copy of the previous A/AAAA classes, which held
+    the address as a tuple of ints ('_reference' - for zone_load these
+    replace A/AAAA in RDMAP while the zone is parsed). Memory held per
+    rdata (tracemalloc) is reported as 'memory_<type>_bytes'
+
+        python benchmarks/bench_address.py [--number N]
+
+    Results are printed as JSON (best of 3 runs - single run for
+    zone_load - times in microseconds per address)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,sys,tracemalloc
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import RR,A,AAAA
+from dnslib.dns import RDMAP
+from dnslib.label import DNSBuffer
+
+from bench_codec import ReferenceA,ReferenceAAAA,REFERENCE_PACK
+from common import per_item
+
+NUMBER = 1000000
+
+def addresses(number):
+    """
+        Return (ipv4,ipv6) address lists (number/2 of each)
+    """
+    n = max(1,number // 2)
+    ipv4 = [ "10.%d.%d.%d" % (i >> 16 & 255,i >> 8 & 255,i & 255)
+                    for i in range(n) ]
+    ipv6 = [ "2001:db8::%x:%x" % (i >> 16,i & 0xffff) for i in range(n) ]
+    return ipv4,ipv6
+
+def memory(f,values):
+    # Memory (bytes) per rdata created by f
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    rdata = [ f(v) for v in values ]
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size / len(rdata)
+
+def run(number):
+    results = {}
+    ipv4,ipv6 = addresses(number)
+    zone = "\n".join([ "h%d.example.com. 300 A %s\nh%d.example.com. 300 AAAA %s"
+                            % (i,a,i,aaaa)
+                                for i,(a,aaaa) in enumerate(zip(ipv4,ipv6)) ])
+    count = len(ipv4) + len(ipv6)
+
+    results['zone_load'] = per_item(lambda: RR.fromZone(zone),count,1)
+    saved = RDMAP['A'],RDMAP['AAAA']
+    try:
+        RDMAP['A'],RDMAP['AAAA'] = ReferenceA,ReferenceAAAA
+        results['zone_load_reference'] = per_item(lambda: RR.fromZone(zone),
+                                                  count,1)
+    finally:
+        RDMAP['A'],RDMAP['AAAA'] = saved
+
+    for rtype,cls,ref,values in (('a',A,ReferenceA,ipv4),
+                                 ('aaaa',AAAA,ReferenceAAAA,ipv6)):
+        n = len(values)
+        results['rdata_' + rtype] = per_item(
+                    lambda: [ cls(v) for v in values ],n)
+        results['rdata_%s_reference' % rtype] = per_item(
+                    lambda: [ ref(v) for v in values ],n)
+        rdata = [ cls(v) for v in values ]
+        rdata_ref = [ ref(v) for v in values ]
+        def pack():
+            buffer = DNSBuffer()
+            for rd in rdata:
+                rd.pack(buffer)
+        def pack_reference(pack=REFERENCE_PACK[rtype.upper()]):
+            buffer = DNSBuffer()
+            for rd in rdata_ref:
+                pack(rd,buffer)
+        results['pack_' + rtype] = per_item(pack,n)
+        results['pack_%s_reference' % rtype] = per_item(pack_reference,n)
+        results['text_' + rtype] = per_item(
+                    lambda: [ repr(rd) for rd in rdata ],n)
+        results['text_%s_reference' % rtype] = per_item(
+                    lambda: [ repr(rd) for rd in rdata_ref ],n)
+        del rdata,rdata_ref
+        sample = values[:100000]
+        results['memory_%s_bytes' % rtype] = memory(cls,sample)
+        results['memory_%s_bytes_reference' % rtype] = memory(ref,sample)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="A/AAAA address benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Addresses in zone (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'address',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
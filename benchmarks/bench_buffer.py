@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+    dnslib.buffer.Buffer primitives
+
+    Compares Buffer with a reference copy of the previous implementation
+    (struct.calcsize/struct.unpack on a sliced bytearray copy for each
+    read, struct.pack for each write) to show the effect of cached
+    struct.Struct objects and in-place reads:
+
+        unpack          - 30 x unpack("!HHIH") (RR header)
+        get             - 30 x get(4)
+        pack            - 30 x pack("!HHIH") + append(4 bytes)
+
+        python benchmarks/bench_buffer.py [--number N]
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per 30 operations)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,struct,sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib.buffer import Buffer
+
+from common import timeit
+
+NUMBER = 10000
+
+class ReferenceBuffer(object):
+    # Previous Buffer implementation (for comparison)
+
+    def __init__(self,data=b''):
+        self.data = bytearray(data)
+        self.offset = 0
+
+    def remaining(self):
+        return len(self.data) - self.offset
+
+    def get(self,length):
+        if length > self.remaining():
+            raise ValueError("Not enough bytes")
+        start = self.offset
+        end = self.offset + length
+        self.offset += length
+        return bytes(self.data[start:end])
+
+    def pack(self,fmt,*args):
+        self.offset += struct.calcsize(fmt)
+        self.data += struct.pack(fmt,*args)
+
+    def append(self,s):
+        self.offset += len(s)
+        self.data += s
+
+    def unpack(self,fmt):
+        data = self.get(struct.calcsize(fmt))
+        return struct.unpack(fmt,data)
+
+def run(number):
+    results = {}
+    data = struct.pack("!HHIH",1,1,300,4) * 30
+    for name,cls in (('',Buffer),('_reference',ReferenceBuffer)):
+        def unpack(i):
+            b = cls(data)
+            for n in range(30):
+                b.unpack("!HHIH")
+        def get(i):
+            b = cls(data)
+            for n in range(30):
+                b.get(4)
+        def pack(i):
+            b = cls()
+            for n in range(30):
+                b.pack("!HHIH",1,1,300,4)
+                b.append(b"abcd")
+        results['unpack' + name] = timeit(unpack,number)
+        results['get' + name] = timeit(get,number)
+        results['pack' + name] = timeit(pack,number)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Buffer benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'buffer',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
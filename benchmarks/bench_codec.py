@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Wire format codec - DNSRecord.parse/pack and DNSBuffer.encode_name
+
+    Packets cover the common shapes seen by the server (plain/EDNS
+    queries, multi-RR answers, referrals with compression-heavy
+    NS/MX/glue, large TXT, negative SOA answers, a large mixed answer,
+    a root style referral with 39 RRs, an NSEC3 signed NXDOMAIN, an
+    HTTPS answer and 20 MX records) plus the
+    offline decode test corpus (dnslib/test - each RD type, EDNS and
+    compression edge cases), timed per packet. Name encoding is also
+    compared with a copy of the previous encoder ('_reference')
+
+    RR.parse/pack for single A/AAAA/MX/SOA/SRV records ('rr_parse_<type>',
+    'rr_pack_<type>') are compared with a copy of the previous
+    hand-written RDATA codecs and rtype->name->class dispatch
+    ('_reference')
+
+    DNSSEC/SVCB records (DS/NSEC/NSEC3/TLSA/HTTPS) are compared with the
+    previous opaque RD handling ('rr_parse_<type>_opaque')
+
+    Bimap lookups (QTYPE) used on the parse/resolve path are timed per
+    lookup - 'qtype_attr' (QTYPE.AAAA) against '_reference' (the
+    __getattr__ reverse lookup used previously), 'qtype_item'
+    (QTYPE[28]) and 'qtype_get' (QTYPE.get for known/unknown codes)
+
+        python benchmarks/bench_codec.py [--number N]
+
+    Also measures memory held per parsed RR (A/AAAA/MX/SOA records as
+    cached by a resolver), in bytes (tracemalloc)
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per operation)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,sys,tracemalloc
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import DNSRecord,DNSLabel,RR,RD,EDNS0,QTYPE,DNSError,\
+                   A,AAAA,MX,SOA,SRV
+from dnslib.bimap import BimapError
+from dnslib.buffer import BufferError
+from dnslib.dns import _parse_ipv6,_format_ipv6
+from dnslib.label import DNSBuffer
+from dnslib.ranges import IP4,IP6
+from dnslib.test_decode import load_corpus
+
+from common import timeit
+
+NUMBER = 2000
+
+def reply(qname,qtype,answers=(),auth=(),ar=()):
+    r = DNSRecord.question(qname,qtype).reply()
+    for section,rrs in ((r.add_answer,answers),(r.add_auth,auth),
+                        (r.add_ar,ar)):
+        for zone in rrs:
+            section(*RR.fromZone(zone))
+    return r
+
+def packets():
+    """
+        Return {name: DNSRecord} of representative packets
+    """
+    edns = DNSRecord.question("www.example.com")
+    edns.add_ar(EDNS0(udp_len=4096,flags="do"))
+    mixed = []
+    for i in range(10):
+        mixed += ["host%d.example.com. 300 A 10.0.0.%d" % (i,i),
+                  "host%d.example.com. 300 AAAA 2001:db8::%x" % (i,i),
+                  "host%d.example.com. 300 MX %d mx%d.example.com." % (i,i,i),
+                  "host%d.example.com. 300 TXT \"v=spf1 -all\"" % i,
+                  "host%d.example.com. 300 CNAME alias%d.example.com." % (i,i)]
+    return {
+        'query': DNSRecord.question("www.example.com"),
+        'query_edns': edns,
+        'a_8': reply("www.example.com","A",
+                     [ "www.example.com. 300 A 192.0.2.%d" % i
+                            for i in range(8) ]),
+        'aaaa_4': reply("www.example.com","AAAA",
+                        [ "www.example.com. 300 AAAA 2001:db8::%d" % i
+                                for i in range(4) ]),
+        'referral': reply("www.example.com","MX",
+                          [ "example.com. 300 MX %d mx%d.example.com." % (i,i)
+                                for i in range(3) ],
+                          [ "example.com. 300 NS ns%d.example.com." % i
+                                for i in range(4) ],
+                          [ "ns%d.example.com. 300 A 192.0.2.%d" % (i,i)
+                                for i in range(4) ]),
+        'txt_large': reply("example.com","TXT",
+                           [ "example.com. 300 TXT \"%s\"" % ("x" * 250)
+                                for i in range(4) ]),
+        'nxdomain_soa': reply("missing.example.com","A",(),
+                              ["example.com. 300 SOA ns1.example.com. "
+                               "admin.example.com. 2024010100 3600 600 "
+                               "86400 300"]),
+        'mixed_50': reply("example.com","ANY",mixed),
+        # Root style referral - 13 NS with A/AAAA glue
+        'referral_large': reply("www.example.com","A",(),
+                          [ "com. 172800 NS %s.gtld-servers.net." % c
+                                for c in "abcdefghijklm" ],
+                          [ "%s.gtld-servers.net. 172800 A 192.0.2.%d" % (c,i)
+                                for i,c in enumerate("abcdefghijklm") ] +
+                          [ "%s.gtld-servers.net. 172800 AAAA 2001:db8::%d" %
+                                (c,i) for i,c in enumerate("abcdefghijklm") ]),
+        # Signed negative answer (SOA/NSEC3/RRSIG) and HTTPS answer
+        'nxdomain_nsec3': reply("missing.example.com","A",(),
+                              ["example.com. 300 SOA ns1.example.com. "
+                               "admin.example.com. 2024010100 3600 600 "
+                               "86400 300"] +
+                              [ "%s.example.com. 300 NSEC3 1 0 10 AABBCCDD "
+                                "2T7B4G4VSA5SMI47K61MV5BV1A22BOJR A RRSIG" % h
+                                    for h in ("CK0POJMG874LJREF7EFN8430QVIT8BSM",
+                                              "2T7B4G4VSA5SMI47K61MV5BV1A22BOJR") ] +
+                              [ "example.com. 300 RRSIG NSEC3 8 2 300 "
+                                "20240201000000 20240101000000 12345 "
+                                "example.com. oJB1W6WNGv+ldvQ3WDG0MQkg5IEhjRip"
+                                "8WTrPYGv07h108dUKGMeDPKijVCHX3DDKdfb+v6oB9wfuh"
+                                "3DTJXUAfI=" ] * 2),
+        'https_2': reply("example.com","HTTPS",
+                         ["example.com. 300 HTTPS 1 . alpn=\"h2,h3\" "
+                          "ipv4hint=192.0.2.1 ipv6hint=2001:db8::1",
+                          "example.com. 300 HTTPS 2 svc.example.net. "
+                          "alpn=h2 port=8443"]),
+        'mx_20': reply("example.com","MX",
+                       [ "example.com. 300 MX %d mx%d.mail.example.com." %
+                                (i,i) for i in range(20) ]),
+    }
+
+def reference_encode_name(buffer,name):
+    # Previous DNSBuffer.encode_name (for comparison)
+    name = list(DNSLabel(name).label)
+    while name:
+        if tuple(name) in buffer.names:
+            pointer = buffer.names[tuple(name)]
+            buffer.pack("!H",pointer | 0xC000)
+            return
+        else:
+            buffer.names[tuple(name)] = buffer.offset
+            element = name.pop(0)
+            buffer.pack("!B",len(element))
+            buffer.append(element)
+    buffer.append(b'\x00')
+
+# Previous hand-written RD parse methods (for comparison)
+
+class ReferenceA(RD):
+    # Previous A (address held as tuple of ints)
+    __slots__ = ('_data',)
+    data = IP4('data')
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls(rd[0])
+    def __init__(self,data):
+        if type(data) in (tuple,list):
+            self.data = tuple(data)
+        else:
+            self.data = tuple(map(int,data.rstrip(".").split(".")))
+    def __repr__(self):
+        return "%d.%d.%d.%d" % self.data
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            a = cls.__new__(cls)
+            a._data = buffer.unpack("!BBBB")
+            return a
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking A [offset=%d]: %s" %
+                                (buffer.offset,e))
+
+class ReferenceAAAA(RD):
+    # Previous AAAA (address held as tuple of ints)
+    __slots__ = ('_data',)
+    data = IP6('data')
+    @classmethod
+    def fromZone(cls,rd,origin=None):
+        return cls(rd[0])
+    def __init__(self,data):
+        if type(data) in (tuple,list):
+            self.data = tuple(data)
+        else:
+            self.data = _parse_ipv6(data)
+    def __repr__(self):
+        return _format_ipv6(self.data)
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            aaaa = cls.__new__(cls)
+            aaaa._data = buffer.unpack("!16B")
+            return aaaa
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking AAAA [offset=%d]: %s" %
+                                (buffer.offset,e))
+
+class ReferenceMX(MX):
+    __slots__ = ()
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            mx = cls.__new__(cls)
+            (mx._preference,) = buffer.unpack("!H")
+            mx._label = buffer.decode_name()
+            return mx
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking MX [offset=%d]: %s" %
+                                (buffer.offset,e))
+
+class ReferenceSOA(SOA):
+    __slots__ = ()
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            soa = cls.__new__(cls)
+            soa._mname = buffer.decode_name()
+            soa._rname = buffer.decode_name()
+            soa._times = buffer.unpack("!IIIII")
+            return soa
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking SOA [offset=%d]: %s" %
+                                (buffer.offset,e))
+
+class ReferenceSRV(SRV):
+    __slots__ = ()
+    @classmethod
+    def parse(cls,buffer,length):
+        try:
+            srv = cls.__new__(cls)
+            srv._priority,srv._weight,srv._port = buffer.unpack("!HHH")
+            srv._target = buffer.decode_name()
+            return srv
+        except (BufferError,BimapError) as e:
+            raise DNSError("Error unpacking SRV [offset=%d]: %s" %
+                                (buffer.offset,e))
+
+REFERENCE_RDMAP = { 'A':ReferenceA, 'AAAA':ReferenceAAAA, 'MX':ReferenceMX,
+                    'SOA':ReferenceSOA, 'SRV':ReferenceSRV }
+
+REFERENCE_PACK = {
+    'A': lambda rd,buffer: buffer.pack("!BBBB",*rd.data),
+    'AAAA': lambda rd,buffer: buffer.pack("!16B",*rd.data),
+    'MX': lambda rd,buffer: (buffer.pack("!H",rd.preference),
+                             buffer.encode_name(rd.label)),
+    'SOA': lambda rd,buffer: (buffer.encode_name(rd.mname),
+                              buffer.encode_name(rd.rname),
+                              buffer.pack("!IIIII",*rd.times)),
+    'SRV': lambda rd,buffer: (buffer.pack("!HHH",rd.priority,rd.weight,
+                                          rd.port),
+                              buffer.encode_name(rd.target)),
+}
+
+def reference_rr_parse(buffer):
+    # Previous RR.parse and RD parse methods (for comparison)
+    try:
+        rname = buffer.decode_name()
+        rtype,rclass,ttl,rdlength = buffer.unpack("!HHIH")
+        if rtype == QTYPE.OPT:
+            raise ValueError("OPT not supported")
+        if rdlength:
+            rdata = REFERENCE_RDMAP.get(QTYPE.get(rtype),RD).parse(buffer,
+                                                                   rdlength)
+        else:
+            rdata = ''
+        rr = RR.__new__(RR)
+        rr._rname = rname
+        rr._rtype = rtype
+        rr._rclass = rclass
+        rr._ttl = ttl
+        rr.rdata = rdata
+        return rr
+    except (BufferError,BimapError) as e:
+        raise DNSError("Error unpacking RR [offset=%d]: %s" % (
+                            buffer.offset,e))
+
+def reference_rr_pack(rr,buffer):
+    # Previous RR.pack/RD pack methods (for comparison)
+    buffer.encode_name(rr.rname)
+    buffer.pack("!HHI",rr.rtype,rr.rclass,rr.ttl)
+    rdlength_ptr = buffer.offset
+    buffer.pack("!H",0)
+    start = buffer.offset
+    REFERENCE_PACK[QTYPE.get(rr.rtype)](rr.rdata,buffer)
+    buffer.update(rdlength_ptr,"!H",buffer.offset-start)
+
+def rr_memory(zone,count=1000):
+    """
+        Memory (bytes) per RR parsed from packet (names are distinct so
+        labels aren't shared)
+    """
+    packets = []
+    for i in range(count):
+        r = DNSRecord.question("host%d.example.com" % i).reply()
+        r.add_answer(*RR.fromZone(zone % i))
+        packets.append(r.pack())
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    rrs = [ DNSRecord.parse(p).rr[0] for p in packets ]
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size / len(rrs)
+
+def run(number):
+    results = {}
+    for name,record in packets().items():
+        data = record.pack()
+        results['parse_' + name] = timeit(lambda i: DNSRecord.parse(data),
+                                          number)
+        results['pack_' + name] = timeit(lambda i: record.pack(),number)
+
+    corpus = [ d for name,qdata,rdata in load_corpus() for d in (qdata,rdata) ]
+    records = [ DNSRecord.parse(d) for d in corpus ]
+    results['parse_corpus'] = timeit(
+                    lambda i: [ DNSRecord.parse(d) for d in corpus ],
+                    max(1,number // 10)) / len(corpus)
+    results['pack_corpus'] = timeit(
+                    lambda i: [ r.pack() for r in records ],
+                    max(1,number // 10)) / len(records)
+
+    # 20 names sharing suffixes (compressed against each other)
+    names = [ DNSLabel("host%d.zone%d.example.com" % (i,i % 4))
+                    for i in range(20) ]
+    def encode(i):
+        buffer = DNSBuffer()
+        for name in names:
+            buffer.encode_name(name)
+    def encode_reference(i):
+        buffer = DNSBuffer()
+        for name in names:
+            reference_encode_name(buffer,name)
+    def encode_nocompress(i):
+        buffer = DNSBuffer()
+        for name in names:
+            buffer.encode_name_nocompress(name)
+    results['encode_name_20'] = timeit(encode,number)
+    results['encode_name_20_reference'] = timeit(encode_reference,number)
+    results['encode_name_nocompress_20'] = timeit(encode_nocompress,number)
+
+    for rtype,zone in (('a',"host.example.com. 300 A 10.0.0.1"),
+                       ('aaaa',"host.example.com. 300 AAAA 2001:db8::1"),
+                       ('mx',"example.com. 300 MX 10 mail.example.com."),
+                       ('soa',"example.com. 300 SOA ns1.example.com. "
+                              "admin.example.com. 1 3600 600 86400 300"),
+                       ('srv',"_sip._tcp.example.com. 300 SRV 10 60 5060 "
+                              "sip.example.com.")):
+        rr = RR.fromZone(zone)[0]
+        buffer = DNSBuffer()
+        rr.pack(buffer)
+        data = bytes(buffer.data)
+        n = number * 10
+        results['rr_parse_' + rtype] = timeit(
+                    lambda i: RR.parse(DNSBuffer(data)),n)
+        results['rr_parse_%s_reference' % rtype] = timeit(
+                    lambda i: reference_rr_parse(DNSBuffer(data)),n)
+        results['rr_pack_' + rtype] = timeit(
+                    lambda i: rr.pack(DNSBuffer()),n)
+        ref = reference_rr_parse(DNSBuffer(data))
+        results['rr_pack_%s_reference' % rtype] = timeit(
+                    lambda i: reference_rr_pack(ref,DNSBuffer()),n)
+
+    # DNSSEC/SVCB types (previously decoded as opaque RD - '_opaque')
+    for rtype,zone in (('ds',"example.com. 300 DS 60485 8 2 D4B7D520E7BB5F0F"
+                             "67674A0CCEB1E3E0614B93C4F9E99B8383F6A1E4469DA50A"),
+                       ('nsec',"example.com. 300 NSEC www.example.com. "
+                               "A NS SOA MX AAAA RRSIG NSEC DNSKEY"),
+                       ('nsec3',"example.com. 300 NSEC3 1 0 10 AABBCCDD "
+                                "2T7B4G4VSA5SMI47K61MV5BV1A22BOJR A RRSIG"),
+                       ('tlsa',"_443._tcp.example.com. 300 TLSA 3 1 1 "
+                               "0C72AC70B745AC19998811B131D662C9"
+                               "AC69DBDBE7CB23E5B514B56664C5D3D6"),
+                       ('https',"example.com. 300 HTTPS 1 . alpn=\"h2,h3\" "
+                                "ipv4hint=192.0.2.1 ipv6hint=2001:db8::1")):
+        rr = RR.fromZone(zone)[0]
+        buffer = DNSBuffer()
+        rr.pack(buffer)
+        data = bytes(buffer.data)
+        opaque = reference_rr_parse(DNSBuffer(data))
+        n = number * 10
+        results['rr_parse_' + rtype] = timeit(
+                    lambda i: RR.parse(DNSBuffer(data)),n)
+        results['rr_parse_%s_opaque' % rtype] = timeit(
+                    lambda i: reference_rr_parse(DNSBuffer(data)),n)
+        results['rr_pack_' + rtype] = timeit(
+                    lambda i: rr.pack(DNSBuffer()),n)
+        results['rr_pack_%s_opaque' % rtype] = timeit(
+                    lambda i: opaque.pack(DNSBuffer()),n)
+
+    n = number * 100
+    results['qtype_attr'] = timeit(lambda i: QTYPE.AAAA,n)
+    results['qtype_attr_reference'] = timeit(
+                    lambda i: QTYPE.__getattr__('AAAA'),n)
+    results['qtype_item'] = timeit(lambda i: QTYPE[28],n)
+    results['qtype_get'] = timeit(lambda i: QTYPE.get(28),n)
+    results['qtype_get_unknown'] = timeit(lambda i: QTYPE.get(999),n)
+
+    for rtype,zone in (('a',"host%d.example.com. 300 A 10.0.0.1"),
+                       ('aaaa',"host%d.example.com. 300 AAAA 2001:db8::1"),
+                       ('mx',"host%d.example.com. 300 MX 10 mail.example.com."),
+                       ('soa',"host%d.example.com. 300 SOA ns1.example.com. "
+                              "admin.example.com. 1 3600 600 86400 300")):
+        results['memory_rr_%s_bytes' % rtype] = rr_memory(zone)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Codec benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'codec',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
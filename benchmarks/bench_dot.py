@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+    DNS over TLS connection/query cost
+
+    Starts a local TLSServer and measures (per query):
+
+        full_handshake      - new connection, full TLS handshake + query
+        resumed_handshake   - new connection resuming the previous TLS
+                              session (abbreviated handshake) + query
+        reused_connection   - query on an existing TLS connection
+        plain_tcp           - query on an existing TCP connection (for
+                              comparison)
+
+        python benchmarks/bench_dot.py [--number N] [--cert F --key F]
+
+    A self-signed certificate is generated with the openssl command if
+    --cert isn't given. Results are printed as JSON (best of 5 runs,
+    times in microseconds per query)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,shutil,socket,ssl,struct,subprocess,sys,tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import DNSRecord,RR
+from dnslib.server import DNSServer,DNSLogger,BaseResolver
+
+from common import timeit
+
+ANSWER = RR.fromZone("abc.com. 60 A 1.2.3.4")
+
+class Resolver(BaseResolver):
+    def resolve(self,request,handler):
+        reply = request.reply()
+        reply.add_answer(*ANSWER)
+        return reply
+
+def mkcert(d):
+    cert,key = os.path.join(d,"cert.pem"),os.path.join(d,"key.pem")
+    subprocess.check_call(["openssl","req","-x509","-newkey","rsa:2048",
+                           "-nodes","-days","1","-subj","/CN=localhost",
+                           "-keyout",key,"-out",cert],
+                          stderr=subprocess.DEVNULL)
+    return cert,key
+
+def query(sock,data):
+    sock.sendall(struct.pack("!H",len(data)) + data)
+    header = b''
+    while len(header) < 2:
+        header += sock.recv(2 - len(header))
+    length = struct.unpack("!H",header)[0]
+    reply = b''
+    while len(reply) < length:
+        reply += sock.recv(length - len(reply))
+    return reply
+
+def run(number,cert,key,tls_port,tcp_port):
+    results = {}
+    data = DNSRecord.question("abc.com").pack()
+    logger = DNSLogger("error")
+    tls = DNSServer(Resolver(),port=tls_port,address="localhost",
+                    logger=logger,certfile=cert,keyfile=key)
+    tcp = DNSServer(Resolver(),port=tcp_port,address="localhost",
+                    logger=logger,tcp=True)
+    tls.start_thread()
+    tcp.start_thread()
+    ctx = ssl.create_default_context(cafile=cert)
+    ctx.check_hostname = False
+    try:
+        def connect(session=None):
+            sock = socket.create_connection(("localhost",tls_port),timeout=5)
+            return ctx.wrap_socket(sock,session=session)
+
+        def full(i):
+            with connect() as s:
+                query(s,data)
+        results['full_handshake'] = timeit(full,number)
+
+        # TLS1.3 tickets are sent after the handshake so take session
+        # once a query has completed
+        with connect() as s:
+            query(s,data)
+            session = s.session
+        def resumed(i):
+            with connect(session) as s:
+                query(s,data)
+                if not s.session_reused:
+                    raise ValueError("Session not resumed")
+        results['resumed_handshake'] = timeit(resumed,number)
+
+        with connect() as s:
+            results['reused_connection'] = timeit(lambda i: query(s,data),
+                                                  number)
+        with socket.create_connection(("localhost",tcp_port),timeout=5) as s:
+            results['plain_tcp'] = timeit(lambda i: query(s,data),number)
+    finally:
+        tls.stop()
+        tcp.stop()
+        tls.server.server_close()
+        tcp.server.server_close()
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="DNS over TLS benchmark")
+    p.add_argument("--number","-n",type=int,default=200,
+                    help="Iterations per run (default: 200)")
+    p.add_argument("--cert",help="Certificate (default: self-signed)")
+    p.add_argument("--key",help="Private key")
+    p.add_argument("--port",type=int,default=8853,
+                    help="TLS port (TCP uses port+1, default: 8853)")
+    args = p.parse_args()
+    d = None
+    if args.cert:
+        cert,key = args.cert,args.key
+    else:
+        d = tempfile.mkdtemp()
+        cert,key = mkcert(d)
+    try:
+        results = run(args.number,cert,key,args.port,args.port+1)
+    finally:
+        if d:
+            shutil.rmtree(d)
+    print(json.dumps({'benchmark':'dot',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':results},indent=2))
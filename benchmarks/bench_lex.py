@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Zone/DiG tokenising (dnslib.lex.WordLexer)
+
+    Generates a synthetic zone file ($ORIGIN/$TTL, multi-line SOA,
+    A/AAAA/MX/CNAME/TXT records with quoted strings, comments, blank lines
+    and records continuing the previous owner) and times:
+
+        lex_zone        - WordLexer tokens for the zone file (as set up
+                          by ZoneParser)
+        zone_parse      - ZoneParser (RR objects) for the zone file
+        dig_parse       - DigParser on the DiG test files (dnslib/test/dig)
+                          repeated to the same size
+
+    per record (per RR for dig_parse), each compared with the previous
+    char-at-a-time lexer ('_reference' - the lexXXX state methods, which
+    are still used by subclasses overriding them). Token streams are
+    checked to be identical first. Throughput for the zone file is also
+    given in MB/s ('lex_zone_mbps' etc.)
+
+        python benchmarks/bench_lex.py [--number N]
+
+    Results are printed as JSON (best of 3 runs - single run for the
+    '_reference' cases - times in microseconds)
+"""
+
+from __future__ import print_function
+
+import argparse,glob,json,os,sys,tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+import dnslib.digparser
+import dnslib.dns
+from dnslib.digparser import DigParser
+from dnslib.dns import ZoneParser
+from dnslib.lex import Lexer,WordLexer
+
+from common import best_of
+
+NUMBER = 100000
+
+class ReferenceWordLexer(WordLexer):
+    # Previous char-at-a-time lexer (state methods)
+    def parse(self):
+        return Lexer.parse(self)
+
+def make_zone(records):
+    """
+        Synthetic zone file - returns (text,number of records)
+    """
+    lines = ["$ORIGIN example.com.",
+             "$TTL 3600",
+             "; synthetic zone",
+             "@ IN SOA ns1.example.com. hostmaster.example.com. (",
+             "        2024010100 ; serial",
+             "        3600       ; refresh",
+             "        600        ; retry",
+             "        86400      ; expire",
+             "        300 )      ; minimum",
+             ""]
+    count = 1
+    for i in range(records - 1):
+        n = i % 10
+        if n == 0:
+            lines.append("")
+            lines.append("; host %d" % i)
+            lines.append("host%d 300 IN A 10.%d.%d.%d" % (i,i >> 16 & 255,
+                                                       i >> 8 & 255,i & 255))
+        elif n in (1,2):
+            lines.append("        300 IN AAAA 2001:db8::%x:%x" % (i >> 16,
+                                                                 i & 0xffff))
+        elif n == 3:
+            lines.append("host%d 300 IN MX 10 mail%d.example.net." % (i,i))
+        elif n == 4:
+            lines.append('host%d 300 IN TXT "v=spf1 ip4:10.0.0.%d -all" '
+                         '"id=%d"' % (i,i & 255,i))
+        elif n == 5:
+            lines.append("www%d IN CNAME host%d ; alias" % (i,i - 5))
+        else:
+            lines.append("host%d IN A 192.0.%d.%d" % (i,i >> 8 & 255,i & 255))
+        count += 1
+    return "\n".join(lines) + "\n",count
+
+def make_dig(size):
+    """
+        DiG output (test files repeated) - returns (text,number of RRs)
+    """
+    d = os.path.join(os.path.dirname(dnslib.digparser.__file__),"test","dig")
+    text = ""
+    for path in sorted(glob.glob(os.path.join(d,"*.dig"))):
+        with open(path) as f:
+            text += f.read()
+    text = text * max(1,size // len(text))
+    count = sum([ len(r.rr) for r in DigParser(text) ])
+    return text,count
+
+def zone_lexer(cls,f):
+    l = cls(f)
+    l.commentchars = ';'
+    l.nltok = ('NL',None)
+    l.spacetok = ('SPACE',None)
+    return l
+
+def run(number):
+    results = {}
+    zone,count = make_zone(number)
+    dig,rrs = make_dig(len(zone) // 10)
+    mb = len(zone.encode()) / 1e6
+    d = tempfile.mkdtemp()
+    path = os.path.join(d,"zone.txt")
+    try:
+        with open(path,"w") as f:
+            f.write(zone)
+
+        def lex(cls):
+            with open(path) as f:
+                return list(zone_lexer(cls,f))
+        if lex(WordLexer) != lex(ReferenceWordLexer):
+            raise ValueError("Token streams differ")
+        t = best_of(lambda: lex(WordLexer))
+        results['lex_zone'] = t / count * 1e6
+        results['lex_zone_mbps'] = mb / t
+
+        def zone_parse():
+            with open(path) as f:
+                return list(ZoneParser(f))
+        t = best_of(zone_parse)
+        results['zone_parse'] = t / count * 1e6
+        results['zone_parse_mbps'] = mb / t
+        dig_parse = lambda: list(DigParser(dig))
+        results['dig_parse'] = best_of(dig_parse) / rrs * 1e6
+
+        # Previous lexer - swapped into dnslib.dns/dnslib.digparser
+        t = best_of(lambda: lex(ReferenceWordLexer),1)
+        results['lex_zone_reference'] = t / count * 1e6
+        results['lex_zone_reference_mbps'] = mb / t
+        try:
+            dnslib.dns.WordLexer = ReferenceWordLexer
+            dnslib.digparser.WordLexer = ReferenceWordLexer
+            t = best_of(zone_parse,1)
+            results['zone_parse_reference'] = t / count * 1e6
+            results['zone_parse_reference_mbps'] = mb / t
+            results['dig_parse_reference'] = best_of(dig_parse,1) / rrs * 1e6
+        finally:
+            dnslib.dns.WordLexer = WordLexer
+            dnslib.digparser.WordLexer = WordLexer
+    finally:
+        os.unlink(path)
+        os.rmdir(d)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Lexer benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Zone records (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'lex',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+    DNSLogger per-query overhead (in the handler thread)
+
+    Measures log_request + log_reply for the default DNSLogger (writing
+    to /dev/null), StructuredLogger (JSON/binary, with and without
+    sampling) and with the hooks disabled. For StructuredLogger the
+    cost in the handler thread and in the writer thread ('_writer')
+    are measured separately.
+
+        python benchmarks/bench_logger.py [--number N]
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per query)
+"""
+
+from __future__ import print_function
+
+import argparse,contextlib,json,os,sys,time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import DNSRecord,RR
+from dnslib.server import DNSLogger
+from dnslib.structlogger import StructuredLogger
+
+from common import timeit
+
+class Resolver:
+    pass
+
+class Server:
+    resolver = Resolver()
+
+class Handler:
+    client_address = ('192.0.2.1',12345)
+    protocol = 'udp'
+    server = Server()
+
+NUMBER = 10000
+
+def run(number):
+    results = {}
+    request = DNSRecord.question("abc.com")
+    reply = request.reply()
+    reply.add_answer(*RR.fromZone("abc.com. 60 A 1.2.3.4"))
+    reply.add_answer(*RR.fromZone("abc.com. 60 A 5.6.7.8"))
+    handler = Handler()
+
+    def log(logger,i):
+        request.header.id = reply.header.id = i & 0xffff
+        logger.log_request(handler,request)
+        logger.log_reply(handler,reply)
+
+    def bench(logger):
+        return timeit(lambda i: log(logger,i),number)
+
+    with open(os.devnull,"w") as null, contextlib.redirect_stdout(null):
+        results['dnslogger'] = bench(DNSLogger())
+    results['dnslogger_disabled'] = bench(DNSLogger("-request,-reply"))
+
+    # Writer is paused while timing the handler (so this is the cost in
+    # the handler thread) and the writer cost is then timed separately
+    for name,args in (('structured_json',{}),
+                      ('structured_binary',{'format':'binary'}),
+                      ('structured_sample_10',{'sample':10})):
+        with open(os.devnull,"wb" if args.get('format') else "w") as out:
+            logger = StructuredLogger(out=out,size=number*2,interval=3600,
+                                      **args)
+            results[name] = bench(logger)
+            logger.flush()
+            for i in range(number):
+                log(logger,i)
+            start = time.perf_counter()
+            logger.flush()
+            results[name + '_writer'] = \
+                    (time.perf_counter() - start) / number * 1e6
+            logger.close()
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="DNSLogger benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'logger',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Response Rate Limiting per-packet overhead
+
+    Measures RateLimiter.check/account and the DNSHandler UDP request
+    path (parse/resolve/pack) with and without RRL, plus the cost of a
+    query which is rate limited (dropped before reaching the resolver)
+
+        python benchmarks/bench_rrl.py [--number N]
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per packet)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import DNSRecord,RR,RCODE
+from dnslib.server import DNSHandler,BaseResolver
+from dnslib.rrl import RateLimiter,ALLOW
+
+from common import timeit
+
+NUMBER = 10000
+
+ANSWER = RR.fromZone("abc.com. 60 A 1.2.3.4")
+
+class Resolver(BaseResolver):
+    def resolve(self,request,handler):
+        reply = request.reply()
+        reply.add_answer(*ANSWER)
+        return reply
+
+class Logger:
+    def __getattr__(self,name):
+        return lambda *args: None
+
+class Server:
+    resolver = Resolver()
+    logger = Logger()
+    rrl = None
+    metrics = None
+
+def handler(rrl,address="192.0.2.1"):
+    # Bypass BaseRequestHandler.__init__ (which handles the request)
+    h = DNSHandler.__new__(DNSHandler)
+    h.server = Server()
+    h.server.rrl = rrl
+    h.protocol = 'udp'
+    h.client_address = (address,12345)
+    return h
+
+def run(number):
+    results = {}
+    data = DNSRecord.question("abc.com").pack()
+    qname = DNSRecord.parse(data).q.qname
+    addresses = [ "10.%d.%d.1" % (i//256%256,i%256) for i in range(65536) ]
+
+    rrl = RateLimiter(rate=1e9)
+    def check_same(i):
+        action,slot = rrl.check("192.0.2.1",qname)
+        rrl.account(slot,RCODE.NOERROR)
+    results['check_account_same_client'] = timeit(check_same,number)
+
+    rrl = RateLimiter(rate=1e9)
+    def check_many(i):
+        action,slot = rrl.check(addresses[i % 65536],qname)
+        rrl.account(slot,RCODE.NOERROR)
+    results['check_account_many_clients'] = timeit(check_many,number)
+
+    h = handler(None)
+    results['request_no_rrl'] = timeit(lambda i: list(h.get_replies(data)),
+                                       number)
+    h = handler(RateLimiter(rate=1e9))
+    results['request_rrl_allowed'] = timeit(lambda i: list(h.get_replies(data)),
+                                            number)
+    h = handler(RateLimiter(rate=1e-9,slip=0))
+    results['request_rrl_dropped'] = timeit(lambda i: list(h.get_replies(data)),
+                                            number)
+    results['rrl_overhead_percent'] = 100.0 * (
+                        results['request_rrl_allowed'] / 
+                        results['request_no_rrl'] - 1)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="RRL benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'rrl',
+                      'number':args.number,
+                      'unit':'us',
+                      'results':run(args.number)},indent=2))
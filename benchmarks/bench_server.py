@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+    End-to-end server throughput
+
+    Starts UDP and TCP DNSServer instances with app.Resolver (zone of
+    'records' names, proxying to a stand-in upstream on localhost) and
+    drives them with dnslib.loadgen (closed loop, 'concurrency' queries
+    outstanding) for zone answers and proxied queries. TCP queries are
+    pipelined over 4 connections.
+
+        python benchmarks/bench_server.py [--number N] [--records N]
+
+    Results are printed as JSON (qps and p50/p99 latency in microseconds
+    for each case)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,random,sys,tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib import DNSRecord
+from dnslib.server import DNSServer,DNSLogger
+from dnslib.loadgen import run as loadgen
+
+from bench_zone import start_upstream,stop_upstream,make_resolver
+
+NUMBER = 5000
+RECORDS = 10000
+PORT = 8154
+
+def run(number,records=RECORDS,concurrency=50):
+    results = {}
+    fd,path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    upstream = start_upstream()
+    servers = []
+    try:
+        resolver = make_resolver(records,path)
+        for tcp in (False,True):
+            server = DNSServer(resolver,port=PORT,address="127.0.0.1",
+                               tcp=tcp,logger=DNSLogger("error"))
+            server.start_thread()
+            servers.append(server)
+        rnd = random.Random(1)
+        for name,fmt in (('zone','host%d.example.com'),
+                         ('proxied','host%d.example.org')):
+            queries = [ (None,DNSRecord.question(fmt % rnd.randrange(records))
+                                                                    .pack())
+                            for i in range(1000) ]
+            for protocol in ('udp','tcp'):
+                r = loadgen(queries,"127.0.0.1",PORT,count=number,
+                            concurrency=concurrency,tcp=protocol == 'tcp',
+                            connections=4,timeout=5)
+                key = "%s_%s" % (protocol,name)
+                results[key + '_qps'] = r['qps']
+                results[key + '_p50_us'] = r['latency_us']['p50']
+                results[key + '_p99_us'] = r['latency_us']['p99']
+                results[key + '_lost'] = r['lost']
+    finally:
+        for server in servers:
+            server.stop()
+            server.server.server_close()
+        stop_upstream(upstream)
+        os.remove(path)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Server benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Queries per case (default: %d)" % NUMBER)
+    p.add_argument("--records",type=int,default=RECORDS,
+                    help="Zone records (default: %d)" % RECORDS)
+    p.add_argument("--concurrency","-c",type=int,default=50,
+                    help="Outstanding queries (default: 50)")
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'server',
+                      'number':args.number,
+                      'records':args.records,
+                      'results':run(args.number,args.records,
+                                    args.concurrency)},indent=2))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Web (index page) query overhead
+
+    Times a recursive-mode query from the index page for a name in the
+    zone (app.Resolver with 'records' names):
+
+        recursive_service   - app.QueryService with the server's resolver
+                              (resolved in-process)
+        recursive_loopback  - app.QueryService without a resolver (sent to
+                              a DNSServer on localhost)
+        recursive_reference - copy of the previous index handler (builds a
+                              QTYPE Bimap and sends to the local server for
+                              each request)
+        request_recursive   - full Flask request (GET /?site=..&type=A)
+                              through the test client, including template
+                              rendering
+
+        python benchmarks/bench_web.py [--number N] [--records N]
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per request)
+"""
+
+from __future__ import print_function
+
+import argparse,json,os,random,re,shutil,sys,tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from dnslib.dns import DNSRecord,DNSQuestion
+from dnslib.server import DNSServer,DNSLogger
+
+from bench_zone import start_upstream,stop_upstream,make_resolver
+from common import timeit
+
+NUMBER = 1000
+RECORDS = 10000
+PORT = 8155
+
+def reference_recursive(query_domain,query_type,port,history):
+    # Previous index() recursive-mode handler (for comparison)
+    from dnslib.bimap import Bimap
+    from app import DNSError
+    address = '127.0.0.1'
+    QTYPE = Bimap('QTYPE',
+                  {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX',
+                   16: 'TXT', 17: 'RP', 18: 'AFSDB', 24: 'SIG', 25: 'KEY', 28: 'AAAA',
+                   29: 'LOC', 33: 'SRV', 35: 'NAPTR', 36: 'KX', 37: 'CERT', 38: 'A6',
+                   39: 'DNAME', 41: 'OPT', 42: 'APL', 43: 'DS', 44: 'SSHFP',
+                   45: 'IPSECKEY', 46: 'RRSIG', 47: 'NSEC', 48: 'DNSKEY', 49: 'DHCID',
+                   50: 'NSEC3', 51: 'NSEC3PARAM', 52: 'TLSA', 55: 'HIP', 99: 'SPF',
+                   249: 'TKEY', 250: 'TSIG', 251: 'IXFR', 252: 'AXFR', 255: 'ANY',
+                   257: 'CAA', 32768: 'TA', 32769: 'DLV'},
+                  DNSError)
+    q = DNSRecord(q=DNSQuestion(query_domain, getattr(QTYPE, query_type)))
+    a_pkt = q.send(address, port, tcp=False)
+    a = DNSRecord.parse(a_pkt)
+    if a.header.tc:
+        a_pkt = q.send(address, port, tcp=True)
+        a = DNSRecord.parse(a_pkt)
+    out = str(a)
+    pattern = re.compile(r";; ANSWER SECTION:\n(.*)", re.DOTALL)
+    out = pattern.findall(out)
+    if out:
+        lines = out[0].splitlines()
+        for line in lines:
+            print(line, file=open(history, 'a+'))
+        return lines
+    return ['No answer section']
+
+def run(number,records=RECORDS):
+    import app
+    results = {}
+    d = tempfile.mkdtemp()
+    upstream = start_upstream()
+    server = None
+    try:
+        resolver = make_resolver(records,os.path.join(d,"zones.txt"))
+        server = DNSServer(resolver,port=PORT,address="127.0.0.1",
+                           logger=DNSLogger("error"))
+        server.start_thread()
+        rnd = random.Random(1)
+        names = [ "host%d.example.com" % rnd.randrange(records)
+                        for i in range(1000) ]
+        service = app.QueryService(resolver,history_dir=d)
+        loopback = app.QueryService(port=PORT,history_dir=d)
+        history = os.path.join(d,"recur.txt")
+        results['recursive_service'] = timeit(
+                lambda i: service.recursive(names[i % 1000],'A'),number)
+        results['recursive_loopback'] = timeit(
+                lambda i: loopback.recursive(names[i % 1000],'A'),number)
+        results['recursive_reference'] = timeit(
+                lambda i: reference_recursive(names[i % 1000],'A',PORT,
+                                              history),number)
+        app.app.config['QUERY_SERVICE'] = service
+        client = app.app.test_client()
+        results['request_recursive'] = timeit(
+                lambda i: client.get('/',query_string={'site':names[i % 1000],
+                                                       'type':'A',
+                                                       'mode':'recur'}),
+                number)
+    finally:
+        if server:
+            server.stop()
+            server.server.server_close()
+        stop_upstream(upstream)
+        shutil.rmtree(d)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Web query benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    p.add_argument("--records",type=int,default=RECORDS,
+                    help="Zone records (default: %d)" % RECORDS)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'web',
+                      'number':args.number,
+                      'records':args.records,
+                      'unit':'us',
+                      'results':run(args.number,args.records)},indent=2))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Zone parsing and resolution
+
+    Measures ZoneParser (per record) on a generated zone and
+    app.Resolver.resolve on a large zone for each resolution path:
+
+        zone_hit        - name in zone
+        zone_miss_soa   - name below a zone apex (answered with SOA)
+        proxied         - forwarded to upstream
+        proxied_nxdomain- forwarded (MX), upstream NXDOMAIN (the resolver
+                          then scans the zone for 'spoof' MX records)
+
+    dnslib.zoneresolver.ZoneResolver.resolve is also timed on the
+    generated zone (zoneresolver_hit - A query, zoneresolver_mx - MX
+    query with glue in the additional section, zoneresolver_miss -
+    NXDOMAIN)
+
+    The upstream is a stand-in DNSServer on localhost (so proxied times
+    are the resolver's overhead plus a local round trip, not internet
+    latency)
+
+        python benchmarks/bench_zone.py [--number N] [--records N]
+
+    Results are printed as JSON (best of 5 runs, times in microseconds
+    per record/query)
+"""
+
+from __future__ import print_function
+
+import argparse,json,logging,os,random,sys,tempfile,time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from pathlib import Path
+
+from dnslib import DNSRecord,RR,RCODE,A
+from dnslib.dns import ZoneParser
+from dnslib.server import DNSServer,DNSLogger,BaseResolver
+from dnslib.zoneresolver import ZoneResolver
+
+from common import timeit
+
+NUMBER = 2000
+RECORDS = 100000
+UPSTREAM_PORT = 8153
+
+class UpstreamResolver(BaseResolver):
+    """
+        Stand-in upstream - fixed A record, NXDOMAIN for names under
+        'nx.example.org'
+    """
+    def resolve(self,request,handler):
+        reply = request.reply()
+        if request.q.qname.matchSuffix("nx.example.org"):
+            reply.header.rcode = RCODE.NXDOMAIN
+        else:
+            reply.add_answer(RR(request.q.qname,ttl=60,
+                                rdata=A("192.0.2.1")))
+        return reply
+
+def start_upstream(port=UPSTREAM_PORT):
+    """
+        Start stand-in upstream (UDP/TCP) - returns list of servers
+    """
+    servers = [ DNSServer(UpstreamResolver(),port=port,address="127.0.0.1",
+                          tcp=tcp,logger=DNSLogger("error"))
+                    for tcp in (False,True) ]
+    for s in servers:
+        s.start_thread()
+    return servers
+
+def stop_upstream(servers):
+    for s in servers:
+        s.stop()
+        s.server.server_close()
+
+def zone_text(records):
+    """
+        Zone in master file format (for ZoneParser)
+    """
+    lines = ["$ORIGIN example.com.","$TTL 300",
+             "@ SOA ns1 admin 2024010100 3600 600 86400 300",
+             "@ NS ns1","@ MX 10 mail","mail A 10.255.0.1"]
+    for i in range(records):
+        lines.append("host%d A 10.%d.%d.%d" % (i,i >> 16 & 255,
+                                               i >> 8 & 255,i & 255))
+        if i % 10 == 0:
+            lines.append("host%d TXT \"record %d\"" % (i,i))
+    return "\n".join(lines) + "\n"
+
+def app_zone_file(records,path):
+    """
+        Zone in app.py zones.txt format
+    """
+    with open(path,"w") as f:
+        f.write('example.com SOA ["ns1.example.com", "admin.example.com"]\n')
+        f.write('example.com MX ["mail.example.com.", 10]\n')
+        for i in range(records):
+            f.write("host%d.example.com A 10.%d.%d.%d\n" % (i,i >> 16 & 255,
+                                                         i >> 8 & 255,i & 255))
+
+class Handler:
+    protocol = 'udp'
+    client_address = ('127.0.0.1',12345)
+
+def make_resolver(records,path,port=UPSTREAM_PORT):
+    import app
+    app.logger.setLevel(logging.WARNING)
+    app_zone_file(records,path)
+    resolver = app.Resolver("127.0.0.1",Path(path))
+    resolver.port = port
+    return resolver
+
+def run(number,records=RECORDS):
+    results = {}
+    text = zone_text(min(records,20000))
+    nrecords = len(list(ZoneParser(text).parse()))
+    results['zoneparser_per_record'] = timeit(
+                    lambda i: list(ZoneParser(text).parse()),1) / nrecords
+
+    handler = Handler()
+    rnd = random.Random(1)
+    zr = ZoneResolver(text)
+    nhosts = min(records,20000)
+    for name,fmt,qtype in (('hit',"host%d.example.com","A"),
+                           ('mx',"example.com","MX"),
+                           ('miss',"missing%d.example.com","A")):
+        qs = [ DNSRecord.question(fmt % rnd.randrange(nhosts) if "%" in fmt
+                                        else fmt,qtype) for i in range(1000) ]
+        results['zoneresolver_' + name] = timeit(
+                    lambda i: zr.resolve(qs[i % len(qs)],handler),number)
+
+    fd,path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    upstream = start_upstream()
+    try:
+        start = time.perf_counter()
+        resolver = make_resolver(records,path)
+        results['app_zone_load_per_record'] = \
+                    (time.perf_counter() - start) / records * 1e6
+        rnd = random.Random(1)
+        def queries(fmt,qtype="A",n=1000):
+            return [ DNSRecord.question(fmt % rnd.randrange(records),qtype)
+                        for i in range(n) ]
+        cases = (('zone_hit',queries("host%d.example.com"),number),
+                 ('zone_miss_soa',queries("missing%d.example.com"),number),
+                 ('proxied',queries("host%d.example.org"),number // 4),
+                 ('proxied_nxdomain',queries("host%d.nx.example.org","MX"),
+                                     max(1,number // 1000)))
+        for name,qs,n in cases:
+            results['resolve_' + name] = timeit(
+                    lambda i: resolver.resolve(qs[i % len(qs)],handler),n)
+    finally:
+        stop_upstream(upstream)
+        os.remove(path)
+    return results
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Zone benchmark")
+    p.add_argument("--number","-n",type=int,default=NUMBER,
+                    help="Iterations per run (default: %d)" % NUMBER)
+    p.add_argument("--records",type=int,default=RECORDS,
+                    help="Zone records (default: %d)" % RECORDS)
+    args = p.parse_args()
+    print(json.dumps({'benchmark':'zone',
+                      'number':args.number,
+                      'records':args.records,
+                      'unit':'us',
+                      'results':run(args.number,args.records)},indent=2))
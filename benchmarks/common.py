@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Timing helpers shared by the bench_<name>.py modules
+
+        best_of(f)          - best of 'repeat' runs of f() (seconds)
+        timeit(f,number)    - best of 'repeat' runs of f(0)..f(number-1)
+                              (microseconds per call)
+        per_item(f,number)  - best of 'repeat' runs of f() which handles
+                              'number' items (microseconds per item)
+"""
+
+import time
+
+def best_of(f,repeat=3):
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+    return best
+
+def timeit(f,number,repeat=5):
+    def loop():
+        for i in range(number):
+            f(i)
+    return best_of(loop,repeat) / number * 1e6
+
+def per_item(f,number,repeat=3):
+    return best_of(f,repeat) / number * 1e6
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Run benchmark suite and save/compare JSON results
+
+        python benchmarks/run.py [--output results.json]
+                                 [--compare baseline.json]
+                                 [--scale 0.1] [benchmark ...]
+
+    Each bench_<name>.py module provides run(number) and a default
+    NUMBER of iterations ('--scale' multiplies this for quick runs).
+    Results are written as JSON:
+
+        {"python": ..., "platform": ..., "time": ...,
+         "benchmarks": {"<name>": {"<case>": value, ...}, ...}}
+
+    With '--compare' the change from a previous results file is printed
+    for each case (times are lower-is-better, '*qps' and '*mbps'
+    higher-is-better) and the exit status is 1 if any case regressed by
+    more than '--threshold' percent.
+
+    The 'zone', 'server' and 'web' benchmarks use app.Resolver (so need
+    the app dependencies) and 'dot' needs the openssl command - benchmarks
+    which can't run are reported and skipped.
+"""
+
+from __future__ import print_function
+
+import argparse,importlib,json,os,platform,sys,time,traceback
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = ['buffer','codec','zone','server','web','rrl','logger','dot',
+              'address','lex']
+
+def run_benchmark(name,scale):
+    module = importlib.import_module('bench_' + name)
+    number = max(1,int(getattr(module,'NUMBER',1000) * scale))
+    if name == 'dot':
+        import shutil,tempfile
+        d = tempfile.mkdtemp()
+        try:
+            cert,key = module.mkcert(d)
+            return module.run(number,cert,key,8853,8854)
+        finally:
+            shutil.rmtree(d)
+    return module.run(number)
+
+def compare(baseline,results,threshold):
+    regressions = []
+    for name,cases in sorted(results['benchmarks'].items()):
+        base = baseline.get('benchmarks',{}).get(name,{})
+        for case,value in sorted(cases.items()):
+            old = base.get(case)
+            if not old or not isinstance(value,(int,float)):
+                continue
+            change = 100.0 * (value - old) / old
+            higher_better = case.endswith(('qps','mbps'))
+            worse = -change if higher_better else change
+            flag = ""
+            if worse > threshold and not case.endswith('lost') \
+                    and not case.endswith('dropped'):
+                flag = " REGRESSION"
+                regressions.append((name,case))
+            print("%-10s %-40s %12.3f %12.3f %+8.1f%%%s" % (name,case,old,
+                                                          value,change,flag))
+    return regressions
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description="Benchmark suite")
+    p.add_argument("--output","-o",default=None,
+                    help="Write results to file (default: stdout)")
+    p.add_argument("--compare","-c",default=None,
+                    help="Compare with previous results file")
+    p.add_argument("--threshold",type=float,default=10.0,
+                    help="Regression threshold (percent, default: 10)")
+    p.add_argument("--scale",type=float,default=1.0,
+                    help="Scale iterations (default: 1.0)")
+    p.add_argument("benchmarks",nargs="*",metavar="<benchmark>",
+                    help="Benchmarks to run (default: %s)" %
+                                        ",".join(BENCHMARKS))
+    args = p.parse_args()
+
+    results = {'python':platform.python_version(),
+               'implementation':platform.python_implementation(),
+               'platform':platform.platform(),
+               'time':time.strftime("%Y-%m-%dT%H:%M:%S"),
+               'scale':args.scale,
+               'benchmarks':{}}
+    for name in args.benchmarks or BENCHMARKS:
+        print("Running %s..." % name,file=sys.stderr)
+        try:
+            results['benchmarks'][name] = run_benchmark(name,args.scale)
+        except Exception:
+            print("Benchmark %s failed:" % name,file=sys.stderr)
+            traceback.print_exc()
+
+    if args.output:
+        with open(args.output,"w") as f:
+            json.dump(results,f,indent=2)
+    elif not args.compare:
+        print(json.dumps(results,indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline,results,args.threshold):
+            sys.exit(1)
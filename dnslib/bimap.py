@@ -27,6 +27,11 @@ class Bimap(object):
             * A 'get' method which does a forward lookup (code->text)
               and returns a textual version of code if there is no
               explicit mapping (or default provided)
+
+        Reverse mappings are also stored as instance attributes so that
+        'bimap.text' is a plain attribute lookup (these are used as
+        constants in the packet code and resolvers) - __getattr__ is only
+        called for unknown names
         
         >>> class TestError(Exception):
         ...     pass
@@ -39,13 +44,24 @@ class Bimap(object):
         >>> TEST.X
         Traceback (most recent call last):
         ...
-        TestError: TEST: Invalid reverse lookup: [X]
+        dnslib.bimap.TestError: TEST: Invalid reverse lookup: [X]
         >>> TEST[99]
         Traceback (most recent call last):
         ...
-        TestError: TEST: Invalid forward lookup: [99]
+        dnslib.bimap.TestError: TEST: Invalid forward lookup: [99]
         >>> TEST.get(99)
         '99'
+        >>> TEST.get(99,'unknown')
+        'unknown'
+
+        Special (dunder) names raise AttributeError so copy/pickle/hasattr
+        work
+
+        >>> hasattr(TEST,'__deepcopy__')
+        False
+        >>> import copy
+        >>> copy.deepcopy(TEST)[2]
+        'B'
     
     """
 
@@ -54,12 +70,15 @@ class Bimap(object):
         self.error = error
         self.forward = forward.copy()
         self.reverse = dict([(v,k) for (k,v) in list(forward.items())])
+        for k,v in self.reverse.items():
+            if k not in self.__dict__:
+                self.__dict__[k] = v
 
     def get(self,k,default=None):
-        try:
-            return self.forward[k]
-        except KeyError as e:
+        v = self.forward.get(k)
+        if v is None:
             return default or str(k)
+        return v
 
     def __getitem__(self,k):
         try:
@@ -68,6 +87,8 @@ class Bimap(object):
             raise self.error("%s: Invalid forward lookup: [%s]" % (self.name,k))
 
     def __getattr__(self,k):
+        if k.startswith('__') and k.endswith('__'):
+            raise AttributeError(k)
         try:
             return self.reverse[k]
         except KeyError as e:
@@ -9,6 +9,25 @@ import binascii,struct
 class BufferError(Exception):
     pass
 
+# Compiled struct.Struct objects (by format) - formats are literals in the
+# callers so this stays small
+_structs = {}
+
+def get_struct(fmt):
+    """
+        Return (cached) struct.Struct for fmt
+
+        >>> get_struct("!HH") is get_struct("!HH")
+        True
+        >>> get_struct("!HH").size
+        4
+    """
+    try:
+        return _structs[fmt]
+    except KeyError:
+        s = _structs[fmt] = struct.Struct(fmt)
+        return s
+
 class Buffer(object):
 
     """
@@ -40,13 +59,31 @@ class Buffer(object):
     >>> b.offset = 7
     >>> bytearray(b.get(5))
     bytearray(b'xx234')
+
+    Buffers created from data (for parsing) keep it as immutable bytes so
+    that 'get' returns a single copy and 'unpack' reads in place
+    (unpack_from) - the data is converted to a bytearray if updated
+
+    >>> b = Buffer(bytearray(b"\\x00\\x01abc"))
+    >>> b.unpack("!H")
+    (1,)
+    >>> b.get(3) == b"abc"
+    True
+    >>> b.unpack("!H")
+    Traceback (most recent call last):
+    ...
+    dnslib.buffer.BufferError: Not enough bytes [offset=5,remaining=0,requested=2]
+    >>> b.update(0,"!H",2)
+    >>> p(b.hex())
+    '0002616263'
     """
 
     def __init__(self,data=b''):
         """
             Initialise Buffer from data
         """
-        self.data = bytearray(data)
+        # Output buffers use bytearray (which grows geometrically on +=)
+        self.data = bytes(data) if data else bytearray()
         self.offset = 0
 
     def remaining(self):
@@ -59,12 +96,12 @@ class Buffer(object):
         """
             Gen len bytes at current offset (& increment offset)
         """
-        if length > self.remaining():
+        start = self.offset
+        end = start + length
+        if end > len(self.data):
             raise BufferError("Not enough bytes [offset=%d,remaining=%d,requested=%d]" %
                     (self.offset,self.remaining(),length))
-        start = self.offset
-        end = self.offset + length
-        self.offset += length
+        self.offset = end
         return bytes(self.data[start:end])
 
     def hex(self):
@@ -78,8 +115,9 @@ class Buffer(object):
             Pack data at end of data according to fmt (from struct) & increment
             offset
         """
-        self.offset += struct.calcsize(fmt)
-        self.data += struct.pack(fmt,*args)
+        s = get_struct(fmt)
+        self.offset += s.size
+        self.data += s.pack(*args)
 
     def append(self,s):
         """
@@ -92,19 +130,21 @@ class Buffer(object):
         """
             Modify data at offset `ptr` 
         """
-        s = struct.pack(fmt,*args)
-        self.data[ptr:ptr+len(s)] = s
+        if isinstance(self.data,bytes):
+            self.data = bytearray(self.data)
+        get_struct(fmt).pack_into(self.data,ptr,*args)
 
     def unpack(self,fmt):
         """
             Unpack data at current offset according to fmt (from struct)
         """
-        try:
-            data = self.get(struct.calcsize(fmt))
-            return struct.unpack(fmt,data)
-        except struct.error as e:
-            raise BufferError("Error unpacking struct '%s' <%s>" % 
-                    (fmt,binascii.hexlify(data).decode()))
+        s = get_struct(fmt)
+        offset = self.offset
+        if offset + s.size > len(self.data):
+            raise BufferError("Not enough bytes [offset=%d,remaining=%d,requested=%d]" %
+                    (offset,self.remaining(),s.size))
+        self.offset = offset + s.size
+        return s.unpack_from(self.data,offset)
 
     def __len__(self):
         return len(self.data)
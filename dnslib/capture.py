@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+
+"""
+    CaptureLogger - record the raw queries/responses seen by DNSHandler
+
+    A DNSLogger (using the log_recv/log_send hooks) which writes the wire
+    format messages to a capture file in either of:
+
+        dnstap  - Frame Streams file of dnstap protobuf messages
+                  (CLIENT_QUERY/CLIENT_RESPONSE) - readable with
+                  dnstap-read/fstrm tools
+        pcapng  - packets with synthesised IP/UDP (or TCP) headers between
+                  the client and server address - readable with
+                  Wireshark/tcpdump
+
+    Capture uses the StructuredLogger ring buffer and writer thread so the
+    handler thread only queues the packet (if the writer falls behind the
+    oldest packets are dropped rather than blocking queries). The capture
+    file is rotated when it reaches 'max_bytes' (keeping 'backups' old
+    files as <path>.1, <path>.2 ...). Other hooks are passed to an
+    optional second logger so capture can be combined with normal logging.
+
+    >>> import io,os,tempfile
+    >>> from dnslib import DNSRecord,RR
+    >>> class Server:
+    ...     server_address = ('192.0.2.53',53)
+    >>> class Handler:
+    ...     client_address = ('192.0.2.1',12345)
+    ...     protocol = 'udp'
+    ...     server = Server()
+    >>> q = DNSRecord.question("abc.com")
+    >>> a = q.reply()
+    >>> a.add_answer(*RR.fromZone("abc.com. 60 A 1.2.3.4"))
+    >>> d = tempfile.mkdtemp()
+
+    dnstap
+
+    >>> path = os.path.join(d,"dns.tap")
+    >>> capture = CaptureLogger(path,format="dnstap")
+    >>> capture.log_recv(Handler(),q.pack())
+    >>> capture.log_send(Handler(),a.pack())
+    >>> capture.close()
+    >>> for m in read_dnstap(path):
+    ...     print(m['type'],m['query_address'],m['query_port'],
+    ...           m['response_address'],m['response_port'],
+    ...           DNSRecord.parse(m.get('query_message') or
+    ...                           m.get('response_message')).q.qname)
+    5 192.0.2.1 12345 192.0.2.53 53 abc.com.
+    6 192.0.2.1 12345 192.0.2.53 53 abc.com.
+
+    pcapng (rotated every 2 packets)
+
+    >>> path = os.path.join(d,"dns.pcapng")
+    >>> capture = CaptureLogger(path,format="pcapng",max_bytes=300,backups=2)
+    >>> for i in range(3):
+    ...     capture.log_recv(Handler(),q.pack())
+    ...     capture.log_send(Handler(),a.pack())
+    ...     capture.flush()
+    >>> capture.close()
+    >>> for p in (path + ".2",path + ".1",path):
+    ...     packets = list(read_pcapng(p))
+    ...     print([ (src,sport,dst,dport,len(data)) for t,src,sport,dst,dport,data in packets ])
+    [('192.0.2.1', 12345, '192.0.2.53', 53, 25), ('192.0.2.53', 53, '192.0.2.1', 12345, 41)]
+    [('192.0.2.1', 12345, '192.0.2.53', 53, 25), ('192.0.2.53', 53, '192.0.2.1', 12345, 41)]
+    [('192.0.2.1', 12345, '192.0.2.53', 53, 25), ('192.0.2.53', 53, '192.0.2.1', 12345, 41)]
+
+    TCP and IPv6
+
+    >>> Handler.client_address = ('2001:db8::1',23456)
+    >>> Handler.protocol = 'tcp'
+    >>> Server.server_address = ('2001:db8::53',53,0,0)
+    >>> capture = CaptureLogger(path,format="pcapng")
+    >>> capture.log_recv(Handler(),q.pack())
+    >>> capture.close()
+    >>> [ (src,dst,len(data)) for t,src,sport,dst,dport,data in read_pcapng(path) ]
+    [('2001:db8::1', '2001:db8::53', 27)]
+
+    Sequence numbers are kept for the most recent 'max_flows' connections
+
+    >>> capture = CaptureLogger(path,format="pcapng")
+    >>> capture.max_flows = 2
+    >>> for port in range(5):
+    ...     Handler.client_address = ('2001:db8::1',20000 + port)
+    ...     capture.log_recv(Handler(),q.pack())
+    >>> capture.close()
+    >>> [ client[1] for client,server in capture.seq ]
+    [20003, 20004]
+
+    Maximum size TCP messages are split into segments which fit an IP
+    packet
+
+    >>> capture = CaptureLogger(path,format="pcapng")
+    >>> capture.log_send(Handler(),a.pack() + b'x' * (65535 - len(a.pack())))
+    >>> capture.close()
+    >>> [ len(data) for t,src,sport,dst,dport,data in read_pcapng(path) ]
+    [65495, 42]
+
+    >>> for f in os.listdir(d):
+    ...     os.remove(os.path.join(d,f))
+    >>> os.rmdir(d)
+"""
+
+from __future__ import print_function
+
+import collections,os,socket,struct,time
+
+from dnslib.structlogger import StructuredLogger,RECV,SEND
+
+# dnstap (see dnstap.proto)
+DNSTAP_CONTENT_TYPE = b"protobuf:dnstap.Dnstap"
+DNSTAP_MESSAGE = 1
+CLIENT_QUERY,CLIENT_RESPONSE = 5,6
+INET,INET6 = 1,2
+UDP,TCP,DOT,DOH = 1,2,3,4
+SOCKET_PROTOCOLS = {'udp':UDP,'tcp':TCP,'dot':DOT,'doh':DOH}
+
+# Frame Streams control frames
+FSTRM_START,FSTRM_STOP = 2,3
+FSTRM_CONTENT_TYPE = 1
+
+# pcapng
+LINKTYPE_RAW = 101
+MAX_SEGMENT = 65535 - 40    # TCP payload fitting an IPv4 packet
+
+def varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def pb_varint(field,n):
+    return varint(field << 3) + varint(n)
+
+def pb_bytes(field,data):
+    return varint(field << 3 | 2) + varint(len(data)) + data
+
+def pb_fixed32(field,n):
+    return varint(field << 3 | 5) + struct.pack("<I",n)
+
+def pb_fields(data):
+    """
+        Decode protobuf message - yields (field,value)
+    """
+    def read_varint(offset):
+        n = shift = 0
+        while True:
+            b = data[offset]
+            n |= (b & 0x7f) << shift
+            offset += 1
+            shift += 7
+            if not b & 0x80:
+                return n,offset
+    offset = 0
+    while offset < len(data):
+        key,offset = read_varint(offset)
+        field,wiretype = key >> 3,key & 7
+        if wiretype == 0:
+            value,offset = read_varint(offset)
+        elif wiretype == 2:
+            length,offset = read_varint(offset)
+            value = data[offset:offset+length]
+            offset += length
+        elif wiretype == 5:
+            value = struct.unpack_from("<I",data,offset)[0]
+            offset += 4
+        elif wiretype == 1:
+            value = struct.unpack_from("<Q",data,offset)[0]
+            offset += 8
+        else:
+            raise ValueError("Unsupported wire type: %d" % wiretype)
+        yield field,value
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    s = sum(struct.unpack("!%dH" % (len(data) // 2),data))
+    while s >> 16:
+        s = (s & 0xffff) + (s >> 16)
+    return ~s & 0xffff
+
+def family(address):
+    return socket.AF_INET6 if ':' in address else socket.AF_INET
+
+def ip_packet(src,sport,dst,dport,protocol,payload,seq=0,ack=0):
+    """
+        Build IPv4/IPv6 packet containing UDP datagram or TCP segment
+    """
+    af = family(src)
+    srcb,dstb = socket.inet_pton(af,src),socket.inet_pton(af,dst)
+    if protocol == 'udp':
+        proto = 17
+        segment = struct.pack("!HHHH",sport,dport,8 + len(payload),0) + payload
+        offset = 6
+    else:
+        proto = 6
+        segment = struct.pack("!HHIIBBHHH",sport,dport,seq,ack,5 << 4,
+                              0x18,65535,0,0) + payload     # PSH|ACK
+        offset = 16
+    if af == socket.AF_INET6:
+        pseudo = srcb + dstb + struct.pack("!IxxxB",len(segment),proto)
+    else:
+        pseudo = srcb + dstb + struct.pack("!xBH",proto,len(segment))
+    csum = checksum(pseudo + segment) or 0xffff
+    segment = segment[:offset] + struct.pack("!H",csum) + segment[offset+2:]
+    if af == socket.AF_INET6:
+        return struct.pack("!IHBB",6 << 28,len(segment),proto,64) + \
+                    srcb + dstb + segment
+    header = struct.pack("!BBHHHBBH4s4s",0x45,0,20 + len(segment),0,0x4000,
+                         64,proto,0,srcb,dstb)
+    header = header[:10] + struct.pack("!H",checksum(header)) + header[12:]
+    return header + segment
+
+def pcapng_block(block_type,body):
+    body += b'\0' * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II",block_type,length) + body + \
+                    struct.pack("<I",length)
+
+class CaptureLogger(StructuredLogger):
+
+    """
+        DNSLogger capturing raw packets to dnstap/pcapng file
+    """
+
+    max_flows = 4096        # TCP connections tracked for pcapng seq/ack
+
+    def __init__(self,path,format="dnstap",max_bytes=0,backups=5,
+                      logger=None,identity=None,sample=1,size=65536,
+                      interval=0.1):
+        """
+            path:       capture file
+            format:     'dnstap' or 'pcapng'
+            max_bytes:  rotate file at this size (0: don't rotate)
+            backups:    number of rotated files to keep
+            logger:     logger for other hooks (request/reply etc)
+            identity:   dnstap identity (default: hostname)
+            sample/size/interval: as StructuredLogger
+        """
+        if format not in ("dnstap","pcapng"):
+            raise ValueError("Invalid format: %s" % format)
+        self.path = path
+        self.format = format
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.identity = (identity or socket.gethostname()).encode()
+        self.seq = collections.OrderedDict()
+        super(CaptureLogger,self).__init__("recv,send",out=self.open(),
+                                           format=format,sample=sample,
+                                           size=size,interval=interval)
+        if logger:
+            for l in ('log_request','log_reply','log_truncated',
+                      'log_error','log_data'):
+                setattr(self,l,getattr(logger,l))
+
+    def log_recv(self,handler,data):
+        id = struct.unpack("!H",data[:2])[0] if len(data) >= 2 else 0
+        if self.sampled(id):
+            self.push((RECV,time.time(),handler.client_address,
+                       handler.protocol,handler.server.server_address,data))
+
+    def log_send(self,handler,data):
+        id = struct.unpack("!H",data[:2])[0] if len(data) >= 2 else 0
+        if self.sampled(id):
+            self.push((SEND,time.time(),handler.client_address,
+                       handler.protocol,handler.server.server_address,data))
+
+    # Writer thread
+
+    def open(self):
+        out = open(self.path,"wb")
+        if self.format == "dnstap":
+            fields = struct.pack("!II",FSTRM_CONTENT_TYPE,
+                                 len(DNSTAP_CONTENT_TYPE)) + DNSTAP_CONTENT_TYPE
+            out.write(struct.pack("!III",0,4 + len(fields),FSTRM_START) + fields)
+        else:
+            # Section header (byte order magic, version 1.0, unknown length)
+            out.write(pcapng_block(0x0A0D0D0A,
+                            struct.pack("<IHHq",0x1A2B3C4D,1,0,-1)))
+            # Interface (raw IP, default microsecond timestamps)
+            out.write(pcapng_block(1,struct.pack("<HHI",LINKTYPE_RAW,0,0)))
+        return out
+
+    def finish(self,out):
+        if self.format == "dnstap":
+            out.write(struct.pack("!III",0,4,FSTRM_STOP))
+        out.close()
+
+    def rotate(self):
+        self.finish(self.out)
+        if self.backups:
+            for i in range(self.backups - 1,0,-1):
+                src = "%s.%d" % (self.path,i)
+                if os.path.exists(src):
+                    os.replace(src,"%s.%d" % (self.path,i + 1))
+            os.replace(self.path,self.path + ".1")
+        self.out = self.open()
+        self.seq.clear()
+
+    def write(self,data):
+        if self.max_bytes and self.out.tell() + len(data) > self.max_bytes \
+                and self.out.tell() > 0:
+            self.rotate()
+        self.out.write(data)
+
+    def addresses(self,client,server):
+        # Server address of the same family as client (wildcard if bound
+        # to the other family/all addresses)
+        local = server[0]
+        if not local or family(local) != family(client[0]):
+            local = "::" if family(client[0]) == socket.AF_INET6 else "0.0.0.0"
+        return client,(local,server[1])
+
+    def write_dnstap(self,record):
+        event,t,client,protocol,server,data = record
+        client,server = self.addresses(client,server)
+        sec,nsec = int(t),int((t % 1) * 1e9)
+        af = family(client[0])
+        msg = pb_varint(1,CLIENT_QUERY if event == RECV else CLIENT_RESPONSE)
+        msg += pb_varint(2,INET6 if af == socket.AF_INET6 else INET)
+        msg += pb_varint(3,SOCKET_PROTOCOLS.get(protocol,TCP))
+        msg += pb_bytes(4,socket.inet_pton(af,client[0]))
+        msg += pb_bytes(5,socket.inet_pton(af,server[0]))
+        msg += pb_varint(6,client[1])
+        msg += pb_varint(7,server[1])
+        if event == RECV:
+            msg += pb_varint(8,sec) + pb_fixed32(9,nsec) + pb_bytes(10,data)
+        else:
+            msg += pb_varint(12,sec) + pb_fixed32(13,nsec) + pb_bytes(14,data)
+        frame = pb_bytes(1,self.identity) + pb_bytes(2,b"dnslib") + \
+                    pb_varint(15,DNSTAP_MESSAGE) + pb_bytes(14,msg)
+        self.write(struct.pack("!I",len(frame)) + frame)
+
+    def write_pcapng(self,record):
+        event,t,client,protocol,server,data = record
+        client,server = self.addresses(client,server)
+        if protocol != 'udp':
+            # Track sequence numbers per direction so TCP streams reassemble
+            # (least recently used connections are dropped at max_flows)
+            data = struct.pack("!H",len(data)) + data
+            flow = self.seq.pop((client,server),None) or [1,1]
+            if len(self.seq) >= self.max_flows:
+                self.seq.popitem(last=False)
+            self.seq[(client,server)] = flow
+            if event == RECV:
+                src,dst = client,server
+                seq,ack = flow
+                flow[0] = (seq + len(data)) & 0xffffffff
+            else:
+                src,dst = server,client
+                ack,seq = flow
+                flow[1] = (seq + len(data)) & 0xffffffff
+            # Messages too large for one IP packet are split into segments
+            segments = [ (data[i:i+MAX_SEGMENT],(seq + i) & 0xffffffff)
+                                for i in range(0,len(data),MAX_SEGMENT) ]
+        else:
+            src,dst = (client,server) if event == RECV else (server,client)
+            segments,ack = [(data,0)],0
+        ts = int(t * 1e6)
+        for payload,seq in segments:
+            packet = ip_packet(src[0],src[1],dst[0],dst[1],protocol,payload,
+                               seq,ack)
+            self.write(pcapng_block(6,struct.pack("<IIIII",0,ts >> 32,
+                                                  ts & 0xffffffff,
+                                                  len(packet),len(packet)) +
+                                      packet))
+
+    def close(self):
+        super(CaptureLogger,self).close()
+        self.finish(self.out)
+
+def read_dnstap(path):
+    """
+        Read dnstap Frame Streams file - yields dict of Message fields
+    """
+    names = {1:'type',2:'socket_family',3:'socket_protocol',
+             4:'query_address',5:'response_address',6:'query_port',
+             7:'response_port',8:'query_time_sec',9:'query_time_nsec',
+             10:'query_message',12:'response_time_sec',
+             13:'response_time_nsec',14:'response_message'}
+    with open(path,"rb") as f:
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return
+            length = struct.unpack("!I",header)[0]
+            if length == 0:
+                # Control frame
+                length = struct.unpack("!I",f.read(4))[0]
+                f.read(length)
+                continue
+            for field,value in pb_fields(f.read(length)):
+                if field == 14:
+                    m = {}
+                    for k,v in pb_fields(value):
+                        if k in (4,5):
+                            v = socket.inet_ntop(socket.AF_INET6 if len(v) == 16
+                                                    else socket.AF_INET,v)
+                        m[names.get(k,k)] = v
+                    yield m
+
+def read_pcapng(path):
+    """
+        Read pcapng file written by CaptureLogger - yields (time,src,sport,
+        dst,dport,payload) for each packet
+    """
+    with open(path,"rb") as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        block_type,length = struct.unpack_from("<II",data,offset)
+        if block_type == 6:
+            _,hi,lo,caplen,_ = struct.unpack_from("<IIIII",data,offset + 8)
+            packet = data[offset+28:offset+28+caplen]
+            if packet[0] >> 4 == 6:
+                af,proto,hlen = socket.AF_INET6,packet[6],40
+                src,dst = packet[8:24],packet[24:40]
+            else:
+                af,proto,hlen = socket.AF_INET,packet[9],(packet[0] & 0xf) * 4
+                src,dst = packet[12:16],packet[16:20]
+            sport,dport = struct.unpack_from("!HH",packet,hlen)
+            payload = packet[hlen + (8 if proto == 17 else
+                                     (packet[hlen + 12] >> 4) * 4):]
+            yield (((hi << 32) | lo) / 1e6,socket.inet_ntop(af,src),sport,
+                   socket.inet_ntop(af,dst),dport,payload)
+        offset += length
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
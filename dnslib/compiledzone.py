@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+"""
+    CompiledZone - binary zone image which is mmap'd and served directly
+    (avoids re-parsing the text zone file every time a server starts)
+
+    Image layout (all integers in network byte order):
+
+        header      "!4sHHII"   magic (b'DNSZ'), version, flags (unused),
+                                number of names, number of RRs
+
+        name table  "!IIHH"     One entry per owner name sorted by key:
+                                pool offset of key, index of first RR,
+                                key length, number of RRs
+
+        rr table    "!HHIIH2x"  One entry per RR (grouped by name):
+                                rtype, rclass, ttl, pool offset of rdata,
+                                rdlength
+
+        pool                    Per name the key (lowercased wire format
+                                name) immediately followed by the original
+                                wire format name, then the pre-packed
+                                rdata for each RR
+
+    Lookups are a binary search of the name table against the mapped
+    image so opening an image is O(1) regardless of zone size, and the
+    pages are shared between all processes mapping the same file. RRs
+    are only decoded when a name is requested.
+
+    The read interface (get/names/__iter__/__len__/__contains__) matches
+    ZoneIndex so resolvers can serve from either.
+
+    Images can be created from the command line:
+
+        python -m dnslib.compiledzone compile-zone --zone <zone-file> \\
+                                                   --output <image>
+
+    >>> import os,tempfile
+    >>> from dnslib import RR
+    >>> rrs = RR.fromZone('''
+    ... $ORIGIN abc.com.
+    ... @       3600 SOA   ns1 admin 2014010100 3600 600 86400 60
+    ... @       60   A     1.2.3.4
+    ... @       60   MX    10 Mail
+    ... Mail    60   A     5.6.7.8
+    ... www     60   CNAME abc.com.
+    ... ''')
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> compile_zone(rrs,path)
+    5
+    >>> is_compiled(path)
+    True
+    >>> z = CompiledZone(path)
+    >>> len(z)
+    5
+    >>> for rr in z.get("abc.com"):
+    ...     print(rr)
+    abc.com.                3600    IN      SOA     ns1.abc.com. admin.abc.com. 2014010100 3600 600 86400 60
+    abc.com.                60      IN      A       1.2.3.4
+    abc.com.                60      IN      MX      10 Mail.abc.com.
+    >>> for rr in z.get("MAIL.abc.com"):
+    ...     print(rr)
+    Mail.abc.com.           60      IN      A       5.6.7.8
+    >>> z.get("xxx.abc.com")
+    ()
+    >>> "www.abc.com" in z
+    True
+    >>> sorted(map(str,z.names()))
+    ['Mail.abc.com.', 'abc.com.', 'www.abc.com.']
+    >>> sorted(map(str,z)) == sorted(map(str,rrs))
+    True
+    >>> z.close()
+    >>> os.remove(path)
+"""
+
+from __future__ import print_function
+
+import mmap,os,struct
+
+from dnslib.dns import RR,RD,RDPARSE
+from dnslib.label import DNSLabel,DNSBuffer
+
+MAGIC = b'DNSZ'
+VERSION = 1
+
+HEADER = struct.Struct("!4sHHII")
+NAME = struct.Struct("!IIHH")
+RECORD = struct.Struct("!HHIIH2x")
+
+class CompiledZoneError(Exception):
+    pass
+
+def wire_name(name):
+    """
+        Return uncompressed wire format name
+    """
+    buffer = DNSBuffer()
+    buffer.encode_name_nocompress(name)
+    return bytes(buffer.data)
+
+def wire_key(name):
+    """
+        Return lookup key for name (lowercased wire format - the label
+        length bytes are all < 64 so are unaffected by lower())
+    """
+    return wire_name(name).lower()
+
+def pack_rdata(rr):
+    """
+        Pack RDATA (compression pointers are relative to the start of
+        the RDATA which is also where decoding starts)
+    """
+    if not rr.rdata:
+        return b''
+    buffer = DNSBuffer()
+    rr.rdata.pack(buffer)
+    return bytes(buffer.data)
+
+def is_compiled(path):
+    """
+        Check if file is a compiled zone image
+    """
+    with open(path,'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def compile_zone(rrs,path):
+    """
+        Write RRs to compiled zone image at path (written to a temporary
+        file and renamed so that readers never see a partial image).
+        Returns number of RRs written
+    """
+    names = {}
+    for rr in rrs:
+        if not isinstance(rr.rname,DNSLabel):
+            rr.rname = DNSLabel(rr.rname)
+        names.setdefault(wire_key(rr.rname),[]).append(rr)
+    name_table = bytearray()
+    rr_table = bytearray()
+    pool = bytearray()
+    count = 0
+    for key in sorted(names):
+        group = names[key]
+        name_table += NAME.pack(len(pool),count,len(key),len(group))
+        pool += key
+        pool += wire_name(group[0].rname)
+        for rr in group:
+            rdata = pack_rdata(rr)
+            rr_table += RECORD.pack(rr.rtype,rr.rclass,rr.ttl,
+                                    len(pool),len(rdata))
+            pool += rdata
+            count += 1
+    tmp = "%s.tmp.%d" % (path,os.getpid())
+    with open(tmp,'wb') as f:
+        f.write(HEADER.pack(MAGIC,VERSION,0,len(names),count))
+        f.write(name_table)
+        f.write(rr_table)
+        f.write(pool)
+    os.replace(tmp,path)
+    return count
+
+class CompiledZone(object):
+
+    """
+        Read-only zone served from mmap'd compiled zone image
+    """
+
+    def __init__(self,path):
+        with open(path,'rb') as f:
+            self.mm = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise CompiledZoneError("Invalid compiled zone: %s" % path)
+        magic,version,_,self.nnames,self.count = HEADER.unpack_from(self.mm,0)
+        if magic != MAGIC:
+            raise CompiledZoneError("Invalid compiled zone: %s" % path)
+        if version != VERSION:
+            raise CompiledZoneError("Unsupported compiled zone version: %d" %
+                                            version)
+        self.path = path
+        self.name_offset = HEADER.size
+        self.rr_offset = self.name_offset + NAME.size * self.nnames
+        self.pool_offset = self.rr_offset + RECORD.size * self.count
+
+    def find(self,key):
+        """
+            Binary search name table for key - returns entry index or -1
+        """
+        lo,hi = 0,self.nnames
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset,_,length,_ = NAME.unpack_from(self.mm,
+                                        self.name_offset + mid * NAME.size)
+            start = self.pool_offset + offset
+            k = self.mm[start:start+length]
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def name(self,i):
+        """
+            Return owner name for name table entry
+        """
+        offset,_,length,_ = NAME.unpack_from(self.mm,
+                                        self.name_offset + i * NAME.size)
+        start = self.pool_offset + offset + length
+        return DNSBuffer(self.mm[start:start+length]).decode_name()
+
+    def records(self,i):
+        """
+            Decode RRs for name table entry
+        """
+        offset,first,length,n = NAME.unpack_from(self.mm,
+                                        self.name_offset + i * NAME.size)
+        start = self.pool_offset + offset + length
+        rname = DNSBuffer(self.mm[start:start+length]).decode_name()
+        rrs = []
+        for j in range(first,first+n):
+            rtype,rclass,ttl,rdoffset,rdlength = RECORD.unpack_from(self.mm,
+                                        self.rr_offset + j * RECORD.size)
+            if rdlength:
+                start = self.pool_offset + rdoffset
+                buffer = DNSBuffer(self.mm[start:start+rdlength])
+                rdata = RDPARSE.get(rtype,RD.parse)(buffer,rdlength)
+            else:
+                rdata = ''
+            rrs.append(RR(rname,rtype,rclass,ttl,rdata))
+        return rrs
+
+    def get(self,name):
+        """
+            Return RRs for name (empty tuple if name not in zone)
+        """
+        i = self.find(wire_key(name))
+        return self.records(i) if i >= 0 else ()
+
+    def names(self):
+        """
+            Return owner names in image (in key order)
+        """
+        return [ self.name(i) for i in range(self.nnames) ]
+
+    def close(self):
+        self.mm.close()
+
+    def __iter__(self):
+        for i in range(self.nnames):
+            for rr in self.records(i):
+                yield rr
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,name):
+        return self.find(wire_key(name)) >= 0
+
+if __name__ == '__main__':
+
+    import argparse,doctest,sys
+
+    from dnslib.dns import parse_time
+
+    p = argparse.ArgumentParser(description="Compiled Zone")
+    s = p.add_subparsers(dest="command")
+    c = s.add_parser("compile-zone",help="Compile zone file to image")
+    c.add_argument("--zone","-z",required=True,
+                    metavar="<zone-file>",
+                    help="Zone file ('-' for stdin)")
+    c.add_argument("--output","-o",required=True,
+                    metavar="<image>",
+                    help="Compiled zone image")
+    c.add_argument("--origin",default="",
+                    metavar="<origin>",
+                    help="Origin for relative names (default: none)")
+    c.add_argument("--ttl",default="0",
+                    metavar="<ttl>",
+                    help="Default TTL (default: 0)")
+    d = s.add_parser("dump",help="Dump compiled zone image")
+    d.add_argument("image",metavar="<image>",
+                    help="Compiled zone image")
+    args = p.parse_args()
+
+    if args.command == 'compile-zone':
+        zone = sys.stdin if args.zone == '-' else open(args.zone)
+        n = compile_zone(RR.fromZone(zone,origin=args.origin,
+                                          ttl=parse_time(args.ttl)),
+                         args.output)
+        print("Compiled %d RRs: %s" % (n,args.output))
+    elif args.command == 'dump':
+        for rr in CompiledZone(args.image):
+            print(rr.toZone())
+    else:
+        doctest.testmod()
@@ -67,15 +67,39 @@
     <DNS RR: 'google.com.' rtype=TXT rclass=IN ttl=3599 rdata='"v=spf1 include:_spf.google.com ~all"'>
     <DNS RR: 'google.com.' rtype=MX rclass=IN ttl=599 rdata='30 alt2.aspmx.l.google.com.'>
 
+    OPT pseudosection (unknown EDNS flag bits are shown by DiG as 'MBZ')
+
+    >>> dig = os.path.join(os.path.dirname(__file__),"test","dig","example.com-A-EDNS.dig")
+    >>> with open(dig) as f:
+    ...     l = DigParser(f)
+    ...     for record in l:
+    ...         print('---')
+    ...         print(repr(record))
+    ---
+    <DNS Header: id=0xa232 type=QUERY opcode=QUERY flags=RD rcode='NOERROR' q=1 a=0 ns=0 ar=1>
+    <DNS Question: 'example.com.' qtype=A qclass=IN>
+    <DNS OPT: edns_ver=0 do=0 ext_rcode=0 udp_len=1232>
+    ---
+    <DNS Header: id=0xa232 type=RESPONSE opcode=QUERY flags=RD,RA rcode='NOERROR' q=1 a=1 ns=0 ar=1>
+    <DNS Question: 'example.com.' qtype=A qclass=IN>
+    <DNS RR: 'example.com.' rtype=A rclass=IN ttl=3412 rdata='93.184.215.14'>
+    <DNS OPT: edns_ver=0 do=0 ext_rcode=0 udp_len=4096>
+    >>> record.ar[0].ttl & 0xffff
+    5
+
+    EDNS lines which aren't understood are skipped
+
+    >>> DigParser("").parseEDNS("EDNS: version: 0, flags:; MBZ: 0x0005")
+
 """
 
 from __future__ import print_function
 
-import glob,os.path,string
+import binascii,glob,os.path,re,string
 
 from dnslib.lex import WordLexer
 from dnslib.dns import (DNSRecord,DNSHeader,DNSQuestion,DNSError,
-                        RR,RD,RDMAP,QR,RCODE,CLASS,QTYPE)
+                        RR,RD,RDMAP,QR,RCODE,CLASS,QTYPE,EDNS0,EDNSOption)
 
 class DigParser:
 
@@ -101,6 +125,30 @@ class DigParser:
                 setattr(header,f,1)
         return header
 
+    def parseEDNS(self,val):
+        # OPT pseudosection - ';EDNS: version: 0, flags: do; udp: 4096'
+        # (BIND also shows unknown flag bits - 'flags:; MBZ: 0x0005, udp: ..')
+        # Returns None if the line isn't understood
+        m = re.match(r'EDNS: version: (\d+), flags:([^;]*);(.*)',val)
+        if not m:
+            return None
+        fields = dict(re.findall(r'(\w+): ([^,\s]+)',m.group(3)))
+        try:
+            edns = EDNS0(version=int(m.group(1)),
+                         flags=" ".join([ f for f in m.group(2).split()
+                                                if f == 'do' ]),
+                         udp_len=int(fields['udp']))
+            if 'MBZ' in fields:
+                edns.ttl |= int(fields['MBZ'],16) & 0x7fff
+        except (KeyError,ValueError):
+            return None
+        return edns
+
+    def parseEDNSOption(self,val):
+        # ';EDNS: code: 10; data: 0123456789abcdef' (dnslib format)
+        m = re.match(r'EDNS: code: (\d+); data: ([0-9a-fA-F]*)',val)
+        return EDNSOption(int(m.group(1)),binascii.unhexlify(m.group(2)))
+
     def expect(self,expect):
         t,val = next(self.i)
         if t != expect:
@@ -118,6 +166,9 @@ class DigParser:
         for sect in 'a','auth','ar':
             f = getattr(dns,sect_map[sect])
             for rr in locals()[sect]:
+                if isinstance(rr,RR):
+                    f(rr)
+                    continue
                 rname,ttl,rclass,rtype = rr[:4]
                 rdata = rr[4:]
                 rd = RDMAP.get(rtype,RD)
@@ -170,6 +221,13 @@ class DigParser:
                         section = auth
                     elif val.startswith('; ADDITIONAL'):
                         section = ar
+                    elif val.lstrip('; ').startswith('EDNS: version:'):
+                        edns = self.parseEDNS(val.lstrip('; '))
+                        if edns:
+                            ar.append(edns)
+                    elif val.startswith('EDNS: code:') and ar and \
+                                                isinstance(ar[-1],EDNS0):
+                        ar[-1].rdata.append(self.parseEDNSOption(val))
                     elif val.startswith(';') or tok[1].startswith('<<>>'):
                         pass
                     elif dns and section == q:
@@ -7,7 +7,7 @@
 
 from __future__ import print_function
 
-import base64,binascii,calendar,collections,copy,os.path,random,socket,\
+import base64,binascii,calendar,collections,copy,os.path,random,re,socket,\
        string,struct,textwrap,time
 
 from itertools import chain
@@ -22,7 +22,8 @@ from dnslib.bimap import Bimap,BimapError
 from dnslib.buffer import Buffer,BufferError
 from dnslib.label import DNSLabel,DNSLabelError,DNSBuffer
 from dnslib.lex import WordLexer
-from dnslib.ranges import BYTES,B,H,I,IP4,IP6,ntuple_range,check_range,\
+from dnslib.rdschema import FieldCodec,add_codec,compile_schema
+from dnslib.ranges import BYTES,B,H,I,ntuple_range,check_range,\
                           check_bytes
 
 class DNSError(Exception):
@@ -36,7 +37,8 @@ QTYPE =  Bimap('QTYPE',
                  29:'LOC', 33:'SRV', 35:'NAPTR', 36:'KX', 37:'CERT', 38:'A6',
                  39:'DNAME', 41:'OPT', 42:'APL', 43:'DS', 44:'SSHFP',
                  45:'IPSECKEY', 46:'RRSIG', 47:'NSEC', 48:'DNSKEY', 49:'DHCID',
-                 50:'NSEC3', 51:'NSEC3PARAM', 52:'TLSA', 55:'HIP', 99:'SPF',
+                 50:'NSEC3', 51:'NSEC3PARAM', 52:'TLSA', 55:'HIP',
+                 64:'SVCB', 65:'HTTPS', 99:'SPF',
                  249:'TKEY', 250:'TSIG', 251:'IXFR', 252:'AXFR', 255:'ANY',
                  257:'CAA', 32768:'TA', 32769:'DLV'},
                 DNSError)
@@ -61,6 +63,17 @@ def label(label,origin=None):
         return (origin if isinstance(origin,DNSLabel) 
                        else DNSLabel(origin)).add(label)
 
+def rrsets(rrs):
+    """
+        Group RRs into RRsets (same name/type/class) in order of first
+        appearance
+    """
+    sets = {}
+    for rr in rrs:
+        key = (tuple([ l.lower() for l in rr.rname.label ]),rr.rtype,rr.rclass)
+        sets.setdefault(key,[]).append(rr)
+    return list(sets.values())
+
 class DNSRecord(object):
 
     """
@@ -322,10 +335,15 @@ class DNSRecord(object):
             ar.pack(buffer)
         return buffer.data
 
-    def truncate(self):
+    def truncate(self,size=None):
         """
             Return truncated copy of DNSRecord (with TC flag set)
             (removes all Questions & RRs and just returns header)
+
+            If size is given whole RRsets are removed (from the additional,
+            authority and then answer sections) until the packed record
+            fits in size bytes. The OPT RR is always kept and the TC flag
+            is only set if answer/authority RRsets have been removed.
             
             >>> q = DNSRecord.question("abc.com")
             >>> a = q.reply()
@@ -339,10 +357,67 @@ class DNSRecord(object):
             ;; ->>HEADER<<- opcode: QUERY, status: NOERROR, id: ...
             ;; flags: qr aa tc rd ra; QUERY: 0, ANSWER: 0, AUTHORITY: 0, ADDITIONAL: 0
 
+            >>> a = q.reply()
+            >>> a.add_answer(*RR.fromZone('abc.com IN A 1.2.3.4'))
+            >>> a.add_answer(*RR.fromZone('abc.com IN TXT %s' % ('x' * 255)))
+            >>> a.add_answer(*RR.fromZone('abc.com IN TXT %s' % ('x' * 255)))
+            >>> a.add_auth(*RR.fromZone('abc.com IN NS ns1.abc.com'))
+            >>> a.add_ar(*RR.fromZone('ns1.abc.com IN A 5.6.7.8'))
+            >>> a.add_ar(EDNS0(udp_len=1024))
+            >>> len(a.pack())
+            622
+            >>> t = a.truncate(610)
+            >>> t.header.tc, len(t.rr), len(t.auth), len(t.ar), len(t.pack())
+            (0, 3, 1, 1, 606)
+            >>> t = a.truncate(500)
+            >>> t.header.tc, len(t.rr), len(t.auth), len(t.ar), len(t.pack())
+            (1, 1, 0, 1, 52)
+            >>> print(t)
+            ;; ->>HEADER<<- opcode: QUERY, status: NOERROR, id: ...
+            ;; flags: qr aa tc rd ra; QUERY: 1, ANSWER: 1, AUTHORITY: 0, ADDITIONAL: 1
+            ;; QUESTION SECTION:
+            ;abc.com.                       IN      A
+            ;; ANSWER SECTION:
+            abc.com.                0       IN      A       1.2.3.4
+            ;; ADDITIONAL SECTION:
+            ;OPT PSEUDOSECTION
+            ;EDNS: version: 0, flags: ; udp: 1024
         """
+        if size is None:
+            return DNSRecord(DNSHeader(id=self.header.id,
+                                       bitmap=self.header.bitmap,
+                                       tc=1))
+        opt = [ rr for rr in self.ar if rr.rtype == QTYPE.OPT ]
+        sections = [ rrsets(self.rr),
+                     rrsets(self.auth),
+                     rrsets([ rr for rr in self.ar if rr.rtype != QTYPE.OPT ]) ]
+        # Pack RRsets in order - compression pointers only refer back
+        # so the packed size of each prefix is exact
+        limit = size - sum([ 11 + sum([ 4 + len(o.data) for o in rr.rdata ])
+                                                        for rr in opt ])
+        buffer = DNSBuffer()
+        self.header.pack(buffer)
+        for q in self.questions:
+            q.pack(buffer)
+        keep = [[],[],[]]
+        full = True
+        for i,section in enumerate(sections):
+            for rrset in section:
+                for rr in rrset:
+                    rr.pack(buffer)
+                if buffer.offset > limit:
+                    full = False
+                    break
+                keep[i].extend(rrset)
+            if not full:
+                break
+        tc = self.header.tc or \
+                len(keep[0]) != len(self.rr) or len(keep[1]) != len(self.auth)
         return DNSRecord(DNSHeader(id=self.header.id,
                                    bitmap=self.header.bitmap,
-                                   tc=1))
+                                   tc=int(tc)),
+                         questions=list(self.questions),
+                         rr=keep[0],auth=keep[1],ar=keep[2] + opt)
 
     def send(self,dest,port=53,tcp=False,timeout=None,ipv6=False):
         """
@@ -465,6 +540,8 @@ class DNSHeader(object):
         DNSHeader section
     """
 
+    __slots__ = ('_id','_bitmap','_q','_a','_auth','_ar')
+
     # Ensure attribute values match packet
     id = H('id')
     bitmap = H('bitmap')
@@ -479,8 +556,11 @@ class DNSHeader(object):
             Implements parse interface 
         """
         try:
-            (id,bitmap,q,a,auth,ar) = buffer.unpack("!HHHHHH")
-            return cls(id,bitmap,q,a,auth,ar)
+            # Values from struct are in range so skip property checks
+            header = cls.__new__(cls)
+            (header._id,header._bitmap,header._q,header._a,
+                    header._auth,header._ar) = buffer.unpack("!HHHHHH")
+            return header
         except (BufferError,BimapError) as e:
             raise DNSError("Error unpacking DNSHeader [offset=%d]: %s" % (
                                 buffer.offset,e))
@@ -633,13 +713,16 @@ class DNSQuestion(object):
     """
         DNSQuestion section
     """
-        
+
+    __slots__ = ('_qname','qtype','qclass')
+
     @classmethod
     def parse(cls,buffer):
         try:
-            qname = buffer.decode_name()
-            qtype,qclass = buffer.unpack("!HH")
-            return cls(qname,qtype,qclass)
+            question = cls.__new__(cls)
+            question._qname = buffer.decode_name()
+            question.qtype,question.qclass = buffer.unpack("!HH")
+            return question
         except (BufferError,BimapError) as e:
             raise DNSError("Error unpacking DNSQuestion [offset=%d]: %s" % (
                                 buffer.offset,e))
@@ -708,6 +791,8 @@ class EDNSOption(object):
 
     """
 
+    __slots__ = ('_code','_data')
+
     code = H('code')
     data = BYTES('data')
 
@@ -748,6 +833,9 @@ class RR(object):
         Contains RR header and RD (resource data) instance
     """
 
+    __slots__ = ('_rname','_rtype','_rclass','_ttl','_rdlength','rdata',
+                 'edns_len','edns_do','edns_ver','edns_rcode')
+
     rtype = H('rtype')
     rclass = H('rclass')
     ttl = I('ttl')
@@ -765,14 +853,19 @@ class RR(object):
                     code,length = option_buffer.unpack("!HH")
                     data = option_buffer.get(length)
                     options.append(EDNSOption(code,data))
-                rdata = options
+                return cls(rname,rtype,rclass,ttl,options)
+            if rdlength:
+                rdata = RDPARSE.get(rtype,RD.parse)(buffer,rdlength)
             else:
-                if rdlength:
-                    rdata = RDMAP.get(QTYPE.get(rtype),RD).parse(
-                                            buffer,rdlength)
-                else:
-                    rdata = ''
-            return cls(rname,rtype,rclass,ttl,rdata)
+                rdata = ''
+            # Values from struct/decode_name are valid so skip checks
+            rr = cls.__new__(cls)
+            rr._rname = rname
+            rr._rtype = rtype
+            rr._rclass = rclass
+            rr._ttl = ttl
+            rr.rdata = rdata
+            return rr
         except (BufferError,BimapError) as e:
             raise DNSError("Error unpacking RR [offset=%d]: %s" % (
                                 buffer.offset,e))
@@ -817,7 +910,8 @@ class RR(object):
         if self.rtype == QTYPE.OPT:
             for opt in self.rdata:
                 opt.pack(buffer)
-        else:
+        elif self.rdata not in ('',None):
+            # Empty rdata used by UPDATE meta RRs (class ANY/NONE)
             self.rdata.pack(buffer)
         end = buffer.offset
         buffer.update(rdlength_ptr,"!H",end-start)
@@ -911,6 +1005,8 @@ class EDNS0(RR):
         True
     """
 
+    __slots__ = ()
+
     def __init__(self,rname=None,rtype=QTYPE.OPT,
             ext_rcode=0,version=0,flags="",udp_len=0,opts=None):
         check_range('ext_rcode',ext_rcode,0,255)
@@ -939,16 +1035,34 @@ class RD(object):
 
         Unknown rdata types default to RD and store rdata as a binary
         blob (this allows round-trip encoding/decoding)
+
+        Subclasses should define __slots__ (records are held in large
+        numbers by zones/caches) and 'parse' can set attributes directly
+        (bypassing __init__ validation) for values which come straight
+        from the packet
+
+        Alternatively a subclass can declare a 'schema' for the wire
+        format (eg. "H priority, H weight, H port, name target") and
+        parse/pack (and __init__/fromZone/__repr__ if not defined) are
+        generated when the class is created - see dnslib.rdschema
     """
 
+    __slots__ = ('data',)
+
+    def __init_subclass__(cls,**kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'schema' in cls.__dict__:
+            compile_schema(cls,DNSError,label)
+
     @classmethod
     def parse(cls,buffer,length):
         """
             Unpack from buffer
         """
         try:
-            data = buffer.get(length)
-            return cls(data)
+            rd = cls.__new__(cls)
+            rd.data = buffer.get(length)
+            return rd
         except (BufferError,BimapError) as e:
             raise DNSError("Error unpacking RD [offset=%d]: %s" % 
                                     (buffer.offset,e))
@@ -1028,6 +1142,8 @@ class TXT(RD):
         example.com.            120     IN      TXT     "txtvers=1" "swver=2.3"
     """
 
+    __slots__ = ()
+
     @classmethod
     def parse(cls,buffer,length):
         try:
@@ -1043,7 +1159,9 @@ class TXT(RD):
                 else:
                     raise DNSError("Invalid TXT record: len(%d) > RD len(%d)" % 
                                             (txtlength,length))
-            return cls(data)
+            txt = cls.__new__(cls)
+            txt.data = data
+            return txt
         except (BufferError,BimapError) as e:
             raise DNSError("Error unpacking TXT [offset=%d]: %s" % 
                                         (buffer.offset,e))
@@ -1073,34 +1191,71 @@ class TXT(RD):
     def __repr__(self):
         return ",".join([ '"%s"' % x.decode(errors='replace') for x in self.data ])
 
+def _address_property(n):
+    """
+        'data' property for A/AAAA - the address is held packed in the
+        '_packed' slot and presented as a tuple of n byte values
+    """
+    f = lambda x : isinstance(x,int) and 0 <= x <= 255
+    def getter(obj):
+        return tuple(obj._packed)
+    def setter(obj,val):
+        if len(val) != n:
+            raise ValueError("Attribute 'data' must be tuple with %d elements [%s]" %
+                                        (n,val))
+        if not all(map(f,val)):
+            raise ValueError("Attribute 'data' elements must be between 0-255 [%s]" %
+                                        (val,))
+        obj._packed = bytes(val)
+    return property(getter,setter)
+
 class A(RD):
 
-    data = IP4('data')
+    """
+        A record - the address is held packed ('packed' - 4 bytes) and
+        'data' (tuple of ints) and the text format are derived from this
+        when needed. Accepts address as text, a tuple/list of 4 ints or
+        packed bytes
+
+        >>> a = A("192.0.2.1")
+        >>> a.data
+        (192, 0, 2, 1)
+        >>> a.packed == bytes([192,0,2,1])
+        True
+        >>> A((192,0,2,1)) == A(a.packed) == a
+        True
+        >>> A("010.0.0.1")
+        10.0.0.1
+        >>> A("192.0.2")
+        Traceback (most recent call last):
+        ...
+        ValueError: Attribute 'data' must be tuple with 4 elements [(192, 0, 2)]
+    """
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            data = buffer.unpack("!BBBB")
-            return cls(data)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking A [offset=%d]: %s" % 
-                                (buffer.offset,e))
+    __slots__ = ('_packed',)
+
+    schema = "4s packed"
+
+    data = _address_property(4)
 
     @classmethod
     def fromZone(cls,rd,origin=None):
         return cls(rd[0])
 
     def __init__(self,data):
-        if type(data) in (tuple,list):
-            self.data = tuple(data)
+        if isinstance(data,(bytes,bytearray)):
+            self.packed = data
+        elif type(data) in (tuple,list):
+            self.data = data
         else:
-            self.data = tuple(map(int,data.rstrip(".").split(".")))
-
-    def pack(self,buffer):
-        buffer.pack("!BBBB",*self.data)
+            try:
+                self._packed = socket.inet_pton(socket.AF_INET,data.rstrip("."))
+            except (OSError,ValueError):
+                # Not strict dotted quad (eg. leading zeros) or invalid
+                self.data = tuple(map(int,data.rstrip(".").split(".")))
 
     def __repr__(self):
-        return "%d.%d.%d.%d" % self.data
+        return socket.inet_ntoa(self._packed)
 
 def _parse_ipv6(a):
     """
@@ -1160,50 +1315,50 @@ def _format_ipv6(a):
 class AAAA(RD):
 
     """
-        Basic support for AAAA record - accepts IPv6 address data as either
-        a tuple of 16 bytes or in text format
+        AAAA record - accepts IPv6 address data as text, a tuple of 16
+        bytes or packed bytes. As for A the address is held packed
+        ('packed') and formatted (RFC 5952) when needed
+
+        >>> a = AAAA("2001:db8::1")
+        >>> a.data
+        (32, 1, 13, 184, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1)
+        >>> AAAA(a.data) == AAAA(a.packed) == a
+        True
+        >>> AAAA("2001:db8:0:0:1::1")
+        2001:db8::1:0:0:1
     """
  
-    data = IP6('data')
+    __slots__ = ('_packed',)
+
+    schema = "16s packed"
+
+    data = _address_property(16)
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            data = buffer.unpack("!16B")
-            return cls(data)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking AAAA [offset=%d]: %s" % 
-                                        (buffer.offset,e))
- 
     @classmethod
     def fromZone(cls,rd,origin=None):
         return cls(rd[0])
 
     def __init__(self,data):
-        if type(data) in (tuple,list):
-            self.data = tuple(data)
+        if isinstance(data,(bytes,bytearray)):
+            self.packed = data
+        elif type(data) in (tuple,list):
+            self.data = data
         else:
-            self.data = _parse_ipv6(data)
-
-    def pack(self,buffer):
-        buffer.pack("!16B",*self.data)
+            try:
+                self._packed = socket.inet_pton(socket.AF_INET6,data)
+            except (OSError,ValueError):
+                self.data = _parse_ipv6(data)
 
     def __repr__(self):
-        return _format_ipv6(self.data)
+        return socket.inet_ntop(socket.AF_INET6,self._packed)
 
 class MX(RD):
 
-    preference = H('preference')
+    __slots__ = ('_preference','_label')
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            (preference,) = buffer.unpack("!H")
-            mx = buffer.decode_name()
-            return cls(mx,preference)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking MX [offset=%d]: %s" % 
-                                        (buffer.offset,e))
+    schema = "H preference, name label"
+
+    preference = H('preference')
 
     @classmethod
     def fromZone(cls,rd,origin=None):
@@ -1224,25 +1379,16 @@ class MX(RD):
 
     label = property(get_label,set_label)
 
-    def pack(self,buffer):
-        buffer.pack("!H",self.preference)
-        buffer.encode_name(self.label)
-        
     def __repr__(self):
         return "%d %s" % (self.preference,self.label)
 
     attrs = ('preference','label')
 
 class CNAME(RD):
-        
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            label = buffer.decode_name()
-            return cls(label)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking CNAME [offset=%d]: %s" % 
-                                        (buffer.offset,e))
+
+    __slots__ = ('_label',)
+
+    schema = "name label"
 
     @classmethod
     def fromZone(cls,rd,origin=None):
@@ -1262,33 +1408,24 @@ class CNAME(RD):
 
     label = property(get_label,set_label)
 
-    def pack(self,buffer):
-        buffer.encode_name(self.label)
-
     def __repr__(self):
         return "%s" % (self.label)
 
     attrs = ('label',)
 
 class PTR(CNAME):
-    pass
+    __slots__ = ()
 
 class NS(CNAME):
-    pass
+    __slots__ = ()
 
 class SOA(RD):
-        
+
+    __slots__ = ('_mname','_rname','_times')
+
+    schema = "name mname, name rname, 5I times"
+
     times = ntuple_range('times',5,0,4294967295)
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            mname = buffer.decode_name()
-            rname = buffer.decode_name()
-            times = buffer.unpack("!IIIII")
-            return cls(mname,rname,times)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking SOA [offset=%d]: %s" % 
-                                        (buffer.offset,e))
 
     @classmethod
     def fromZone(cls,rd,origin=None):
@@ -1321,11 +1458,6 @@ class SOA(RD):
 
     rname = property(get_rname,set_rname)
 
-    def pack(self,buffer):
-        buffer.encode_name(self.mname)
-        buffer.encode_name(self.rname)
-        buffer.pack("!IIIII", *self.times)
-
     def __repr__(self):
         return "%s %s %s" % (self.mname,self.rname,
                              " ".join(map(str,self.times)))
@@ -1333,21 +1465,15 @@ class SOA(RD):
     attrs = ('mname','rname','times')
 
 class SRV(RD):
-        
+
+    __slots__ = ('_priority','_weight','_port','_target')
+
+    schema = "H priority, H weight, H port, name target"
+
     priority = H('priority')
     weight = H('weight')
     port = H('port')
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            priority,weight,port = buffer.unpack("!HHH")
-            target = buffer.decode_name()
-            return cls(priority,weight,port,target)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking SRV [offset=%d]: %s" % 
-                                        (buffer.offset,e))
-
     @classmethod
     def fromZone(cls,rd,origin=None):
         return cls(int(rd[0]),int(rd[1]),int(rd[2]),rd[3])
@@ -1369,10 +1495,6 @@ class SRV(RD):
 
     target = property(get_target,set_target)
     
-    def pack(self,buffer):
-        buffer.pack("!HHH",self.priority,self.weight,self.port)
-        buffer.encode_name(self.target)
-
     def __repr__(self):
         return "%d %d %d %s" % (self.priority,self.weight,self.port,self.target)
 
@@ -1380,25 +1502,15 @@ class SRV(RD):
 
 class NAPTR(RD):
 
+    __slots__ = ('_order','_preference','flags','service','regexp',
+                 '_replacement')
+
+    schema = ("H order, H preference, string flags, string service, "
+              "string regexp, name replacement")
+
     order = H('order')
     preference = H('preference')
 
-    @classmethod
-    def parse(cls, buffer, length):
-        try:
-            order, preference = buffer.unpack('!HH')
-            (length,) = buffer.unpack('!B')
-            flags = buffer.get(length)
-            (length,) = buffer.unpack('!B')
-            service = buffer.get(length)
-            (length,) = buffer.unpack('!B')
-            regexp = buffer.get(length)
-            replacement = buffer.decode_name()
-            return cls(order, preference, flags, service, regexp, replacement)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking NAPTR [offset=%d]: %s" % 
-                                    (buffer.offset,e))
-
     @classmethod
     def fromZone(cls,rd,origin=None):
         encode = lambda s : s.encode()
@@ -1425,16 +1537,6 @@ class NAPTR(RD):
 
     replacement = property(get_replacement,set_replacement)
 
-    def pack(self, buffer):
-        buffer.pack('!HH', self.order, self.preference)
-        buffer.pack('!B', len(self.flags))
-        buffer.append(self.flags)
-        buffer.pack('!B', len(self.service))
-        buffer.append(self.service)
-        buffer.pack('!B', len(self.regexp))
-        buffer.append(self.regexp)
-        buffer.encode_name(self.replacement)
-
     def __repr__(self):
         return '%d %d "%s" "%s" "%s" %s' %(
             self.order,self.preference,self.flags.decode(),
@@ -1447,20 +1549,14 @@ class NAPTR(RD):
 
 class DNSKEY(RD):
 
+    __slots__ = ('_flags','_protocol','_algorithm','key')
+
+    schema = "H flags, B protocol, B algorithm, base64 key"
+
     flags = H('flags')
     protocol = B('protocol')
     algorithm = B('algorithm')
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            (flags,protocol,algorithm) = buffer.unpack("!HBB")
-            key = buffer.get(length - 4)
-            return cls(flags,protocol,algorithm,key)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking DNSKEY [offset=%d]: %s" % 
-                                        (buffer.offset,e))
-
     @classmethod
     def fromZone(cls,rd,origin=None):
         return cls(int(rd[0]),int(rd[1]),int(rd[2]),
@@ -1472,10 +1568,6 @@ class DNSKEY(RD):
         self.algorithm = algorithm
         self.key = key
 
-    def pack(self,buffer):
-        buffer.pack("!HBB",self.flags,self.protocol,self.algorithm)
-        buffer.append(self.key)
-        
     def __repr__(self):
         return "%d %d %d %s" % (self.flags,self.protocol,self.algorithm,
                                 base64.b64encode(self.key).decode())
@@ -1484,6 +1576,12 @@ class DNSKEY(RD):
 
 class RRSIG(RD):
 
+    __slots__ = ('_covered','_algorithm','_labels','_orig_ttl','_sig_exp',
+                 '_sig_inc','_key_tag','name','sig')
+
+    schema = ("H covered, B algorithm, B labels, I orig_ttl, I sig_exp, "
+              "I sig_inc, H key_tag, name_nc name, base64 sig")
+
     covered = H('covered')
     algorithm = B('algorithm')
     labels = B('labels')
@@ -1492,20 +1590,6 @@ class RRSIG(RD):
     sig_inc = I('sig_inc')
     key_tag = H('key_tag')
 
-    @classmethod
-    def parse(cls,buffer,length):
-        try:
-            start = buffer.offset
-            (covered,algorithm,labels,
-                orig_ttl,sig_exp,sig_inc,key_tag) = buffer.unpack("!HBBIIIH")
-            name = buffer.decode_name()
-            sig = buffer.get(length - (buffer.offset - start))
-            return cls(covered,algorithm,labels,orig_ttl,sig_exp,sig_inc,key_tag,
-                            name,sig)
-        except (BufferError,BimapError) as e:
-            raise DNSError("Error unpacking DNSKEY [offset=%d]: %s" % 
-                                        (buffer.offset,e))
-
     @classmethod
     def fromZone(cls,rd,origin=None):
         return cls(getattr(QTYPE,rd[0]),int(rd[1]),int(rd[2]),int(rd[3]),
@@ -1526,13 +1610,6 @@ class RRSIG(RD):
         self.name = DNSLabel(name)
         self.sig = sig
 
-    def pack(self,buffer):
-        buffer.pack("!HBBIIIH",self.covered,self.algorithm,self.labels,
-                               self.orig_ttl,self.sig_exp,self.sig_inc,
-                               self.key_tag)
-        buffer.encode_name_nocompress(self.name)
-        buffer.append(self.sig)
-        
     def __repr__(self):
         timestamp_fmt = "{0.tm_year}{0.tm_mon:02}{0.tm_mday:02}{0.tm_hour:02}{0.tm_min:02}{0.tm_sec:02}"
         return "%s %d %d %d %s %s %d %s %s" % (
@@ -1564,6 +1641,8 @@ class CAA(RD):
         example.com.            60      IN      CAA     0 issue "letsencrypt.org"
     """
 
+    __slots__ = ('flags','tag','value')
+
     @classmethod
     def parse(cls,buffer,length):
         try:
@@ -1611,15 +1690,339 @@ class CAA(RD):
 
 
 
+def decode_type_bitmap(bitmap):
+    """
+        Return list of rtypes in NSEC/NSEC3 type bitmap
+
+        >>> decode_type_bitmap(encode_type_bitmap([QTYPE.A,QTYPE.MX,1234]))
+        [1, 15, 1234]
+    """
+    types = []
+    offset = 0
+    while offset + 2 <= len(bitmap):
+        window,length = bitmap[offset],bitmap[offset+1]
+        base = window << 8
+        for i,byte in enumerate(bitmap[offset+2:offset+2+length]):
+            if byte:
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        types.append(base + (i << 3) + bit)
+        offset += 2 + length
+    return types
+
+def encode_type_bitmap(rtypes):
+    """
+        Encode list of rtypes as NSEC/NSEC3 type bitmap (RFC 4034 4.1.2)
+    """
+    windows = {}
+    for rtype in rtypes:
+        window = windows.setdefault(rtype >> 8,bytearray(32))
+        window[(rtype & 0xFF) >> 3] |= 0x80 >> (rtype & 7)
+    bitmap = bytearray()
+    for w,bits in sorted(windows.items()):
+        bits = bits.rstrip(b'\x00')
+        bitmap += bytes([w,len(bits)]) + bits
+    return bytes(bitmap)
+
+def _type_name(rtype):
+    # RFC 3597 'TYPEnnn' for unknown types
+    return QTYPE.forward.get(rtype) or "TYPE%d" % rtype
+
+def _type_code(name):
+    if name.upper().startswith("TYPE") and name[4:].isdigit():
+        return int(name[4:])
+    return getattr(QTYPE,name.upper())
+
+class TypeBitmap(FieldCodec):
+    """
+        NSEC/NSEC3 type bitmap (remaining rdata) - held as wire format
+        bytes (use decode_type_bitmap for the list of rtypes)
+    """
+
+    trailing = True
+
+    def parse(self,buffer,end):
+        if buffer.offset > end:
+            raise BufferError("Invalid rdata length [offset=%d,end=%d]" %
+                                        (buffer.offset,end))
+        return buffer.get(end - buffer.offset)
+
+    def pack(self,buffer,value):
+        buffer.append(value)
+
+    def fromZone(self,tokens):
+        return encode_type_bitmap([ _type_code(t) for t in tokens ])
+
+    def toZone(self,value):
+        return " ".join([ _type_name(t) for t in decode_type_bitmap(value) ])
+
+add_codec('typebitmap',TypeBitmap())
+
+SVCB_KEYS = Bimap('SVCB_KEYS',
+                {0:'mandatory', 1:'alpn', 2:'no-default-alpn', 3:'port',
+                 4:'ipv4hint', 5:'ech', 6:'ipv6hint'},
+                DNSError)
+
+class SvcParams(FieldCodec):
+    """
+        SVCB/HTTPS SvcParams (RFC 9460) - held as tuple of (key,value)
+        with values in wire format
+
+        >>> p = SvcParams()
+        >>> params = p.fromZone(['port=8443','alpn=','h2,h3',
+        ...                      'ipv6hint=2001:db8::1','mandatory=alpn'])
+        >>> params[2]
+        (3, b' \\xfb')
+        >>> p.toZone(params)
+        'mandatory=alpn alpn="h2,h3" port=8443 ipv6hint=2001:db8::1'
+        >>> p.toZone(p.fromZone(['no-default-alpn','key65000="a b"',
+        ...                      'ipv4hint=192.0.2.1,192.0.2.2']))
+        'no-default-alpn ipv4hint=192.0.2.1,192.0.2.2 key65000="a b"'
+
+        Values which can't be decoded (eg. a 1-byte port) are rejected
+
+        >>> p.parse(Buffer(b'\\x00\\x03\\x00\\x01\\x01'),5)
+        Traceback (most recent call last):
+        ...
+        dnslib.buffer.BufferError: Invalid SvcParam value [key=port,length=1]
+    """
+
+    trailing = True
+
+    def parse(self,buffer,end):
+        params = []
+        while buffer.offset < end:
+            key,length = buffer.unpack("!HH")
+            data = buffer.get(length)
+            if not self.valid_value(key,data):
+                raise BufferError("Invalid SvcParam value [key=%s,length=%d]" %
+                                        (self.key_name(key),length))
+            params.append((key,data))
+        if buffer.offset > end:
+            raise BufferError("Invalid SvcParams length [offset=%d,end=%d]" %
+                                        (buffer.offset,end))
+        return tuple(params)
+
+    def valid_value(self,key,data):
+        # Check value can be decoded by format_value (RFC 9460 Section 7)
+        if key == 0:
+            return len(data) > 0 and len(data) % 2 == 0
+        elif key == 1:
+            i = 0
+            while i < len(data):
+                if data[i] == 0:
+                    return False
+                i += data[i] + 1
+            return len(data) > 0 and i == len(data)
+        elif key == 2:
+            return len(data) == 0
+        elif key == 3:
+            return len(data) == 2
+        elif key == 4:
+            return len(data) > 0 and len(data) % 4 == 0
+        elif key == 6:
+            return len(data) > 0 and len(data) % 16 == 0
+        return True
+
+    def pack(self,buffer,value):
+        for key,data in value:
+            buffer.pack("!HH",key,len(data))
+            buffer.append(data)
+
+    def key_code(self,name):
+        if name.startswith("key") and name[3:].isdigit():
+            return int(name[3:])
+        return getattr(SVCB_KEYS,name)
+
+    def encode_value(self,key,value):
+        if key == 0:
+            return b"".join([ struct.pack("!H",self.key_code(k))
+                                    for k in sorted(value.split(","),
+                                                    key=self.key_code) ])
+        elif key == 1:
+            return b"".join([ bytes([len(a)]) + a.encode()
+                                    for a in value.split(",") ])
+        elif key == 3:
+            return struct.pack("!H",int(value))
+        elif key == 4:
+            return b"".join([ socket.inet_aton(a) for a in value.split(",") ])
+        elif key == 5:
+            return base64.b64decode(value.encode())
+        elif key == 6:
+            return b"".join([ socket.inet_pton(socket.AF_INET6,a)
+                                    for a in value.split(",") ])
+        else:
+            return re.sub(rb"\\(\d{3})",lambda m: bytes([int(m.group(1))]),
+                          value.encode())
+
+    def format_value(self,key,data):
+        if key == 0:
+            return ",".join([ self.key_name(k) for (k,) in
+                                        struct.iter_unpack("!H",data) ])
+        elif key == 1:
+            alpn = []
+            buffer = Buffer(data)
+            while buffer.remaining():
+                (n,) = buffer.unpack("!B")
+                alpn.append(buffer.get(n).decode(errors="replace"))
+            return '"%s"' % ",".join(alpn)
+        elif key == 3:
+            return "%d" % struct.unpack("!H",data)
+        elif key == 4:
+            return ",".join([ socket.inet_ntoa(data[i:i+4])
+                                    for i in range(0,len(data),4) ])
+        elif key == 5:
+            return base64.b64encode(data).decode()
+        elif key == 6:
+            return ",".join([ socket.inet_ntop(socket.AF_INET6,data[i:i+16])
+                                    for i in range(0,len(data),16) ])
+        else:
+            return '"%s"' % "".join([ chr(c) if 32 <= c < 127 and c not in b'"\\'
+                                        else "\\%03d" % c for c in data ])
+
+    def key_name(self,key):
+        return SVCB_KEYS.forward.get(key) or "key%d" % key
+
+    def fromZone(self,tokens):
+        params = {}
+        tokens = list(tokens)
+        while tokens:
+            key,_,value = tokens.pop(0).partition("=")
+            if _ and not value and tokens:
+                # Quoted value is split into a separate token by the lexer
+                value = tokens.pop(0)
+            code = self.key_code(key)
+            params[code] = self.encode_value(code,value.strip('"'))
+        return tuple(sorted(params.items()))
+
+    def toZone(self,value):
+        return " ".join([ self.key_name(key) if key == 2 else
+                          "%s=%s" % (self.key_name(key),
+                                     self.format_value(key,data))
+                                for key,data in value ])
+
+add_codec('svcparams',SvcParams())
+
+class DS(RD):
+    """
+        DS record (RFC 4034)
+
+        >>> DS.fromZone("60485 5 1 2BB183AF5F22588179A53B0A98631FAD1A292118".split())
+        60485 5 1 2BB183AF5F22588179A53B0A98631FAD1A292118
+    """
+
+    __slots__ = ('_key_tag','_algorithm','_digest_type','_digest')
+
+    schema = "H key_tag, B algorithm, B digest_type, hex digest"
+
+class NSEC(RD):
+    """
+        NSEC record (RFC 4034)
+
+        >>> r = NSEC.fromZone("host.example.com. A MX RRSIG NSEC TYPE1234".split())
+        >>> r
+        host.example.com. A MX RRSIG NSEC TYPE1234
+        >>> r.types
+        [1, 15, 46, 47, 1234]
+    """
+
+    __slots__ = ('_next','bitmap')
+
+    schema = "name_nc next, typebitmap bitmap"
+
+    types = property(lambda self: decode_type_bitmap(self.bitmap))
+
+class NSEC3(RD):
+    """
+        NSEC3 record (RFC 5155)
+
+        >>> NSEC3.fromZone("1 1 12 AABBCCDD 2T7B4G4VSA5SMI47K61MV5BV1A22BOJR A RRSIG".split())
+        1 1 12 AABBCCDD 2T7B4G4VSA5SMI47K61MV5BV1A22BOJR A RRSIG
+    """
+
+    __slots__ = ('_hash_alg','_flags','_iterations','salt','next','bitmap')
+
+    schema = ("B hash_alg, B flags, H iterations, hexstring salt, "
+              "b32string next, typebitmap bitmap")
+
+    types = property(lambda self: decode_type_bitmap(self.bitmap))
+
+class NSEC3PARAM(RD):
+    """
+        NSEC3PARAM record (RFC 5155)
+
+        >>> NSEC3PARAM.fromZone("1 0 0 -".split())
+        1 0 0 -
+    """
+
+    __slots__ = ('_hash_alg','_flags','_iterations','salt')
+
+    schema = "B hash_alg, B flags, H iterations, hexstring salt"
+
+class TLSA(RD):
+    """
+        TLSA record (RFC 6698)
+
+        >>> TLSA.fromZone("3 1 1 0C72AC70B745AC19998811B131D662C9 AC69DBDBE7CB23E5B514B56664C5D3D6".split())
+        3 1 1 0C72AC70B745AC19998811B131D662C9AC69DBDBE7CB23E5B514B56664C5D3D6
+    """
+
+    __slots__ = ('_usage','_selector','_mtype','_cert')
+
+    schema = "B usage, B selector, B mtype, hex cert"
+
+class SVCB(RD):
+    """
+        SVCB record (RFC 9460) - 'params' is a tuple of (key,value) with
+        values in wire format (see SvcParams)
+
+        >>> r = DNSRecord.question("example.com","HTTPS").reply()
+        >>> r.add_answer(*RR.fromZone('example.com. 300 IN HTTPS 1 . alpn="h2,h3" ipv4hint=192.0.2.1'))
+        >>> r.add_answer(*RR.fromZone('example.com. 300 IN HTTPS 0 svc.example.net.'))
+        >>> print(r)
+        ;; ->>HEADER<<- opcode: QUERY, status: NOERROR, id: ...
+        ;; flags: qr aa rd ra; QUERY: 1, ANSWER: 2, AUTHORITY: 0, ADDITIONAL: 0
+        ;; QUESTION SECTION:
+        ;example.com.                   IN      HTTPS
+        ;; ANSWER SECTION:
+        example.com.            300     IN      HTTPS   1 . alpn="h2,h3" ipv4hint=192.0.2.1
+        example.com.            300     IN      HTTPS   0 svc.example.net.
+        >>> DNSRecord.parse(r.pack()) == r
+        True
+    """
+
+    __slots__ = ('_priority','_target','params')
+
+    schema = "H priority, name_nc target, svcparams params"
+
+class HTTPS(SVCB):
+    __slots__ = ()
+
+
 
 # Map from RD type to class (used to pack/unpack records)
-# If you add a new RD class you must add to RDMAP
+# If you add a new RD class you must add to RDMAP (use add_rdtype so that
+# RDPARSE is also updated)
 
 RDMAP = { 'CNAME':CNAME, 'A':A, 'AAAA':AAAA, 'TXT':TXT, 'MX':MX, 
           'PTR':PTR, 'SOA':SOA, 'NS':NS, 'NAPTR': NAPTR, 'SRV':SRV,
-          'DNSKEY':DNSKEY, 'RRSIG':RRSIG, 'CAA':CAA
+          'DNSKEY':DNSKEY, 'RRSIG':RRSIG, 'CAA':CAA, 'DS':DS,
+          'NSEC':NSEC, 'NSEC3':NSEC3, 'NSEC3PARAM':NSEC3PARAM, 'TLSA':TLSA,
+          'SVCB':SVCB, 'HTTPS':HTTPS
         }
 
+# Map from integer rtype to RD parse function (used by RR.parse - avoids
+# the rtype->name->class lookup for each record)
+
+RDPARSE = dict([ (getattr(QTYPE,k),v.parse) for k,v in RDMAP.items() ])
+
+def add_rdtype(rtype,cls):
+    """
+        Register RD class for rtype (QTYPE name)
+    """
+    RDMAP[rtype] = cls
+    RDPARSE[getattr(QTYPE,rtype)] = cls.parse
+
 ##
 ## Zone parser
 ## TODO  - ideally this would be in a separate file but have to deal 
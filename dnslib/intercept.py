@@ -42,16 +42,17 @@ class InterceptResolver(BaseResolver):
             if i == '-':
                 i = sys.stdin.read()
             for rr in RR.fromZone(i,ttl=self.ttl):
-                self.zone.append((rr.rname,QTYPE[rr.rtype],rr))
+                self.zone.append((rr.rname,rr.rtype,rr))
 
     def resolve(self,request,handler):
         reply = request.reply()
         qname = request.q.qname
-        qtype = QTYPE[request.q.qtype]
+        qtype = request.q.qtype
         # Try to resolve locally unless on skip list
         if not any([qname.matchGlob(s) for s in self.skip]):
             for name,rtype,rr in self.zone:
-                if qname.matchGlob(name) and (qtype in (rtype,'ANY','CNAME')):
+                if qname.matchGlob(name) and \
+                        (qtype in (rtype,QTYPE.ANY,QTYPE.CNAME)):
                     a = copy.copy(rr)
                     a.rname = qname
                     reply.add_answer(a)
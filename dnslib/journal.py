@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Journal - append-only log of zone changes
+
+    Each change (an applied UPDATE) is written as a single frame:
+
+        "!I"        length of frame data
+        <name>      zone origin (wire format)
+        "!IIHH"     serial before, serial after, number of deleted RRs,
+                    number of added RRs
+        <RRs>       deleted RRs followed by added RRs (wire format)
+
+    Frames are written with a single write and flushed/fsync'd before
+    append returns, so after a crash the journal contains every
+    acknowledged change plus at most one partial frame which is
+    discarded (and truncated) when the journal is next opened.
+
+    The journal is replayed on startup to recover changes made since
+    the zone file was loaded and is used to serve IXFR.
+
+    >>> import os,tempfile
+    >>> from dnslib import RR
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> j = Journal(path)
+    >>> j.append("abc.com",1,2,RR.fromZone("a.abc.com. 60 A 1.2.3.4"),
+    ...                        RR.fromZone("a.abc.com. 60 A 5.6.7.8"))
+    >>> j.append("abc.com",2,3,[],RR.fromZone("b.abc.com. 60 TXT xxx"))
+    >>> for origin,serial_from,serial_to,deleted,added in j:
+    ...     print(origin,serial_from,serial_to,len(deleted),len(added))
+    abc.com. 1 2 1 1
+    abc.com. 2 3 0 1
+    >>> with open(path,'ab') as f:
+    ...     _ = f.write(b'\\x00\\x00\\x01\\x00partial')
+    >>> j = Journal(path)
+    >>> len(list(j))
+    2
+    >>> os.path.getsize(path) == j.offset
+    True
+    >>> [ (serial_from,serial_to) for _,serial_from,serial_to,_,_ in j.changes("abc.com",2) ]
+    [(2, 3)]
+    >>> j.changes("abc.com",9) is None
+    True
+    >>> os.remove(path)
+"""
+
+from __future__ import print_function
+
+import os,struct
+
+from dnslib.dns import RR
+from dnslib.label import DNSLabel,DNSBuffer
+
+class Journal(object):
+
+    """
+        Append-only journal of zone changes
+    """
+
+    def __init__(self,path,sync=True):
+        """
+            path:   journal file (created if it doesn't exist)
+            sync:   fsync after each append (default: True)
+        """
+        self.path = path
+        self.sync = sync
+        self.offset = 0
+        # Scan to end of last complete frame and drop any partial frame
+        for _ in self:
+            pass
+        with open(self.path,'ab') as f:
+            if f.tell() != self.offset:
+                f.truncate(self.offset)
+
+    def append(self,origin,serial_from,serial_to,deleted,added):
+        """
+            Append change to journal
+        """
+        buffer = DNSBuffer()
+        buffer.encode_name(DNSLabel(origin))
+        buffer.pack("!IIHH",serial_from,serial_to,len(deleted),len(added))
+        for rr in deleted:
+            rr.pack(buffer)
+        for rr in added:
+            rr.pack(buffer)
+        frame = struct.pack("!I",len(buffer.data)) + bytes(buffer.data)
+        with open(self.path,'ab') as f:
+            f.write(frame)
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+        self.offset += len(frame)
+
+    def __iter__(self):
+        """
+            Iterate over changes - yields (origin,serial_from,serial_to,
+            deleted,added) tuples
+        """
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path,'rb') as f:
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    break
+                (length,) = struct.unpack("!I",header)
+                data = f.read(length)
+                if len(data) < length:
+                    break
+                offset += 4 + length
+                self.offset = max(self.offset,offset)
+                yield self.parse(data)
+
+    def parse(self,data):
+        buffer = DNSBuffer(data)
+        origin = buffer.decode_name()
+        serial_from,serial_to,ndeleted,nadded = buffer.unpack("!IIHH")
+        deleted = [ RR.parse(buffer) for i in range(ndeleted) ]
+        added = [ RR.parse(buffer) for i in range(nadded) ]
+        return (origin,serial_from,serial_to,deleted,added)
+
+    def changes(self,origin,serial):
+        """
+            Return list of changes to zone from serial to the latest
+            journalled serial or None if the journal doesn't contain
+            an unbroken sequence of changes starting at serial
+        """
+        changes = []
+        for change in self:
+            if change[0] == origin and change[1] == serial:
+                changes.append(change)
+                serial = change[2]
+        return changes or None
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -8,8 +8,7 @@ from __future__ import print_function
 
 import fnmatch
 
-from dnslib.bit import get_bits,set_bits
-from dnslib.buffer import Buffer, BufferError
+from dnslib.buffer import Buffer, BufferError, get_struct
 
 class DNSLabelError(Exception):
     pass
@@ -60,6 +59,9 @@ class DNSLabel(object):
     # True
 
     """
+
+    __slots__ = ('label',)
+
     def __init__(self,label):
         """
             Create DNS label instance 
@@ -138,6 +140,42 @@ class DNSLabel(object):
     def __len__(self):
         return len(b'.'.join(self.label))
 
+# Maximum compression pointers followed when decoding a name
+MAX_POINTERS = 64
+
+# Encoded label lengths/pointers
+LENGTH_BYTES = [ get_struct("!B").pack(i) for i in range(64) ]
+POINTER = get_struct("!H")
+
+# Decoded labels are interned (so names in a packet/cache share label
+# objects) - the table is bounded as labels come from the network
+MAX_INTERNED = 16384
+_interned = {}
+
+def intern_label(label):
+    """
+        Return interned (bytes) label - labels must be valid UTF-8
+
+        >>> intern_label(bytearray(b"abc")) is intern_label(b"abc")
+        True
+        >>> intern_label(b"\\xff")
+        Traceback (most recent call last):
+        ...
+        dnslib.buffer.BufferError: Invalid label <b'\\xff'>
+    """
+    if type(label) is not bytes:
+        label = bytes(label)
+    interned = _interned.get(label)
+    if interned is not None:
+        return interned
+    try:
+        label.decode()
+    except UnicodeDecodeError:
+        raise BufferError("Invalid label <%s>" % label)
+    if len(_interned) < MAX_INTERNED:
+        _interned[label] = label
+    return label
+
 class DNSBuffer(Buffer):
 
     """
@@ -195,79 +233,146 @@ class DNSBuffer(Buffer):
     aaa.bbb.ccc.
     >>> print(b.decode_name())
     aaa.bbb.ccc.
+
+    Compression is case-insensitive (the original case is kept for the
+    first occurrence)
+
+    >>> b = DNSBuffer()
+    >>> b.encode_name(b'www.example.com')
+    >>> b.encode_name(b'WWW.Example.COM')
+    >>> b.encode_name(b'mail.EXAMPLE.com')
+    >>> len(b)
+    26
+    >>> b.offset = 0
+    >>> [ str(b.decode_name()) for i in range(3) ]
+    ['www.example.com.', 'www.example.com.', 'mail.example.com.']
+
+    Pointer loops and forward pointers are rejected
+
+    >>> DNSBuffer(b"\\x01a\\xc0\\x00").decode_name()
+    Traceback (most recent call last):
+    ...
+    dnslib.buffer.BufferError: Recursive pointer in DNSLabel [offset=2,pointer=0,length=4]
+    >>> DNSBuffer(b"\\x01a\\xc0\\x04\\x00").decode_name()
+    Traceback (most recent call last):
+    ...
+    dnslib.buffer.BufferError: Invalid pointer in DNSLabel [offset=2,pointer=4,length=5]
     """
 
     def __init__(self,data=b''):
         """
-            Add 'names' dict to cache stored labels
+            Add 'names' dict to cache stored labels (and 'decoded' dict
+            to cache decoded labels by offset)
         """
         super(DNSBuffer,self).__init__(data)
         self.names = {}
+        self.decoded = {}
 
-    def decode_name(self,last=-1):
+    def decode_name(self):
         """
             Decode label at current offset in buffer (following pointers
             to cached elements where necessary)
+
+            Names are decoded iteratively - the labels found at each
+            offset are cached for the buffer so names compressed against
+            a suffix which has already been seen aren't decoded again.
+            Pointers must point backwards, can't revisit an offset and
+            at most MAX_POINTERS are followed.
         """
-        label = []
-        done = False
-        while not done:
-            (length,) = self.unpack("!B")
-            if get_bits(length,6,2) == 3:
+        data = self.data
+        decoded = self.decoded
+        offset = self.offset
+        labels = []
+        segment = []        # (offset,index) of labels before next pointer
+        entries = []        # (offset,index,end) to add to cache
+        pointers = []
+        end = None
+        while True:
+            cached = decoded.get(offset)
+            if cached is not None:
+                suffix,segment_end = cached
+                break
+            if offset >= len(data):
+                raise BufferError("Not enough bytes [offset=%d,remaining=0,requested=1]" %
+                        offset)
+            length = data[offset]
+            if length >= 0xC0:
                 # Pointer
-                self.offset -= 1
-                pointer = get_bits(self.unpack("!H")[0],0,14)
-                save = self.offset
-                if last == save:
-                    raise BufferError("Recursive pointer in DNSLabel [offset=%d,pointer=%d,length=%d]" % 
-                            (self.offset,pointer,len(self.data)))
-                if pointer < self.offset:
-                    self.offset = pointer
-                else:
+                if offset + 2 > len(data):
+                    raise BufferError("Not enough bytes [offset=%d,remaining=1,requested=2]" %
+                            offset)
+                pointer = (length & 0x3F) << 8 | data[offset+1]
+                if pointer >= offset:
                     # Pointer can't point forwards
-                    raise BufferError("Invalid pointer in DNSLabel [offset=%d,pointer=%d,length=%d]" % 
-                            (self.offset,pointer,len(self.data)))
-                label.extend(self.decode_name(save).label)
-                self.offset = save
-                done = True
+                    raise BufferError("Invalid pointer in DNSLabel [offset=%d,pointer=%d,length=%d]" %
+                            (offset,pointer,len(data)))
+                if pointer in pointers or len(pointers) >= MAX_POINTERS:
+                    raise BufferError("Recursive pointer in DNSLabel [offset=%d,pointer=%d,length=%d]" %
+                            (offset,pointer,len(data)))
+                pointers.append(pointer)
+                segment_end = offset + 2
+                entries.extend([ (o,i,segment_end) for o,i in segment ])
+                segment = []
+                if end is None:
+                    end = segment_end
+                offset = pointer
+            elif length == 0:
+                suffix = ()
+                segment_end = offset + 1
+                break
             else:
-                if length > 0:
-                    l = self.get(length)
-                    try:
-                        l.decode()
-                    except UnicodeDecodeError:
-                        raise BufferError("Invalid label <%s>" % l)
-                    label.append(l)
-                else:
-                    done = True
-        return DNSLabel(label)
+                start = offset + 1
+                offset = start + length
+                if offset > len(data):
+                    raise BufferError("Not enough bytes [offset=%d,remaining=%d,requested=%d]" %
+                            (start,len(data) - start,length))
+                segment.append((start - 1,len(labels)))
+                labels.append(intern_label(data[start:offset]))
+        entries.extend([ (o,i,segment_end) for o,i in segment ])
+        labels = tuple(labels) + suffix if labels else suffix
+        for o,i,e in entries:
+            decoded[o] = (labels[i:],e)
+        self.offset = segment_end if end is None else end
+        name = DNSLabel.__new__(DNSLabel)
+        name.label = labels
+        return name
 
     def encode_name(self,name):
         """
             Encode label and store at end of buffer (compressing
             cached elements where needed) and store elements
             in 'names' dict
+
+            Compression is case-insensitive (RFC 1035 4.1.4) and the
+            encoded name is appended in a single write
         """
         if not isinstance(name,DNSLabel):
             name = DNSLabel(name)
-        if len(name) > 253:
+        parts = []
+        for element in name.label:
+            if len(element) > 63:
+                raise DNSLabelError("Label component too long: %r" % element)
+            parts.append(LENGTH_BYTES[len(element)])
+            parts.append(element)
+        wire = b''.join(parts)
+        if len(wire) > 254:
             raise DNSLabelError("Domain label too long: %r" % name)
-        name = list(name.label)
-        while name:
-            if tuple(name) in self.names:
-                # Cached - set pointer
-                pointer = self.names[tuple(name)]
-                pointer = set_bits(pointer,3,14,2)
-                self.pack("!H",pointer)
+        # Suffixes are keyed by lowercase wire format (length bytes are
+        # < 64 so aren't changed by lower())
+        key = wire.lower()
+        names = self.names
+        offset = self.offset
+        pos = 0
+        while pos < len(key):
+            pointer = names.get(key[pos:])
+            if pointer is not None:
+                self.append(wire[:pos] + POINTER.pack(0xC000 | pointer))
                 return
-            else:
-                self.names[tuple(name)] = self.offset
-                element = name.pop(0)
-                if len(element) > 63:
-                    raise DNSLabelError("Label component too long: %r" % element)
-                self.pack("!B",len(element))
-                self.append(element)
-        self.append(b'\x00')
+            if offset + pos < 0x4000:
+                # Pointers can only reference first 16K
+                names[key[pos:]] = offset + pos
+            pos += key[pos] + 1
+        self.append(wire + b'\x00')
 
     def encode_name_nocompress(self,name):
         """
@@ -278,14 +383,14 @@ class DNSBuffer(Buffer):
             name = DNSLabel(name)
         if len(name) > 253:
             raise DNSLabelError("Domain label too long: %r" % name)
-        name = list(name.label)
-        while name:
-            element = name.pop(0)
+        parts = []
+        for element in name.label:
             if len(element) > 63:
                 raise DNSLabelError("Label component too long: %r" % element)
-            self.pack("!B",len(element))
-            self.append(element)
-        self.append(b'\x00')
+            parts.append(LENGTH_BYTES[len(element)])
+            parts.append(element)
+        parts.append(b'\x00')
+        self.append(b''.join(parts))
 
 if __name__ == '__main__':
     import doctest
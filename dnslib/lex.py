@@ -2,7 +2,7 @@
 
 from __future__ import print_function
 
-import collections,string
+import collections,operator,re,string
 
 try:
     from StringIO import StringIO
@@ -154,6 +154,19 @@ class WordLexer(Lexer):
         >>> l = WordLexer("abc# a comment")
         >>> list(l)
         [('ATOM', 'abc'), ('COMMENT', 'a comment')]
+
+        Input is tokenised a line at a time using str.split for lines
+        which only contain words/spaces and compiled regexes otherwise
+        (quotes/escapes/comments). The char-at-a-time state methods
+        (lexSpace etc.) give the same tokens and are used if a subclass
+        overrides them or debug is set
+
+        >>> l = WordLexer('www  A 1.2.3.4 ; comment\\n\\n  "a b" c\\n')
+        >>> l.commentchars = ';'
+        >>> l.nltok = ('NL',None)
+        >>> l.spacetok = ('SPACE',None)
+        >>> list(l)
+        [('ATOM', 'www'), ('SPACE', None), ('ATOM', 'A'), ('SPACE', None), ('ATOM', '1.2.3.4'), ('SPACE', None), ('COMMENT', 'comment'), ('NL', None), ('SPACE', None), ('ATOM', 'a b'), ('SPACE', None), ('ATOM', 'c'), ('NL', None)]
     """
 
     wordchars = set(string.ascii_letters) | set(string.digits) | \
@@ -165,6 +178,235 @@ class WordLexer(Lexer):
     spacetok = None
     nltok = None
 
+    # Compiled tables for each set of word/space/quote/comment/nl chars
+    _tables = {}
+
+    # Methods which (if overridden) require the char-at-a-time lexer
+    _statemethods = ('lexStart','lexSpace','lexNL','lexComment','lexWord',
+                     'lexQuote','readescaped','read','peek','next_token')
+
+    def parse(self):
+        cls = type(self)
+        if self.debug or '\n' not in self.nlchars or \
+                getattr(self.state,'__func__',None) is not cls.lexStart or \
+                any([ getattr(cls,m) is not getattr(WordLexer,m)
+                                for m in self._statemethods ]):
+            return super(WordLexer,self).parse()
+        return self.scan()
+
+    def tables(self):
+        # Tables are cached by char set (and by the set objects themselves
+        # to avoid hashing wordchars for each lexer - modifying one of the
+        # class sets in place isn't detected, assign a new set instead)
+        objs = (self.wordchars,self.spacechars,self.quotechars,
+                self.commentchars,self.nlchars,self.escape_chars)
+        cached = self._tables.get(tuple(map(id,objs)))
+        if cached and all(map(operator.is_,cached[0],objs)):
+            return cached[1]
+        key = tuple([ frozenset(x) for x in (self.wordchars,self.spacechars,
+                                             self.quotechars,self.commentchars,
+                                             self.nlchars) ]) + \
+                (self.escape_chars,
+                 '' not in self.spacechars and
+                 any([ '' in x for x in (self.nlchars,self.commentchars,
+                                         self.quotechars,self.wordchars) ]))
+        t = self._tables.get(key)
+        if t is None:
+            chars = lambda c : "[%s]" % "".join([ re.escape(x)
+                                                    for x in sorted(c) ])
+            # Word ends at '"', comment chars or whitespace (see lexWord)
+            word = set([ c for c in self.wordchars if c != '"' and
+                                c not in self.commentchars and not c.isspace() ])
+            fast = word - set(self.quotechars)
+            fast_ok = all([ c.isspace() for c in self.spacechars ])
+            t = { 'space': re.compile(chars(self.spacechars) + "*").match,
+                  'nl': re.compile(chars(self.nlchars) + "+").match,
+                  'word': re.compile(chars(word) + "*").match if word else None,
+                  # Line with only words and spaces (str.split)
+                  'fast': re.compile(chars(fast | set(self.spacechars)) +
+                                     "*\n?\\Z").match if fast_ok and fast
+                                                       else None,
+                  'quote': {},
+                  # Trailing space at end of input is only emitted if ''
+                  # (ie. eof) matches one of the next-state checks in
+                  # lexSpace (eg. commentchars is a string)
+                  'eof_space': key[-1] }
+            for q in self.quotechars:
+                t['quote'][q] = re.compile(chars(set(q) |
+                                                 set(self.escape_chars))).search
+            t['quote']['"'] = re.compile(chars(set('"') |
+                                               set(self.escape_chars))).search
+            self._tables[key] = t
+        if len(self._tables) > 256:
+            self._tables.clear()
+        self._tables[tuple(map(id,objs))] = (objs,t)
+        return t
+
+    def lines(self):
+        pending = "".join(self.q)
+        self.q.clear()
+        f = self.f if hasattr(self.f,'readline') else StringIO(self.f.read())
+        for line in iter(f.readline,''):
+            if pending:
+                line,pending = pending + line,''
+            yield line
+        if pending:
+            yield pending
+        self.eof = True
+        self.state = None
+
+    def scan(self):
+        """
+            Generator returning tokens (same as the lexXXX states) for
+            input split into lines
+        """
+        t = self.tables()
+        space,nlrun,word,fast = t['space'],t['nl'],t['word'],t['fast']
+        eof_space = t['eof_space']
+        spacechars,nlchars = self.spacechars,self.nlchars
+        commentchars,quotechars = self.commentchars,self.quotechars
+        wordchars = self.wordchars
+        sp,nl = self.spacetok,self.nltok
+        lines = self.lines()
+        in_nl = False
+        base = 0
+        for text in lines:
+            n = len(text)
+            pos = 0
+            if in_nl:
+                # Continuation of newline run
+                pos = nlrun(text).end() if text[0] in nlchars else 0
+                if pos == n:
+                    base += n
+                    continue
+                in_nl = False
+            if pos == 0 and fast and fast(text):
+                # Only words/spaces - str.split
+                eol = text[-1] == '\n'
+                content = text[:-1] if eol else text
+                words = content.split()
+                if sp:
+                    if words:
+                        toks = [ x for w in words for x in (sp,('ATOM',w)) ]
+                        if content[0] not in spacechars:
+                            del toks[0]
+                        if content[-1] in spacechars and (eol or eof_space):
+                            toks.append(sp)
+                    else:
+                        toks = [sp] if content and (eol or eof_space) else []
+                else:
+                    toks = [ ('ATOM',w) for w in words ]
+                if eol:
+                    if nl:
+                        toks.append(nl)
+                    in_nl = True
+                yield from toks
+                base += n
+                continue
+            while True:
+                m = space(text,pos)
+                s = sp and m.end() > pos
+                pos = m.end()
+                if pos >= n:
+                    # End of input (lines only end without '\n' at eof)
+                    if s and eof_space:
+                        yield sp
+                    break
+                c = text[pos]
+                if c in nlchars:
+                    if s:
+                        yield sp
+                    pos = nlrun(text,pos).end()
+                    if nl:
+                        yield nl
+                    if pos >= n:
+                        in_nl = True
+                        break
+                elif c in commentchars:
+                    if s:
+                        yield sp
+                    end = text.find('\n',pos + 1)
+                    comment = text[pos+1:end if end >= 0 else n]\
+                                        .lstrip(string.whitespace)
+                    if comment:
+                        yield ('COMMENT',comment)
+                    if end < 0:
+                        break
+                    pos = nlrun(text,end).end()
+                    if nl:
+                        yield nl
+                    if pos >= n:
+                        in_nl = True
+                        break
+                elif c in quotechars:
+                    if s:
+                        yield sp
+                    tok,text,pos = self.scanquote(t,text,pos,lines)
+                    n = len(text)
+                    yield tok
+                elif c in wordchars:
+                    if s:
+                        yield sp
+                    # Word followed by an invalid char raises before the
+                    # word is returned (as lexWord)
+                    end = word(text,pos).end() if word else pos
+                    c = text[end] if end < n else ''
+                    if c and c != '"' and \
+                            not (c in commentchars or c.isspace()):
+                        raise ValueError('Invalid input [%d]: %s' % (
+                                                base + end + 1,c))
+                    if end > pos:
+                        yield ('ATOM',text[pos:end])
+                    pos = end
+                    if c == '"':
+                        tok,text,pos = self.scanquote(t,text,pos,lines)
+                        n = len(text)
+                        yield tok
+                else:
+                    raise ValueError("Invalid input [%d]: %s" % (
+                                                base + pos + 1,c))
+            base += n
+
+    def scanquote(self,t,text,pos,lines):
+        """
+            Quoted string starting at text[pos] (reads further lines if
+            needed) - returns (token,text,end position)
+        """
+        q = text[pos]
+        stop = t['quote'][q]
+        s = []
+        i = pos + 1
+        while True:
+            m = stop(text,i)
+            if m is None:
+                more = next(lines,None)
+                if more is None:
+                    # Unterminated quote - rest of input
+                    s.append(text[i:])
+                    return (('ATOM',''.join(s)),text,len(text))
+                text += more
+                continue
+            k = m.start()
+            s.append(text[i:k])
+            if text[k] in self.escape_chars:
+                while len(text) < k + 4:
+                    more = next(lines,None)
+                    if more is None:
+                        break
+                    text += more
+                n = text[k+1:k+4]
+                if n.isdigit():
+                    s.append(chr(int(n,8)))
+                    i = k + 1 + len(n)
+                elif n[0] in 'x':
+                    s.append(chr(int(n[1:],16)))
+                    i = k + 1 + len(n)
+                else:
+                    s.append(self.escape.get(n[0],n[0]))
+                    i = k + 2
+            else:
+                return (('ATOM',''.join(s)),text,k + 1)
+
     def lexStart(self):
         return (None,self.lexSpace)
 
@@ -0,0 +1,655 @@
+# -*- coding: utf-8 -*-
+
+"""
+    DNS load generator - replay queries from a packet capture (pcap or
+    pcapng) or a list of names against a server and report throughput,
+    loss and latency
+
+    Usage: python -m dnslib.loadgen [options] <file>
+
+    Queries are read from:
+
+        - pcap/pcapng captures (Ethernet/Linux SLL/raw IP/loopback link
+          types, including the files written by CaptureLogger) - DNS
+          queries to '--port' over UDP (or TCP) are extracted with their
+          original timing
+        - text files with one '<name> [<type>]' per line
+
+    and sent with asyncio (UDP, or pipelined over '--connections' TCP
+    connections) in one of three modes:
+
+        --rate N        open loop - send N queries/sec regardless of
+                        responses
+        --speed X       open loop - replay capture with original timing
+                        (X times faster)
+        --concurrency C closed loop - keep C queries outstanding
+
+    Using '--processes P' runs P independent generators (each with rate
+    N/P, or replaying every P-th query of the capture with '--speed') to
+    get past the single-core limit; their histograms are merged.
+
+    Latency is recorded in an HDR (high dynamic range) histogram with
+    3 significant digits (see Histogram) and '--hgrm' writes the
+    percentile distribution in the HdrHistogram text format (which can
+    be plotted with the HdrHistogram plotter).
+
+    Queries can be read from the included capture
+
+    >>> import os
+    >>> path = os.path.join(os.path.dirname(__file__),"..","2.pcapng")
+    >>> queries = list(read_capture(path))
+    >>> len(queries), DNSRecord.parse(queries[0][1]).q.qname
+    (4, <DNSLabel: 'ded.nuaa.edu.cn.'>)
+
+    Name lists
+
+    >>> import io
+    >>> queries = list(read_names(io.StringIO("abc.com\\nxyz.com MX\\n")))
+    >>> [ (t,str(DNSRecord.parse(q).q.qname),QTYPE[DNSRecord.parse(q).q.qtype])
+    ...         for t,q in queries ]
+    [(None, 'abc.com.', 'A'), (None, 'xyz.com.', 'MX')]
+
+    Run against a local server
+
+    >>> from dnslib.server import DNSServer,DNSLogger,BaseResolver
+    >>> server = DNSServer(BaseResolver(),port=8057,address="localhost",
+    ...                    logger=DNSLogger("-request,-reply"))
+    >>> server.start_thread()
+    >>> queries = list(read_names(io.StringIO("abc.com\\n")))
+    >>> result = run(queries,"127.0.0.1",8057,count=200,rate=2000,timeout=2)
+    >>> result['sent'], result['received'], result['lost']
+    (200, 200, 0)
+    >>> result['rcodes']
+    {'NXDOMAIN': 200}
+    >>> result = run(queries,"127.0.0.1",8057,count=100,concurrency=10,
+    ...              timeout=2)
+    >>> result['received']
+    100
+    >>> server.stop()
+
+    Replay timing ('speed') needs a capture
+
+    >>> run(queries,"127.0.0.1",8057,speed=2)
+    Traceback (most recent call last):
+    ...
+    ValueError: Speed needs capture timestamps (use rate)
+"""
+
+from __future__ import print_function
+
+import asyncio,collections,json,math,random,socket,struct,sys,time
+
+from dnslib.dns import DNSRecord,DNSQuestion,QTYPE,RCODE
+
+# Capture formats
+
+LINKTYPE_NULL,LINKTYPE_ETHERNET,LINKTYPE_RAW,LINKTYPE_LOOP = 0,1,101,108
+LINKTYPE_LINUX_SLL,LINKTYPE_IPV4,LINKTYPE_IPV6 = 113,228,229
+
+def ip_payload(linktype,frame):
+    """
+        Return IP packet from link layer frame (or None)
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype,offset = struct.unpack_from("!H",frame,12)[0],14
+        while ethertype in (0x8100,0x88a8):     # VLAN tags
+            ethertype = struct.unpack_from("!H",frame,offset + 2)[0]
+            offset += 4
+        return frame[offset:] if ethertype in (0x0800,0x86dd) else None
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ethertype = struct.unpack_from("!H",frame,14)[0]
+        return frame[16:] if ethertype in (0x0800,0x86dd) else None
+    elif linktype in (LINKTYPE_NULL,LINKTYPE_LOOP):
+        return frame[4:]
+    elif linktype in (LINKTYPE_RAW,LINKTYPE_IPV4,LINKTYPE_IPV6):
+        return frame
+    return None
+
+def dns_payload(packet,port=53):
+    """
+        Return DNS message sent to 'port' in IP packet (UDP or single
+        segment TCP) or None
+    """
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        proto,hlen = packet[9],(packet[0] & 0xf) * 4
+    elif version == 6:
+        proto,hlen = packet[6],40
+    else:
+        return None
+    if len(packet) < hlen + 8:
+        return None
+    dport = struct.unpack_from("!H",packet,hlen + 2)[0]
+    if dport != port:
+        return None
+    if proto == 17:
+        return packet[hlen+8:]
+    elif proto == 6:
+        data = packet[hlen + (packet[hlen + 12] >> 4) * 4:]
+        if len(data) > 2 and struct.unpack_from("!H",data)[0] == len(data) - 2:
+            return data[2:]
+    return None
+
+def read_frames(f):
+    """
+        Read pcap/pcapng file - yields (time,linktype,frame)
+    """
+    magic = f.read(4)
+    if magic == b'\x0a\x0d\x0d\x0a':
+        # pcapng - block length/byte order from section header
+        data = magic + f.read()
+        offset,endian,interfaces = 0,"<",[]
+        while offset + 12 <= len(data):
+            block_type = struct.unpack_from(endian + "I",data,offset)[0]
+            if block_type == 0x0A0D0D0A:
+                bom = data[offset+8:offset+12]
+                endian = "<" if bom == b'\x4d\x3c\x2b\x1a' else ">"
+                interfaces = []
+            length = struct.unpack_from(endian + "I",data,offset + 4)[0]
+            if length < 12:
+                break
+            body = data[offset+8:offset+length-4]
+            if block_type == 1:
+                linktype = struct.unpack_from(endian + "H",body)[0]
+                # if_tsresol option (default microseconds)
+                resol,opt = 1e-6,8
+                while opt + 4 <= len(body):
+                    code,olen = struct.unpack_from(endian + "HH",body,opt)
+                    if code == 0:
+                        break
+                    if code == 9:
+                        v = body[opt+4]
+                        resol = 2.0 ** -(v & 0x7f) if v & 0x80 else 10.0 ** -v
+                    opt += 4 + olen + (-olen % 4)
+                interfaces.append((linktype,resol))
+            elif block_type == 6:
+                iface,hi,lo,caplen = struct.unpack_from(endian + "IIII",body)
+                linktype,resol = interfaces[iface]
+                yield (((hi << 32) | lo) * resol,linktype,body[20:20+caplen])
+            elif block_type == 3 and interfaces:
+                # Simple packet block (no timestamp)
+                linktype,_ = interfaces[0]
+                yield (None,linktype,body[4:])
+            offset += length
+    elif magic in (b'\xd4\xc3\xb2\xa1',b'\xa1\xb2\xc3\xd4',
+                   b'\x4d\x3c\xb2\xa1',b'\xa1\xb2\x3c\x4d'):
+        # pcap (microsecond or nanosecond timestamps)
+        endian = "<" if magic[0] in (0xd4,0x4d) else ">"
+        resol = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1',b'\xa1\xb2\x3c\x4d') \
+                     else 1e-6
+        header = f.read(20)
+        linktype = struct.unpack(endian + "IIIII",header)[4] & 0xffff
+        while True:
+            record = f.read(16)
+            if len(record) < 16:
+                return
+            sec,frac,caplen,_ = struct.unpack(endian + "IIII",record)
+            yield (sec + frac * resol,linktype,f.read(caplen))
+    else:
+        raise ValueError("Not a pcap/pcapng file")
+
+def read_capture(path,port=53):
+    """
+        Read DNS queries from capture - yields (time,packet)
+    """
+    with open(path,"rb") as f:
+        for t,linktype,frame in read_frames(f):
+            try:
+                data = dns_payload(ip_payload(linktype,frame),port)
+            except (struct.error,IndexError):
+                continue
+            # Queries only (QR=0)
+            if data and len(data) >= 12 and not data[2] & 0x80:
+                yield (t,data)
+
+def read_names(f):
+    """
+        Read '<name> [<type>]' lines - yields (None,packet)
+    """
+    for line in f:
+        line = line.split('#')[0].split()
+        if line:
+            qtype = getattr(QTYPE,line[1].upper()) if len(line) > 1 \
+                                                   else QTYPE.A
+            yield (None,DNSRecord(q=DNSQuestion(line[0],qtype)).pack())
+
+def is_capture(path):
+    with open(path,"rb") as f:
+        return f.read(4) in (b'\x0a\x0d\x0d\x0a',
+                             b'\xd4\xc3\xb2\xa1',b'\xa1\xb2\xc3\xd4',
+                             b'\x4d\x3c\xb2\xa1',b'\xa1\xb2\x3c\x4d')
+
+# Latency histogram
+
+class Histogram(object):
+
+    """
+        HDR histogram of integer values (microseconds) - values are
+        recorded exactly up to 2048 and then in log-linear buckets with
+        1024 sub-buckets (relative error < 0.1%, ie. 3 significant
+        digits) over any range. Counts are kept in a dict so histograms
+        from several processes can be merged.
+
+        >>> h = Histogram()
+        >>> for v in range(1,10001):
+        ...     h.record(v)
+        >>> h.count, h.min, h.max
+        (10000, 1, 10000)
+        >>> [ h.percentile(p) for p in (50,99,99.9,100) ]
+        [5003, 9903, 9991, 10007]
+        >>> h2 = Histogram()
+        >>> h2.record(1000000)
+        >>> h.merge(h2)
+        >>> h.max, h.percentile(100)
+        (1000000, 1000447)
+    """
+
+    SUB_BUCKETS = 2048
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def index(cls,value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        half = cls.SUB_BUCKETS // 2
+        shift = value.bit_length() - cls.SUB_BUCKETS.bit_length() + 1
+        return cls.SUB_BUCKETS + (shift - 1) * half + (value >> shift) - half
+
+    @classmethod
+    def highest(cls,index):
+        # Highest value which maps to index
+        if index < cls.SUB_BUCKETS:
+            return index
+        half = cls.SUB_BUCKETS // 2
+        shift,m = divmod(index - cls.SUB_BUCKETS,half)
+        shift += 1
+        return ((m + half + 1) << shift) - 1
+
+    def record(self,value):
+        value = max(0,int(value))
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i,0) + 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self,other):
+        for i,n in other.counts.items():
+            self.counts[i] = self.counts.get(i,0) + n
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        for v in (other.min,other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min,v)
+                self.max = v if self.max is None else max(self.max,v)
+
+    def percentile(self,p):
+        if not self.count:
+            return 0
+        target = max(1,math.ceil(self.count * p / 100.0))
+        n = 0
+        for i in sorted(self.counts):
+            n += self.counts[i]
+            if n >= target:
+                return self.highest(i)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def stddev(self):
+        if not self.count:
+            return 0
+        mean = self.mean()
+        return math.sqrt(max(0,self.total_sq / self.count - mean * mean))
+
+    def hgrm(self,scale=1000.0):
+        """
+            Percentile distribution in HdrHistogram text format (values
+            divided by 'scale' - default microseconds->milliseconds)
+        """
+        lines = ["%12s %14s %10s %14s" % ("Value","Percentile",
+                                          "TotalCount","1/(1-Percentile)"),
+                 ""]
+        n = 0
+        for i in sorted(self.counts):
+            n += self.counts[i]
+            q = n / float(self.count)
+            inv = "%14.2f" % (1 / (1 - q)) if q < 1 else "%14s" % "inf"
+            lines.append("%12.3f %1.12f %10d %s" % (self.highest(i) / scale,
+                                                    q,n,inv))
+        lines.append("#[Mean    = %12.3f, StdDeviation   = %12.3f]" % (
+                            self.mean() / scale,self.stddev() / scale))
+        lines.append("#[Max     = %12.3f, Total count    = %12d]" % (
+                            (self.max or 0) / scale,self.count))
+        return "\n".join(lines) + "\n"
+
+# Load generator
+
+class Stats(object):
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.rcodes = collections.Counter()
+        self.histogram = Histogram()
+
+class UDPClient(asyncio.DatagramProtocol):
+
+    def __init__(self,generator):
+        self.generator = generator
+
+    def datagram_received(self,data,addr):
+        self.generator.received(data)
+
+class Generator(object):
+
+    """
+        Send queries and match responses (by query ID which is rewritten
+        so that outstanding queries are unique)
+    """
+
+    def __init__(self,queries,address,port,tcp=False,connections=1,
+                      timeout=2.0,seed=None):
+        self.queries = queries
+        self.address = address
+        self.port = port
+        self.tcp = tcp
+        self.connections = connections
+        self.timeout = timeout
+        self.stats = Stats()
+        self.outstanding = {}
+        self.ids = collections.deque(random.Random(seed).sample(range(65536),
+                                                                65536))
+        self.event = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        if self.tcp:
+            self.writers = []
+            self.readers = []
+            for i in range(self.connections):
+                reader,writer = await asyncio.open_connection(self.address,
+                                                              self.port)
+                self.writers.append(writer)
+                self.readers.append(asyncio.ensure_future(self.read(reader)))
+        else:
+            family = socket.AF_INET6 if ':' in self.address \
+                                     else socket.AF_INET
+            self.transport,_ = await loop.create_datagram_endpoint(
+                                    lambda: UDPClient(self),
+                                    remote_addr=(self.address,self.port),
+                                    family=family)
+
+    async def read(self,reader):
+        try:
+            while True:
+                length = struct.unpack("!H",await reader.readexactly(2))[0]
+                self.received(await reader.readexactly(length))
+        except (asyncio.IncompleteReadError,ConnectionError):
+            pass
+
+    def send(self,data):
+        if not self.ids:
+            # All IDs outstanding - count oldest as lost
+            self.expire(force=True)
+        id = self.ids.popleft()
+        self.outstanding[id] = time.perf_counter()
+        data = struct.pack("!H",id) + data[2:]
+        if self.tcp:
+            writer = self.writers[self.stats.sent % len(self.writers)]
+            writer.write(struct.pack("!H",len(data)) + data)
+        else:
+            self.transport.sendto(data)
+        self.stats.sent += 1
+
+    def received(self,data):
+        if len(data) < 12:
+            return
+        id = struct.unpack_from("!H",data)[0]
+        start = self.outstanding.pop(id,None)
+        if start is None:
+            return
+        self.ids.append(id)
+        stats = self.stats
+        stats.received += 1
+        stats.histogram.record((time.perf_counter() - start) * 1e6)
+        stats.rcodes[RCODE.get(data[3] & 0xf)] += 1
+        if self.event is not None:
+            self.event.set()
+
+    def expire(self,force=False):
+        # Outstanding queries older than timeout are lost (IDs reused)
+        now = time.perf_counter()
+        for id,start in list(self.outstanding.items()):
+            if force or now - start > self.timeout:
+                del self.outstanding[id]
+                self.ids.append(id)
+                if force:
+                    break
+
+    async def wait(self,timeout):
+        # Wait for a response (returns False on timeout)
+        self.event.clear()
+        try:
+            await asyncio.wait_for(self.event.wait(),timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def drain(self):
+        deadline = time.perf_counter() + self.timeout
+        while self.outstanding:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not await self.wait(remaining):
+                break
+
+    async def close(self):
+        if self.tcp:
+            for writer in self.writers:
+                writer.close()
+            for reader in self.readers:
+                reader.cancel()
+        else:
+            self.transport.close()
+
+    async def run_rate(self,count,rate=None,speed=None):
+        """
+            Open loop - send at fixed rate or with capture timing
+        """
+        loop_start = time.perf_counter()
+        first = None
+        for i in range(count):
+            t,data = self.queries[i % len(self.queries)]
+            if speed and t is not None:
+                if first is None:
+                    first = t
+                    # Captures are replayed repeatedly (shifted in time)
+                    span = (self.queries[-1][0] or t) - t
+                due = ((t - first) + (i // len(self.queries)) * span) / speed
+            else:
+                due = i / rate
+            delay = loop_start + due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.send(data)
+            if i % 1000 == 0:
+                self.expire()
+        await self.drain()
+
+    async def run_closed(self,count,concurrency):
+        """
+            Closed loop - keep 'concurrency' queries outstanding
+        """
+        sent = 0
+        while sent < count:
+            while len(self.outstanding) < concurrency and sent < count:
+                self.send(self.queries[sent % len(self.queries)][1])
+                sent += 1
+            if not await self.wait(self.timeout):
+                self.expire()
+        await self.drain()
+
+def generate(args):
+    """
+        Run generator (in this process) - returns Stats
+    """
+    (queries,address,port,count,rate,speed,concurrency,tcp,connections,
+                timeout) = args
+
+    async def main():
+        g = Generator(queries,address,port,tcp,connections,timeout)
+        await g.start()
+        try:
+            if concurrency:
+                await g.run_closed(count,concurrency)
+            else:
+                await g.run_rate(count,rate,speed)
+        finally:
+            await g.close()
+        return g.stats
+    return asyncio.run(main())
+
+def run(queries,address,port=53,count=None,rate=None,speed=None,
+              concurrency=None,tcp=False,connections=1,timeout=2.0,
+              processes=1):
+    """
+        Run load test - returns results dict
+    """
+    if not queries:
+        raise ValueError("No queries")
+    if speed and not rate and any([ t is None for t,q in queries ]):
+        # Name lists have no timing to replay
+        raise ValueError("Speed needs capture timestamps (use rate)")
+    count = count or len(queries)
+    if not (rate or speed or concurrency):
+        concurrency = 100
+    start = time.perf_counter()
+    if speed and not rate:
+        # Each process replays every P-th query (with original timing)
+        processes = max(1,min(processes,len(queries)))
+    if processes > 1:
+        import multiprocessing
+        jobs = [ (queries[i::processes] if speed and not rate else queries,
+                  address,port,count // processes + (i < count % processes),
+                  rate and rate / processes,speed,
+                  concurrency and max(1,concurrency // processes),
+                  tcp,connections,timeout) for i in range(processes) ]
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(generate,jobs)
+        stats = Stats()
+        for s in results:
+            stats.sent += s.sent
+            stats.received += s.received
+            stats.rcodes.update(s.rcodes)
+            stats.histogram.merge(s.histogram)
+    else:
+        stats = generate((queries,address,port,count,rate,speed,
+                          concurrency,tcp,connections,timeout))
+    elapsed = time.perf_counter() - start
+    h = stats.histogram
+    return {
+        'sent': stats.sent,
+        'received': stats.received,
+        'lost': stats.sent - stats.received,
+        'loss_percent': 100.0 * (stats.sent - stats.received) /
+                                    max(1,stats.sent),
+        'elapsed': elapsed,
+        'qps': stats.received / elapsed if elapsed else 0,
+        'rcodes': dict(stats.rcodes),
+        'latency_us': {
+            'min': h.min or 0,
+            'mean': h.mean(),
+            'p50': h.percentile(50),
+            'p90': h.percentile(90),
+            'p99': h.percentile(99),
+            'p99.9': h.percentile(99.9),
+            'max': h.max or 0,
+        },
+        'histogram': h,
+    }
+
+if __name__ == '__main__':
+
+    import argparse,doctest
+
+    p = argparse.ArgumentParser(description="DNS load generator")
+    p.add_argument("--server","-s",default="127.0.0.1:53",
+                    metavar="<address:port>",
+                    help="Target server (default:127.0.0.1:53)")
+    p.add_argument("--count","-n",type=int,default=None,
+                    help="Number of queries (default: all queries in file)")
+    p.add_argument("--rate","-r",type=float,default=None,
+                    help="Open loop: queries/sec")
+    p.add_argument("--speed",type=float,default=None,
+                    help="Open loop: replay capture timing (x speed)")
+    p.add_argument("--concurrency","-c",type=int,default=None,
+                    help="Closed loop: outstanding queries (default: 100)")
+    p.add_argument("--tcp",action='store_true',default=False,
+                    help="Use TCP (pipelined)")
+    p.add_argument("--connections",type=int,default=1,
+                    help="TCP connections per process (default: 1)")
+    p.add_argument("--processes","-p",type=int,default=1,
+                    help="Generator processes (default: 1)")
+    p.add_argument("--timeout",type=float,default=2.0,
+                    help="Query timeout (default: 2s)")
+    p.add_argument("--port",type=int,default=53,
+                    help="DNS port to extract from capture (default: 53)")
+    p.add_argument("--json",action='store_true',default=False,
+                    help="Print results as JSON")
+    p.add_argument("--hgrm",default=None,metavar="<file>",
+                    help="Write HdrHistogram percentile distribution")
+    p.add_argument("file",nargs="?",metavar="<file>",
+                    help="Capture (pcap/pcapng) or name list (run doctests if not given)")
+    args = p.parse_args()
+
+    if not args.file:
+        doctest.testmod()
+        sys.exit()
+
+    if is_capture(args.file):
+        queries = list(read_capture(args.file,args.port))
+    elif args.speed and not args.rate:
+        p.error("--speed needs a capture file (use --rate for name lists)")
+    else:
+        with open(args.file) as f:
+            queries = list(read_names(f))
+
+    address,_,port = args.server.rpartition(':') if args.server.count(':') == 1 \
+                        or args.server.startswith('[') \
+                        else (args.server,None,None)
+    address = address.strip('[]')
+    result = run(queries,address,int(port or 53),args.count,args.rate,
+                 args.speed,args.concurrency,args.tcp,args.connections,
+                 args.timeout,args.processes)
+    histogram = result.pop('histogram')
+    if args.hgrm:
+        with open(args.hgrm,"w") as f:
+            f.write(histogram.hgrm())
+    if args.json:
+        print(json.dumps(result,indent=2))
+    else:
+        print("Sent: %d Received: %d Lost: %d (%.2f%%)" % (result['sent'],
+                result['received'],result['lost'],result['loss_percent']))
+        print("Elapsed: %.2fs QPS: %.0f" % (result['elapsed'],result['qps']))
+        print("Rcodes: %s" % ", ".join("%s=%d" % (k,v) for k,v in
+                                            sorted(result['rcodes'].items())))
+        print("Latency (ms): min %.3f mean %.3f p50 %.3f p90 %.3f "
+              "p99 %.3f p99.9 %.3f max %.3f" % tuple(
+                result['latency_us'][k] / 1000.0 for k in
+                    ('min','mean','p50','p90','p99','p99.9','max')))
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Metrics - counters/gauges/histograms exported in the Prometheus text
+    format
+
+    Metrics are created through a Registry and updated with the label
+    values as a tuple (in the order given when the metric was created).
+    Each label combination is a dict entry so updates are a single dict
+    lookup and aren't locked - as with RRL, a concurrent update may very
+    occasionally be lost which is acceptable for monitoring. Gauges can
+    be given a function which is called when the metrics are collected
+    (eg. queue depth) so there is no cost on the request path.
+
+    >>> registry = Registry()
+    >>> queries = registry.counter("dns_queries_total","DNS queries",
+    ...                            ("qtype",))
+    >>> queries.inc(("A",))
+    >>> queries.inc(("A",))
+    >>> queries.inc(("MX",),3)
+    >>> latency = registry.histogram("upstream_seconds","Upstream latency",
+    ...                              ("server",),buckets=(0.01,0.1,1))
+    >>> for t in (0.005,0.05,0.5,5):
+    ...     latency.observe(t,("8.8.8.8",))
+    >>> depth = registry.gauge("queue_depth","Queued requests",fn=lambda: 7)
+    >>> print(registry.expose(),end="")
+    # HELP dns_queries_total DNS queries
+    # TYPE dns_queries_total counter
+    dns_queries_total{qtype="A"} 2
+    dns_queries_total{qtype="MX"} 3
+    # HELP upstream_seconds Upstream latency
+    # TYPE upstream_seconds histogram
+    upstream_seconds_bucket{server="8.8.8.8",le="0.01"} 1
+    upstream_seconds_bucket{server="8.8.8.8",le="0.1"} 2
+    upstream_seconds_bucket{server="8.8.8.8",le="1"} 3
+    upstream_seconds_bucket{server="8.8.8.8",le="+Inf"} 4
+    upstream_seconds_sum{server="8.8.8.8"} 5.555
+    upstream_seconds_count{server="8.8.8.8"} 4
+    # HELP queue_depth Queued requests
+    # TYPE queue_depth gauge
+    queue_depth 7
+
+    Gauge functions can also return a dict of {labels:value}
+
+    >>> g = registry.gauge("zone_stats","Zone stats",("stat",),
+    ...                    fn=lambda: {("records",):10,("reloads",):2})
+    >>> print(g.expose(),end="")
+    # HELP zone_stats Zone stats
+    # TYPE zone_stats gauge
+    zone_stats{stat="records"} 10
+    zone_stats{stat="reloads"} 2
+
+    DNSServer metrics (see server.py)
+
+    >>> m = ServerMetrics()
+    >>> m.queries.inc(("A","udp"))
+    >>> m.responses.inc(("NOERROR","udp"))
+    >>> for l in m.expose().splitlines():
+    ...     if l.startswith("dns_q") or l.startswith("dns_r"):
+    ...         print(l)
+    dns_queries_total{qtype="A",protocol="udp"} 1
+    dns_responses_total{rcode="NOERROR",protocol="udp"} 1
+"""
+
+from __future__ import print_function
+
+import bisect,math,threading
+
+# Default latency buckets (seconds)
+BUCKETS = (0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,
+           0.1,0.25,0.5,1.0,2.5,5.0,10.0)
+
+def escape(value):
+    return str(value).replace('\\','\\\\').replace('"','\\"') \
+                     .replace('\n','\\n')
+
+def format_value(value):
+    if isinstance(value,float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(round(value,9))
+    return str(value)
+
+def format_labels(names,values,extra=None):
+    labels = [ '%s="%s"' % (n,escape(v)) for n,v in zip(names,values) ]
+    if extra:
+        labels.append('%s="%s"' % extra)
+    return "{%s}" % ",".join(labels) if labels else ""
+
+class Metric(object):
+
+    kind = "untyped"
+
+    def __init__(self,name,help,labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def samples(self):
+        """
+            Return list of (suffix,labels,value) samples
+        """
+        return [ ("",labels,value) for labels,value in
+                        sorted(self.values.items()) ]
+
+    def expose(self):
+        lines = [ "# HELP %s %s" % (self.name,self.help),
+                  "# TYPE %s %s" % (self.name,self.kind) ]
+        for suffix,labels,value in self.samples():
+            if isinstance(labels,tuple):
+                labels = format_labels(self.labels,labels)
+            lines.append("%s%s%s %s" % (self.name,suffix,labels,
+                                        format_value(value)))
+        return "\n".join(lines) + "\n"
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def inc(self,labels=(),value=1):
+        self.values[labels] = self.values.get(labels,0) + value
+
+    def get(self,labels=()):
+        return self.values.get(labels,0)
+
+class Gauge(Metric):
+
+    """
+        Gauge - either set explicitly or calculated by 'fn' when collected
+        (fn returns a value or a dict of {labels:value})
+    """
+
+    kind = "gauge"
+
+    def __init__(self,name,help,labels=(),fn=None):
+        super(Gauge,self).__init__(name,help,labels)
+        self.fn = fn
+
+    def set(self,value,labels=()):
+        self.values[labels] = value
+
+    def samples(self):
+        if self.fn:
+            value = self.fn()
+            values = value if isinstance(value,dict) else {():value}
+            return [ ("",labels,v) for labels,v in sorted(values.items()) ]
+        return super(Gauge,self).samples()
+
+class Histogram(Metric):
+
+    """
+        Histogram - per-label bucket counts (non-cumulative internally)
+        followed by sum and count
+    """
+
+    kind = "histogram"
+
+    def __init__(self,name,help,labels=(),buckets=BUCKETS):
+        super(Histogram,self).__init__(name,help,labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self,value,labels=()):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets,value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        samples = []
+        for labels,counts in sorted(self.values.items()):
+            total = 0
+            for le,n in zip(self.buckets + (float('inf'),),counts):
+                total += n
+                samples.append(("_bucket",
+                                format_labels(self.labels,labels,
+                                              ("le",format_value(le))),
+                                total))
+            samples.append(("_sum",labels,counts[-1]))
+            samples.append(("_count",labels,total))
+        return samples
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self,metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self,name,help,labels=()):
+        return self.register(Counter(name,help,labels))
+
+    def gauge(self,name,help,labels=(),fn=None):
+        return self.register(Gauge(name,help,labels,fn))
+
+    def histogram(self,name,help,labels=(),buckets=BUCKETS):
+        return self.register(Histogram(name,help,labels,buckets))
+
+    def expose(self):
+        """
+            Metrics in Prometheus text exposition format
+        """
+        return "".join(m.expose() for m in self.metrics)
+
+class ServerMetrics(Registry):
+
+    """
+        Metrics updated by DNSHandler (pass to DNSServer as 'metrics' - a
+        single instance can be shared by the UDP/TCP servers)
+    """
+
+    def __init__(self):
+        super(ServerMetrics,self).__init__()
+        self.queries = self.counter("dns_queries_total",
+                                    "DNS queries received",
+                                    ("qtype","protocol"))
+        self.responses = self.counter("dns_responses_total",
+                                      "DNS responses sent",
+                                      ("rcode","protocol"))
+        self.resolve_seconds = self.histogram("dns_resolve_seconds",
+                                      "Time spent in resolver",
+                                      ("protocol",))
+        self.truncated = self.counter("dns_truncated_total",
+                                      "UDP responses truncated")
+        self.parse_errors = self.counter("dns_parse_errors_total",
+                                         "Requests which could not be parsed",
+                                         ("protocol",))
+        self.rrl = self.counter("dns_rrl_limited_total",
+                                "Responses limited by RRL",
+                                ("action",))
+        self.threads = self.gauge("dns_threads",
+                                  "Active threads",
+                                  fn=threading.active_count)
+
+    def add_server(self,server,protocol):
+        """
+            Add gauges for server connection/queue depth (if available)
+        """
+        if hasattr(server,'connections'):
+            self.gauge("dns_%s_connections" % protocol,
+                       "Open %s connections" % protocol,
+                       fn=lambda: len(server.connections))
+            self.gauge("dns_%s_pending" % protocol,
+                       "%s queries queued or in progress" % protocol,
+                       fn=lambda: sum(c.pending for c in
+                                            list(server.connections)))
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
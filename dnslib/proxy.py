@@ -56,13 +56,17 @@ class PassthroughDNSHandler(DNSHandler):
         passing to Resolver (The request/response packets are still
         parsed and logged but this is not inline)
     """
+    def get_replies(self,data):
+        # Single passthrough response (no zone transfer handling)
+        yield self.get_reply(data)
+
     def get_reply(self,data):
         host,port = self.server.resolver.address,self.server.resolver.port
 
         request = DNSRecord.parse(data)
         self.log_request(request)
 
-        if self.protocol == 'tcp':
+        if self.protocol != 'udp':
             data = struct.pack("!H",len(data)) + data
             response = send_tcp(data,host,port)
             response = response[2:]
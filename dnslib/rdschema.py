@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+
+"""
+    RD schema - declarative RDATA wire format
+
+    An RD subclass can declare its wire format as a 'schema' (a comma
+    separated list of '<type> <attribute>' fields) and the parse/pack
+    methods are generated from this when the class is created (see
+    RD.__init_subclass__). Field types are:
+
+        B/H/I       - unsigned 8/16/32 bit integer (prefix with a count
+                      for a fixed length tuple - eg. '4B' or '5I')
+        s           - fixed length bytes (prefix with the length - eg.
+                      '4s' for a packed IPv4 address; hex in zone format)
+        name        - domain name (compressed when packed)
+        name_nc     - domain name (not compressed when packed)
+        string      - <character-string> (length byte + data)
+        hex         - remaining rdata (hex in zone format)
+        base64      - remaining rdata (base64 in zone format)
+        hexstring   - length byte + data (hex in zone format, '-' if
+                      empty - eg. NSEC3 salt)
+        b32string   - length byte + data (base32hex in zone format -
+                      eg. NSEC3 next hashed owner)
+
+    Other field types can be added with add_codec (a FieldCodec instance
+    which handles the wire/zone format for the field).
+
+    Consecutive integer/'s' fields are read with a single struct call and
+    values are stored directly in the '_<attribute>' slot (if the class
+    has one) so parsing skips the property checks. 'hex' and 'base64'
+    fields (and 'trailing' codecs) must be last.
+
+    If the class doesn't define them, __init__ (fields in schema order),
+    fromZone, __repr__ and 'attrs' are also generated, as are
+    range/label/bytes properties for fields with a '_<attribute>' slot
+    - so a new type only needs __slots__ and a schema:
+
+    >>> from dnslib.dns import RD
+    >>> from dnslib.label import DNSBuffer
+    >>> class KX(RD):
+    ...     __slots__ = ('_preference','_exchanger')
+    ...     schema = "H preference, name exchanger"
+    >>> kx = KX.fromZone(["10","kx"],"example.com")
+    >>> kx
+    10 kx.example.com.
+    >>> kx.preference = 65536
+    Traceback (most recent call last):
+    ...
+    ValueError: Attribute 'preference' must be between 0-65535 [65536]
+    >>> b = DNSBuffer()
+    >>> kx.pack(b)
+    >>> KX.parse(DNSBuffer(b.data),len(b.data)) == kx
+    True
+    >>> KX.parse(DNSBuffer(b.data[:1]),1)
+    Traceback (most recent call last):
+    ...
+    dnslib.dns.DNSError: Error unpacking KX [offset=0]: Not enough bytes [offset=0,remaining=1,requested=2]
+
+    To handle the type in packets/zone files it must also be added to
+    RDMAP (dnslib.dns.add_rdtype)
+
+    Field parsing:
+
+    >>> fields = parse_schema("H priority, H weight, H port, name target")
+    >>> fields
+    [('H', 1, 'priority'), ('H', 1, 'weight'), ('H', 1, 'port'), ('name', 1, 'target')]
+    >>> parse_schema("5I times")
+    [('I', 5, 'times')]
+    >>> parse_schema("H port, 16s address")
+    [('H', 1, 'port'), ('s', 16, 'address')]
+    >>> parse_schema("s address")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid schema field: 's address'
+    >>> parse_schema("hex data, B flags")
+    Traceback (most recent call last):
+    ...
+    ValueError: Schema field 'hex data' must be last
+    >>> parse_schema("Q big")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid schema field: 'Q big'
+
+    Codecs:
+
+    >>> salt = CODECS['hexstring']
+    >>> salt.fromZone(["AABBCCDD"]) == bytes([0xaa,0xbb,0xcc,0xdd])
+    True
+    >>> salt.fromZone(["-"])
+    b''
+    >>> salt.toZone(bytes([0xaa,0xbb,0xcc,0xdd])),salt.toZone(b'')
+    ('AABBCCDD', '-')
+    >>> b32 = CODECS['b32string']
+    >>> b32.toZone(bytes(20))
+    '00000000000000000000000000000000'
+    >>> b32.toZone(b32.fromZone(['2t7b4g4vsa5smi47k61mv5bv1a22bojr']))
+    '2T7B4G4VSA5SMI47K61MV5BV1A22BOJR'
+
+"""
+
+import base64,binascii,re
+
+from dnslib.bimap import BimapError
+from dnslib.buffer import BufferError,get_struct
+from dnslib.label import DNSLabel
+from dnslib.ranges import BYTES,ntuple_range,range_property
+
+INT_MAX = { 'B':255, 'H':65535, 'I':4294967295 }
+STRUCT = ('B','H','I','s')
+KINDS = ('B','H','I','s','name','name_nc','string','hex','base64')
+TRAILING = ('hex','base64')
+FIELD = re.compile(r'^(\d*)(\w+)\s+(\w+)$')
+
+class FieldCodec(object):
+    """
+        Wire/zone format for a schema field type which isn't generated
+        inline - 'parse' is passed the offset of the end of the rdata and
+        'fromZone' the zone format tokens for the field (one token unless
+        'trailing', in which case all remaining tokens)
+    """
+
+    trailing = False
+
+    def parse(self,buffer,end):
+        raise NotImplementedError
+
+    def pack(self,buffer,value):
+        raise NotImplementedError
+
+    def fromZone(self,tokens):
+        raise NotImplementedError
+
+    def toZone(self,value):
+        raise NotImplementedError
+
+class HexString(FieldCodec):
+    """
+        Length byte + data, hex in zone format ('-' if empty)
+    """
+
+    def parse(self,buffer,end):
+        (n,) = buffer.unpack("!B")
+        return buffer.get(n)
+
+    def pack(self,buffer,value):
+        buffer.pack("!B",len(value))
+        buffer.append(value)
+
+    def fromZone(self,tokens):
+        return b'' if tokens[0] == '-' else binascii.unhexlify(tokens[0])
+
+    def toZone(self,value):
+        return _hex(value) if value else '-'
+
+_B32 = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+_B32HEX = "0123456789ABCDEFGHIJKLMNOPQRSTUV"
+
+class Base32String(HexString):
+    """
+        Length byte + data, base32hex (RFC 4648, no padding) in zone format
+    """
+
+    to_b32 = bytes.maketrans(_B32HEX.encode(),_B32.encode())
+    from_b32 = bytes.maketrans(_B32.encode(),_B32HEX.encode())
+
+    def fromZone(self,tokens):
+        s = tokens[0].upper().encode().translate(self.to_b32)
+        return base64.b32decode(s + b'=' * (-len(s) % 8))
+
+    def toZone(self,value):
+        return base64.b32encode(value).translate(self.from_b32).rstrip(b'=')\
+                                                                .decode()
+
+CODECS = { 'hexstring':HexString(), 'b32string':Base32String() }
+
+def add_codec(kind,codec):
+    """
+        Register FieldCodec for schema field type 'kind'
+    """
+    CODECS[kind] = codec
+
+def parse_schema(schema):
+    """
+        Parse schema string - returns list of (type,count,attribute)
+    """
+    fields = []
+    items = [ s.strip() for s in schema.split(",") ]
+    for i,item in enumerate(items):
+        m = FIELD.match(item)
+        if not m or (m.group(1) and m.group(2) not in STRUCT) or \
+                (m.group(2) == 's' and not m.group(1)) or \
+                (m.group(2) not in KINDS and m.group(2) not in CODECS):
+            raise ValueError("Invalid schema field: '%s'" % item)
+        kind = m.group(2)
+        if (kind in TRAILING or kind in CODECS and CODECS[kind].trailing) \
+                and i != len(items) - 1:
+            raise ValueError("Schema field '%s' must be last" % item)
+        fields.append((m.group(2),int(m.group(1) or 1),m.group(3)))
+    return fields
+
+def _label_property(attr):
+    def getter(obj):
+        return getattr(obj,"_%s" % attr)
+    def setter(obj,val):
+        if not isinstance(val,DNSLabel):
+            val = DNSLabel(val)
+        setattr(obj,"_%s" % attr,val)
+    return property(getter,setter)
+
+def _fixed_bytes_property(attr,n):
+    def getter(obj):
+        return getattr(obj,"_%s" % attr)
+    def setter(obj,val):
+        if not (isinstance(val,(bytes,bytearray)) and len(val) == n):
+            raise ValueError("Attribute '%s' must be %d bytes [%r]" %
+                                        (attr,n,val))
+        setattr(obj,"_%s" % attr,bytes(val))
+    return property(getter,setter)
+
+def _slots(cls):
+    slots = set()
+    for c in cls.__mro__:
+        s = c.__dict__.get('__slots__',())
+        slots.update([s] if isinstance(s,str) else s)
+    return slots
+
+def _hex(data):
+    return binascii.hexlify(data).decode().upper()
+
+def _base64(data):
+    return base64.b64encode(data).decode()
+
+def _codegen(cls,fields,slots):
+    # Return source for parse/pack/__init__/fromZone/__repr__
+    store = {}
+    for kind,count,attr in fields:
+        store[attr] = ("_" + attr) if ("_" + attr) in slots else attr
+
+    parse = ["def parse(cls,buffer,length):",
+             "    try:",
+             "        rd = _new(cls)"]
+    if any([ kind in TRAILING or kind in CODECS for kind,n,a in fields ]):
+        parse.insert(2,"        start = buffer.offset")
+    pack = ["def pack(self,buffer):"]
+    group = []
+
+    consts = {}
+
+    def flush():
+        # Single struct unpack/pack for consecutive integer/bytes fields
+        # (an 's' field is a single value whatever its length)
+        if not group:
+            return
+        fmt = "!" + "".join([ "%d%s" % (n,k) if n > 1 or k == 's' else k
+                                        for k,n,a in group ])
+        single = lambda k,n: n == 1 or k == 's'
+        s = "_s%d" % len(consts)
+        consts[s] = get_struct(fmt)
+        size = consts[s].size
+        parse.extend([
+            "        data = buffer.data",
+            "        offset = buffer.offset",
+            "        if offset + %d > len(data):" % size,
+            "            raise BufferError(\"Not enough bytes [offset=%%d,"
+                            "remaining=%%d,requested=%d]\" %% "
+                            "(offset,len(data) - offset))" % size,
+            "        buffer.offset = offset + %d" % size])
+        if all([ single(k,n) for k,n,a in group ]):
+            parse.append("        %s, = %s.unpack_from(data,offset)"
+                            % (",".join([ "rd." + store[a] for k,n,a in group ]),
+                               s))
+        elif len(group) == 1:
+            parse.append("        rd.%s = %s.unpack_from(data,offset)"
+                            % (store[group[0][2]],s))
+        else:
+            parse.append("        v = %s.unpack_from(data,offset)" % s)
+            i = 0
+            for k,n,a in group:
+                if single(k,n):
+                    parse.append("        rd.%s = v[%d]" % (store[a],i))
+                    i += 1
+                else:
+                    parse.append("        rd.%s = v[%d:%d]" % (store[a],i,i+n))
+                    i += n
+        pack.extend([
+            "    buffer.data += %s.pack(%s)" % (s,",".join([
+                            ("self." if single(k,n) else "*self.") + store[a]
+                                    for k,n,a in group ])),
+            "    buffer.offset += %d" % size])
+        del group[:]
+
+    init_args = []
+    init = []
+    zone_args = []
+    repr_fmt = []
+    repr_args = []
+    token = 0
+    for kind,count,attr in fields:
+        if kind in STRUCT:
+            group.append((kind,count,attr))
+        else:
+            flush()
+            if kind in ('name','name_nc'):
+                parse.append("        rd.%s = buffer.decode_name()" % store[attr])
+                pack.append("    buffer.%s(self.%s)" % ("encode_name" if kind == 'name'
+                                    else "encode_name_nocompress",store[attr]))
+            elif kind in CODECS:
+                c = "_c%d" % len(consts)
+                consts[c] = CODECS[kind]
+                parse.append("        rd.%s = %s.parse(buffer,start + length)"
+                                                            % (store[attr],c))
+                pack.append("    %s.pack(buffer,self.%s)" % (c,store[attr]))
+            elif kind == 'string':
+                parse.extend([
+                    "        (n,) = buffer.unpack('!B')",
+                    "        rd.%s = buffer.get(n)" % store[attr]])
+                pack.extend([
+                    "    buffer.pack('!B',len(self.%s))" % store[attr],
+                    "    buffer.append(self.%s)" % store[attr]])
+            else:
+                parse.extend([
+                    "        n = start + length - buffer.offset",
+                    "        if n < 0:",
+                    "            raise BufferError(\"Invalid rdata length [length=%d]\" % length)",
+                    "        rd.%s = buffer.get(n)" % store[attr]])
+                pack.append("    buffer.append(self.%s)" % store[attr])
+        # Generated __init__/fromZone/__repr__
+        init_args.append(attr)
+        if kind in INT_MAX and count > 1:
+            init.append("    self.%s = tuple(%s)" % (attr,attr))
+            zone_args.append("tuple([ int(x) for x in rd[%d:%d] ])" %
+                                                    (token,token+count))
+            repr_fmt.append("%s")
+            repr_args.append("\" \".join(map(str,self.%s))" % store[attr])
+        else:
+            init.append("    self.%s = %s" % (attr,attr))
+            if kind in CODECS:
+                c = [ k for k,v in consts.items() if v is CODECS[kind] ][0]
+                zone_args.append("%s.fromZone(rd[%d:%s])" % (c,token,
+                            "" if CODECS[kind].trailing else token + 1))
+                repr_fmt.append("%s")
+            elif kind in INT_MAX:
+                zone_args.append("int(rd[%d])" % token)
+                repr_fmt.append("%d")
+            elif kind in ('name','name_nc'):
+                zone_args.append("_label(rd[%d],origin)" % token)
+                repr_fmt.append("%s")
+            elif kind == 'string':
+                zone_args.append("rd[%d].encode()" % token)
+                repr_fmt.append("\\\"%s\\\"")
+            elif kind == 's':
+                zone_args.append("binascii.unhexlify(rd[%d].encode())" % token)
+                repr_fmt.append("%s")
+            elif kind == 'hex':
+                zone_args.append("binascii.unhexlify(\"\".join(rd[%d:]).encode())"
+                                                                    % token)
+                repr_fmt.append("%s")
+            else:
+                zone_args.append("base64.b64decode(\"\".join(rd[%d:]).encode())"
+                                                                    % token)
+                repr_fmt.append("%s")
+            if kind in CODECS:
+                repr_args.append("%s.toZone(self.%s)" % (c,store[attr]))
+            elif kind == 'string':
+                repr_args.append("self.%s.decode(errors='replace')" % store[attr])
+            elif kind in ('s','hex'):
+                repr_args.append("_hex(self.%s)" % store[attr])
+            elif kind == 'base64':
+                repr_args.append("_base64(self.%s)" % store[attr])
+            else:
+                repr_args.append("self.%s" % store[attr])
+        token += 1 if kind == 's' else count
+    flush()
+
+    parse.extend([
+        "        return rd",
+        "    except (BufferError,BimapError) as e:",
+        "        raise _error(\"Error unpacking %s [offset=%d]: %s\" % "
+                                "(cls.__name__,buffer.offset,e))"])
+    if len(pack) == 1:
+        pack.append("    pass")
+    source = {
+        'parse': "\n".join(parse),
+        'pack': "\n".join(pack),
+        '__init__': "\n".join(["def __init__(self,%s):" % ",".join(init_args)]
+                                    + init),
+        'fromZone': "def fromZone(cls,rd,origin=None):\n"
+                    "    return cls(%s)" % ",".join(zone_args),
+        '__repr__': "def __repr__(self):\n"
+                    "    return (\"%s\" %% (%s,)).rstrip()" % (
+                                " ".join(repr_fmt),",".join(repr_args)),
+    }
+    return source,consts
+
+def compile_schema(cls,error,label):
+    """
+        Generate methods/properties for RD subclass from cls.schema
+
+        'error' is the exception raised for parse errors and 'label' the
+        function used to create (origin relative) names in fromZone
+    """
+    fields = parse_schema(cls.schema)
+    slots = _slots(cls)
+    # Properties for fields with backing slot (unless already defined)
+    for kind,count,attr in fields:
+        if ("_" + attr) not in slots or \
+                any([ attr in c.__dict__ for c in cls.__mro__ ]):
+            continue
+        if kind in INT_MAX:
+            if count == 1:
+                prop = range_property(attr,0,INT_MAX[kind])
+            else:
+                prop = ntuple_range(attr,count,0,INT_MAX[kind])
+        elif kind in ('name','name_nc'):
+            prop = _label_property(attr)
+        elif kind == 's':
+            prop = _fixed_bytes_property(attr,count)
+        elif kind in CODECS:
+            continue
+        else:
+            prop = BYTES(attr)
+        setattr(cls,attr,prop)
+    namespace = { '_new':object.__new__,
+                  '_error':error, '_label':label, '_hex':_hex,
+                  '_base64':_base64, 'BufferError':BufferError,
+                  'BimapError':BimapError, 'binascii':binascii,
+                  'base64':base64 }
+    sources,consts = _codegen(cls,fields,slots)
+    namespace.update(consts)
+    for name,source in sources.items():
+        if name in ('parse','pack') or name not in cls.__dict__:
+            exec(compile(source,"<%s %s>" % (cls.__name__,name),"exec"),
+                 namespace)
+            f = namespace[name]
+            if name in ('parse','fromZone'):
+                f = classmethod(f)
+            setattr(cls,name,f)
+    if 'attrs' not in cls.__dict__:
+        cls.attrs = tuple([ attr for kind,count,attr in fields ])
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+    RateLimiter - DNS Response Rate Limiting (RRL)
+
+    Limits the rate of UDP responses for each (client network, qname,
+    response class) to stop the server being used as a reflection
+    amplifier. Each entry is a token bucket which is refilled at 'rate'
+    tokens/sec (up to 'burst') and each response costs one token.
+
+    Clients are grouped by network prefix (/24 for IPv4 and /56 for IPv6
+    by default) and the response class is one of RESPONSE (NOERROR),
+    NXDOMAIN or ERROR (other rcodes).
+
+    The check is made by DNSHandler before the request is passed to the
+    resolver (using the class of the last response for the entry) so
+    limited queries don't reach the resolver. Limited queries are either
+    dropped or (every 'slip' limited queries) answered with an empty
+    truncated (TC=1) response so that legitimate clients can retry over
+    TCP. TCP queries are never limited.
+
+    Entries are kept in a fixed size hash table (colliding entries replace
+    each other) so memory use is bounded regardless of the number of
+    clients/names. The table is held in arrays (entries are identified by
+    their 64-bit hash) so it doesn't create any objects for the garbage
+    collector to track. Updates are not locked - under contention a response
+    may occasionally be miscounted which is harmless for rate limiting.
+
+    >>> from dnslib import DNSLabel,RCODE
+    >>> rrl = RateLimiter(rate=5,slip=2,size=1024)
+    >>> qname = DNSLabel("abc.com")
+    >>> def query(address,qname,rcode=RCODE.NOERROR):
+    ...     action,slot = rrl.check(address,qname)
+    ...     if action == ALLOW:
+    ...         rrl.account(slot,rcode)
+    ...     return action
+    >>> [ query("1.2.3.4",qname) for i in range(10) ]
+    [0, 0, 0, 0, 0, 2, 1, 2, 1, 2]
+
+    Same /24 shares the bucket (names are case-insensitive) but other
+    networks/names don't
+
+    >>> query("1.2.3.99",DNSLabel("ABC.COM")), query("1.2.4.4",qname)
+    (1, 0)
+    >>> query("1.2.3.4",DNSLabel("www.abc.com"))
+    0
+    >>> query("2001:db8:0:1::1",qname), query("2001:db8:0:2::1",qname)
+    (0, 0)
+
+    Tokens are refilled over time
+
+    >>> slot = rrl.check("1.2.3.4",qname)[1]
+    >>> rrl.times[slot] -= 1.0
+    >>> query("1.2.3.4",qname)
+    0
+    >>> sorted(rrl.stats.items())
+    [('allowed', 10), ('dropped', 4), ('slipped', 3)]
+"""
+
+from __future__ import print_function
+
+import array,socket,time
+
+from dnslib.dns import RCODE
+
+# Actions
+ALLOW,SLIP,DROP = 0,1,2
+
+# Response classes
+RESPONSE,NXDOMAIN,ERROR = 0,1,2
+NCLASSES = 3
+
+def response_class(rcode):
+    if rcode == RCODE.NOERROR:
+        return RESPONSE
+    elif rcode == RCODE.NXDOMAIN:
+        return NXDOMAIN
+    else:
+        return ERROR
+
+class RateLimiter(object):
+
+    """
+        Token bucket rate limiter keyed on (client prefix,qname,class)
+    """
+
+    def __init__(self,rate=5,burst=None,slip=2,size=65536,
+                      ipv4_prefix=24,ipv6_prefix=56):
+        """
+            rate:           responses/sec allowed per entry
+            burst:          bucket size (default: rate)
+            slip:           send truncated response for every 'slip'
+                            limited queries (0: always drop, 1: always
+                            truncate)
+            size:           number of entries in table
+            ipv4_prefix:    IPv4 client prefix length
+            ipv6_prefix:    IPv6 client prefix length
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.slip = slip
+        self.size = size
+        self.mask4 = (2**32 - 1) ^ (2**(32 - ipv4_prefix) - 1)
+        self.mask6 = (2**128 - 1) ^ (2**(128 - ipv6_prefix) - 1)
+        self.keys = array.array('q',[0]) * size
+        self.times = array.array('d',[0.0]) * size
+        self.tokens = array.array('d',[self.burst]) * (size * NCLASSES)
+        self.last = bytearray(size)
+        self.slips = bytearray(size)
+        self.stats = {'allowed':0,'slipped':0,'dropped':0}
+
+    def prefix(self,address):
+        """
+            Return client network prefix (as integer)
+        """
+        if ':' in address:
+            packed = socket.inet_pton(socket.AF_INET6,address)
+            return (int.from_bytes(packed,'big') & self.mask6) | 2**128
+        else:
+            packed = socket.inet_aton(address)
+            return int.from_bytes(packed,'big') & self.mask4
+
+    def check(self,address,qname):
+        """
+            Check if response to client/qname is allowed - returns
+            (action,slot) where action is ALLOW/SLIP/DROP and slot is
+            passed to 'account' once the response has been generated
+        """
+        key = hash((self.prefix(address),b'.'.join(qname.label).lower()))
+        slot = key % self.size
+        now = time.monotonic()
+        if self.keys[slot] != key:
+            # New entry (or replace colliding entry)
+            self.keys[slot] = key
+            self.times[slot] = now
+            i = slot * NCLASSES
+            self.tokens[i:i+NCLASSES] = array.array('d',[self.burst]) * NCLASSES
+            self.last[slot] = RESPONSE
+            self.slips[slot] = 0
+            self.stats['allowed'] += 1
+            return ALLOW,slot
+        # Refill buckets
+        elapsed = now - self.times[slot]
+        self.times[slot] = now
+        i = slot * NCLASSES
+        for j in range(i,i+NCLASSES):
+            self.tokens[j] = min(self.burst,self.tokens[j] + elapsed * self.rate)
+        if self.tokens[i + self.last[slot]] >= 1:
+            self.stats['allowed'] += 1
+            return ALLOW,slot
+        if self.slip:
+            self.slips[slot] = (self.slips[slot] + 1) % self.slip
+            if self.slips[slot] == 0:
+                self.stats['slipped'] += 1
+                return SLIP,slot
+        self.stats['dropped'] += 1
+        return DROP,slot
+
+    def account(self,slot,rcode):
+        """
+            Charge response (with rcode) to entry
+        """
+        cls = response_class(rcode)
+        self.tokens[slot * NCLASSES + cls] -= 1
+        self.last[slot] = cls
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
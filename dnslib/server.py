@@ -7,7 +7,11 @@
 
         DNSServer   - socketserver wrapper (in most cases you should just
                       need to pass this an appropriate resolver instance
-                      and start in either foreground/background)
+                      and start in either foreground/background). TCP
+                      uses the non-blocking SelectorTCPServer (see
+                      tcpserver.py) which supports pipelined queries.
+                      DNS over TLS is enabled by passing a certificate
+                      (see tlsserver.py).
 
         DNSHandler  - handler instantiated by DNSServer to handle requests
                       The 'handle' method deals with the sending/receiving
@@ -23,7 +27,10 @@
         DNSLogger   - The class provides a default set of logging functions for
                       the various stages of the request handled by a DNSServer
                       instance which are enabled/disabled by flags in the 'log'
-                      class variable. 
+                      class variable. StructuredLogger (see structlogger.py)
+                      implements the same interface asynchronously with
+                      JSON/binary output and CaptureLogger (see capture.py)
+                      records the raw packets as dnstap/pcapng.
 
         Resolver    - Instance implementing a 'resolve' method that receives 
                       the decodes request packet and returns a response. 
@@ -31,6 +38,13 @@
                       To implement a custom resolver in most cases all you need
                       is to implement this interface.
 
+                      Resolvers which support RFC2136 dynamic updates can
+                      also implement an 'update' method which is called
+                      (instead of 'resolve') for UPDATE requests, and
+                      resolvers which support zone transfers a 'transfer'
+                      method (returning an iterable of packed messages)
+                      which is called for AXFR/IXFR requests.
+
                       Note that there is only a single instance of the Resolver
                       so need to be careful about thread-safety and blocking
 
@@ -79,18 +93,94 @@
         abc.def.                60      IN      A       1.2.3.4
         >>> server.stop()
 
+        Response rate limiting (see rrl.py) - limited UDP queries are
+        dropped or answered with a truncated response
+
+        >>> from dnslib.rrl import RateLimiter
+        >>> server = DNSServer(resolver,port=8053,address="localhost",
+        ...                    logger=DNSLogger("error"),
+        ...                    rrl=RateLimiter(rate=2,slip=1))
+        >>> server.start_thread()
+        >>> [ DNSRecord.parse(q.send("localhost",8053,timeout=2)).header.tc 
+        ...         for i in range(4) ]
+        [0, 0, 1, 1]
+        >>> server.stop()
+
+        Metrics (see metrics.py)
+
+        >>> from dnslib.metrics import ServerMetrics
+        >>> metrics = ServerMetrics()
+        >>> server = DNSServer(resolver,port=8053,address="localhost",
+        ...                    logger=DNSLogger("error"),metrics=metrics)
+        >>> server.start_thread()
+        >>> for name in ("abc.def","xyz.def"):
+        ...     _ = DNSRecord.question(name,"MX").send("localhost",8053,timeout=2)
+        >>> _ = q.send("localhost",8053,timeout=2)
+        >>> sorted(metrics.queries.values.items())
+        [(('A', 'udp'), 1), (('MX', 'udp'), 2)]
+        >>> metrics.responses.get(('NOERROR','udp'))
+        3
+        >>> server.stop()
+
+        Zone transfers are counted once (whatever the number of messages)
+
+        >>> class TransferResolver:
+        ...     def transfer(self,request,handler):
+        ...         for i in range(2):
+        ...             yield request.reply().pack()
+        >>> metrics = ServerMetrics()
+        >>> server = DNSServer(TransferResolver(),port=8053,address="localhost",
+        ...                    logger=DNSLogger("error"),metrics=metrics,
+        ...                    tcp=True)
+        >>> server.start_thread()
+        >>> _ = DNSRecord.question("def","AXFR").send("localhost",8053,
+        ...                                           tcp=True,timeout=2)
+        >>> metrics.queries.get(('AXFR','tcp')),metrics.responses.get(('NOERROR','tcp'))
+        (1, 1)
+        >>> server.stop()
+
+        UDP responses are limited to the client's EDNS0 buffer size (or
+        512 bytes) - whole RRsets are removed to fit (additional first)
+        and TC is set if answers had to be removed
+
+        >>> class LargeResolver:
+        ...     def resolve(self,request,handler):
+        ...         reply = request.reply()
+        ...         for i in range(20):
+        ...             reply.add_answer(*RR.fromZone("abc.def. 60 TXT %s" % ('x' * 40)))
+        ...         reply.add_ar(*RR.fromZone("abc.def. 60 A 1.2.3.4"))
+        ...         return reply
+        >>> server = DNSServer(LargeResolver(),port=8053,address="localhost",
+        ...                    logger=DNSLogger("error"))
+        >>> server.start_thread()
+        >>> a = DNSRecord.parse(q.send("localhost",8053,timeout=2))
+        >>> a.header.tc, len(a.rr), len(a.ar)
+        (1, 0, 0)
+        >>> q.add_ar(EDNS0(udp_len=4096))
+        >>> a = DNSRecord.parse(q.send("localhost",8053,timeout=2))
+        >>> a.header.tc, len(a.rr), len(a.ar)
+        (0, 20, 1)
+        >>> q.ar = [EDNS0(udp_len=1090)]
+        >>> a = DNSRecord.parse(q.send("localhost",8053,timeout=2))
+        >>> a.header.tc, len(a.rr), len(a.ar)
+        (0, 20, 0)
+        >>> server.stop()
+
 
 """
 from __future__ import print_function
 
-import binascii,socket,struct,threading,time
+import binascii,functools,socket,struct,threading,time
 
 try:
     import socketserver
 except ImportError:
     import SocketServer as socketserver
 
-from dnslib import DNSRecord,DNSError,QTYPE,RCODE,RR
+from dnslib import DNSRecord,DNSError,QTYPE,RCODE,OPCODE,RR,EDNS0
+from dnslib.rrl import DROP,SLIP
+from dnslib.tcpserver import SelectorTCPServer
+from dnslib.tlsserver import TLSServer
 
 class BaseResolver(object):
     """
@@ -121,14 +211,16 @@ class DNSHandler(socketserver.BaseRequestHandler):
         instance specified in <SocketServer>.resolver 
     """
 
-    udplen = 0                  # Max udp packet length (0 = ignore)
+    udplen = 0                  # Max udp packet length (0 = client 
+                                # EDNS0 buffer size or 512)
 
     def handle(self):
         if self.server.socket_type == socket.SOCK_STREAM:
-            self.protocol = 'tcp'
-            data = self.request.recv(8192)
-            length = struct.unpack("!H",bytes(data[:2]))[0]
-            while len(data) - 2 < length:
+            # 'tcp' or 'dot' (TLSServer) - both use TCP framing
+            self.protocol = getattr(self.server,'protocol','tcp')
+            data = b''
+            while len(data) < 2 or \
+                    len(data) - 2 < struct.unpack("!H",bytes(data[:2]))[0]:
                 new_data = self.request.recv(8192)
                 if not new_data:
                     break
@@ -141,37 +233,119 @@ class DNSHandler(socketserver.BaseRequestHandler):
         self.server.logger.log_recv(self,data)
 
         try:
-            rdata = self.get_reply(data)
-            self.server.logger.log_send(self,rdata)
+            for rdata in self.get_replies(data):
+                self.server.logger.log_send(self,rdata)
 
-            if self.protocol == 'tcp':
-                rdata = struct.pack("!H",len(rdata)) + rdata
-                self.request.sendall(rdata)
-            else:
-                connection.sendto(rdata,self.client_address)
+                if self.protocol != 'udp':
+                    rdata = struct.pack("!H",len(rdata)) + rdata
+                    self.request.sendall(rdata)
+                else:
+                    connection.sendto(rdata,self.client_address)
 
         except DNSError as e:
             self.server.logger.log_error(self,e)
+            if self.server.metrics:
+                self.server.metrics.parse_errors.inc((self.protocol,))
+
+    def get_replies(self,data):
+        """
+            Generate reply packet(s) - zone transfers (AXFR/IXFR) are
+            handed to the resolver 'transfer' method (if implemented)
+            which can return multiple messages
+        """
+        request = DNSRecord.parse(data)
+        self.server.logger.log_request(self,request)
+
+        resolver = self.server.resolver
+        if request.questions and \
+                request.q.qtype in (QTYPE.AXFR,QTYPE.IXFR) and \
+                hasattr(resolver,'transfer'):
+            # Counted as one query/response (rcode from first message)
+            metrics = self.server.metrics
+            if metrics:
+                metrics.queries.inc((QTYPE.get(request.q.qtype),
+                                     self.protocol))
+            first = True
+            for rdata in resolver.transfer(request,self):
+                if metrics and first:
+                    metrics.responses.inc((RCODE.get(rdata[3] & 0xf),
+                                           self.protocol))
+                    first = False
+                yield rdata
+        else:
+            rdata = self.reply(request)
+            if rdata is not None:
+                yield rdata
 
     def get_reply(self,data):
         request = DNSRecord.parse(data)
         self.server.logger.log_request(self,request)
+        return self.reply(request)
+
+    def reply(self,request):
+        # Response rate limiting (UDP only) is checked before resolving
+        # so that limited queries are cheap
+        rrl = self.server.rrl
+        metrics = self.server.metrics
+        if metrics and request.questions:
+            metrics.queries.inc((QTYPE.get(request.q.qtype),self.protocol))
+        if rrl and self.protocol == 'udp':
+            action,slot = rrl.check(self.client_address[0],request.q.qname)
+            if action == DROP:
+                if metrics:
+                    metrics.rrl.inc(('drop',))
+                return None
+            elif action == SLIP:
+                if metrics:
+                    metrics.rrl.inc(('slip',))
+                reply = request.reply()
+                reply.header.tc = 1
+                return reply.pack()
 
         resolver = self.server.resolver
-        reply = resolver.resolve(request,self)
+        start = time.perf_counter()
+        if request.header.opcode == OPCODE.UPDATE and \
+                hasattr(resolver,'update'):
+            reply = resolver.update(request,self)
+        else:
+            reply = resolver.resolve(request,self)
+        if metrics:
+            metrics.resolve_seconds.observe(time.perf_counter() - start,
+                                            (self.protocol,))
+            metrics.responses.inc((RCODE.get(reply.header.rcode),
+                                   self.protocol))
         self.server.logger.log_reply(self,reply)
 
+        if rrl and self.protocol == 'udp':
+            rrl.account(slot,reply.header.rcode)
+
         if self.protocol == 'udp':
             rdata = reply.pack()
-            if self.udplen and len(rdata) > self.udplen:
-                truncated_reply = reply.truncate()
+            size = self.udp_size(request)
+            if len(rdata) > size:
+                truncated_reply = reply.truncate(size)
                 rdata = truncated_reply.pack()
                 self.server.logger.log_truncated(self,truncated_reply)
+                if metrics:
+                    metrics.truncated.inc()
         else:
             rdata = reply.pack()
 
         return rdata
 
+    def udp_size(self,request):
+        """
+            Max UDP response size - the client's EDNS0 buffer size (or
+            512 bytes without EDNS0) capped at udplen (if set)
+        """
+        size = 512
+        for rr in request.ar:
+            if rr.rtype == QTYPE.OPT:
+                size = max(512,rr.edns_len)
+        if self.udplen:
+            size = min(size,self.udplen)
+        return size
+
 class DNSLogger:
 
     """
@@ -303,6 +477,10 @@ class UDPServer(socketserver.ThreadingMixIn,socketserver.UDPServer):
     allow_reuse_address = True
 
 class TCPServer(socketserver.ThreadingMixIn,socketserver.TCPServer):
+    """
+        Thread per connection TCP server (single query per connection) -
+        DNSServer uses SelectorTCPServer by default
+    """
     allow_reuse_address = True
 
 class DNSServer(object):
@@ -325,7 +503,11 @@ class DNSServer(object):
                       tcp=False,
                       logger=None,
                       handler=DNSHandler,
-                      server=None):
+                      server=None,
+                      rrl=None,
+                      certfile=None,
+                      keyfile=None,
+                      metrics=None):
         """
             resolver:   resolver instance
             address:    listen address (default: "")
@@ -333,16 +515,28 @@ class DNSServer(object):
             tcp:        UDP (false) / TCP (true) (default: False)
             logger:     logger instance (default: DNSLogger)
             handler:    handler class (default: DNSHandler)
-            server:     socketserver class (default: UDPServer/TCPServer)
+            server:     socketserver class (default: UDPServer/SelectorTCPServer)
+            rrl:        RateLimiter instance (default: None)
+            certfile:   TLS certificate - enables DNS over TLS (default: None)
+            keyfile:    TLS private key (default: key in certfile)
+            metrics:    ServerMetrics instance (default: None)
         """
         if not server:
-            if tcp:
-                server = TCPServer
+            if certfile:
+                server = functools.partial(TLSServer,certfile=certfile,
+                                                     keyfile=keyfile)
+            elif tcp:
+                server = SelectorTCPServer
             else:
                 server = UDPServer
         self.server = server((address,port),handler)
         self.server.resolver = resolver
         self.server.logger = logger or DNSLogger()
+        self.server.rrl = rrl
+        self.server.metrics = metrics
+        if metrics:
+            metrics.add_server(self.server,'tls' if certfile else
+                                           'tcp' if tcp else 'udp')
     
     def start(self):
         self.server.serve_forever()
@@ -356,7 +550,7 @@ class DNSServer(object):
         self.server.shutdown()
 
     def isAlive(self):
-        return self.thread.isAlive()
+        return self.thread.is_alive()
 
 if __name__ == "__main__":
     import doctest
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""
+    StructuredLogger - asynchronous structured DNSLogger
+
+    Implements the DNSLogger interface (and accepts the same 'log' hook
+    list) but the handler thread only appends a tuple of the raw values
+    (DNSLabel/integers - no string formatting) to a ring buffer. A
+    background writer thread drains the buffer and writes either JSON
+    lines or binary records.
+
+    The ring buffer is a collections.deque with a maximum length - appends
+    are atomic so handler threads never take a lock, and if the writer
+    falls behind the oldest records are discarded (and counted in
+    'dropped') rather than blocking the server. Disabled hooks are
+    replaced by a no-op method as in DNSLogger.
+
+    Sampling ('sample=N') logs 1 in N queries, chosen by DNS message ID
+    so that the request/reply (and recv/send) records for a query are
+    either all logged or all skipped. Errors are always logged.
+
+    >>> import io
+    >>> from dnslib import DNSRecord,RR
+    >>> class Handler:
+    ...     client_address = ('192.0.2.1',12345)
+    ...     protocol = 'udp'
+    >>> q = DNSRecord.question("abc.com","MX")
+    >>> q.header.id = 1234
+    >>> a = q.reply()
+    >>> a.add_answer(*RR.fromZone("abc.com. 60 MX 10 mail.abc.com."))
+
+    JSON lines
+
+    >>> out = io.StringIO()
+    >>> logger = StructuredLogger(out=out)
+    >>> logger.log_request(Handler(),q)
+    >>> logger.log_reply(Handler(),a)
+    >>> logger.log_error(Handler(),"Invalid packet")
+    >>> logger.close()
+    >>> for line in out.getvalue().splitlines():
+    ...     r = json.loads(line)
+    ...     print(sorted((k,v) for k,v in r.items() if k != 'time'))
+    [('client', '192.0.2.1'), ('event', 'request'), ('id', 1234), ('port', 12345), ('protocol', 'udp'), ('qname', 'abc.com.'), ('qtype', 'MX')]
+    [('client', '192.0.2.1'), ('event', 'reply'), ('id', 1234), ('port', 12345), ('protocol', 'udp'), ('qname', 'abc.com.'), ('qtype', 'MX'), ('rcode', 'NOERROR'), ('rrs', ['MX'])]
+    [('client', '192.0.2.1'), ('error', 'Invalid packet'), ('event', 'error'), ('port', 12345), ('protocol', 'udp')]
+
+    Binary records (see read_binary)
+
+    >>> out = io.BytesIO()
+    >>> logger = StructuredLogger("+recv",out=out,format="binary")
+    >>> logger.log_recv(Handler(),q.pack())
+    >>> logger.log_reply(Handler(),a)
+    >>> logger.close()
+    >>> for r in read_binary(io.BytesIO(out.getvalue())):
+    ...     print(EVENTS[r[0]],r[2:9],len(r[9]))
+    recv ('192.0.2.1', 12345, 'udp', 1234, None, None, None) 25
+    reply ('192.0.2.1', 12345, 'udp', 1234, 'abc.com.', 15, 0) 0
+
+    Maximum size (TCP) messages are logged whole
+
+    >>> out = io.BytesIO()
+    >>> logger = StructuredLogger("+send",out=out,format="binary")
+    >>> Handler.protocol = 'dot'
+    >>> logger.log_send(Handler(),q.pack() + b'x' * (65535 - len(q.pack())))
+    >>> logger.close()
+    >>> [ (r[4],len(r[9])) for r in read_binary(io.BytesIO(out.getvalue())) ]
+    [('dot', 65535)]
+    >>> Handler.protocol = 'udp'
+
+    Sampling
+
+    >>> out = io.StringIO()
+    >>> logger = StructuredLogger(out=out,sample=4)
+    >>> for i in range(100):
+    ...     q.header.id = i
+    ...     logger.log_request(Handler(),q)
+    >>> logger.close()
+    >>> len(out.getvalue().splitlines())
+    25
+"""
+
+from __future__ import print_function
+
+import collections,json,socket,struct,sys,threading,time
+
+from dnslib.dns import QTYPE,RCODE
+from dnslib.server import DNSLogger
+
+# Event types
+RECV,SEND,REQUEST,REPLY,TRUNCATED,ERROR = range(6)
+EVENTS = ('recv','send','request','reply','truncated','error')
+
+PROTOCOLS = ('udp','tcp','dot','doh')
+
+# Binary record:
+#   length (I) event (B) protocol (B) time (d) port (H) id (H) qtype (H)
+#   rcode (B) address length (B) qname length (B) rr count (H)
+#   data length (H) followed by address (packed), qname (ascii),
+#   rr types (H each) and data (raw packet or error message)
+BINARY_HEADER = struct.Struct("!IBBdHHHBBBHH")
+
+class StructuredLogger(DNSLogger):
+
+    """
+        Asynchronous DNSLogger writing JSON lines or binary records
+    """
+
+    def __init__(self,log="",out=None,format="json",sample=1,
+                      size=65536,interval=0.1):
+        """
+            log:        hooks to enable/disable (as DNSLogger)
+            out:        output file object (default: sys.stdout)
+            format:     'json' or 'binary'
+            sample:     log 1 in 'sample' queries
+            size:       ring buffer size (records)
+            interval:   writer flush interval (secs)
+        """
+        super(StructuredLogger,self).__init__(log)
+        if out is None:
+            out = sys.stdout.buffer if format == "binary" else sys.stdout
+        self.out = out
+        self.sample = sample
+        self.interval = interval
+        self.buffer = collections.deque(maxlen=size)
+        self.dropped = 0
+        try:
+            self.write_record = getattr(self,"write_" + format)
+        except AttributeError:
+            raise ValueError("Invalid format: %s" % format)
+        self.drain_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.writer = threading.Thread(target=self.run,name="dns-logger")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def push(self,record):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+
+    def sampled(self,id):
+        return self.sample == 1 or id % self.sample == 0
+
+    # Handler hooks (called in handler thread)
+
+    def log_recv(self,handler,data):
+        id = struct.unpack("!H",data[:2])[0] if len(data) >= 2 else 0
+        if self.sampled(id):
+            self.push((RECV,time.time(),handler.client_address,
+                       handler.protocol,id,None,None,None,(),data))
+
+    def log_send(self,handler,data):
+        id = struct.unpack("!H",data[:2])[0] if len(data) >= 2 else 0
+        if self.sampled(id):
+            self.push((SEND,time.time(),handler.client_address,
+                       handler.protocol,id,None,None,None,(),data))
+
+    def log_request(self,handler,request):
+        if self.sampled(request.header.id):
+            q = request.q
+            self.push((REQUEST,time.time(),handler.client_address,
+                       handler.protocol,request.header.id,
+                       q.qname,q.qtype,None,(),None))
+
+    def log_reply(self,handler,reply):
+        self.log_response(REPLY,handler,reply)
+
+    def log_truncated(self,handler,reply):
+        self.log_response(TRUNCATED,handler,reply)
+
+    def log_response(self,event,handler,reply):
+        if self.sampled(reply.header.id):
+            q = reply.q
+            self.push((event,time.time(),handler.client_address,
+                       handler.protocol,reply.header.id,q.qname,q.qtype,
+                       reply.header.rcode,tuple(rr.rtype for rr in reply.rr),
+                       None))
+
+    def log_error(self,handler,e):
+        self.push((ERROR,time.time(),handler.client_address,
+                   handler.protocol,None,None,None,None,(),e))
+
+    def log_data(self,dnsobj):
+        pass
+
+    # Writer
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.drain()
+        self.drain()
+
+    def drain(self):
+        with self.drain_lock:
+            buffer,write = self.buffer,self.write_record
+            n = 0
+            while True:
+                try:
+                    record = buffer.popleft()
+                except IndexError:
+                    break
+                try:
+                    write(record)
+                except Exception as e:
+                    print("Error writing log record: %s" % e,file=sys.stderr)
+                n += 1
+            if n:
+                self.out.flush()
+
+    def flush(self):
+        """
+            Write all buffered records (in calling thread)
+        """
+        self.drain()
+
+    def close(self):
+        """
+            Stop writer thread (after writing buffered records)
+        """
+        self.stopped.set()
+        self.writer.join()
+
+    def write_json(self,record):
+        event,t,address,protocol,id,qname,qtype,rcode,rtypes,data = record
+        r = {'time':t,'event':EVENTS[event],'client':address[0],
+             'port':address[1],'protocol':protocol}
+        if id is not None:
+            r['id'] = id
+        if qname is not None:
+            r['qname'] = str(qname)
+            r['qtype'] = QTYPE.get(qtype)
+        if rcode is not None:
+            r['rcode'] = RCODE.get(rcode)
+            r['rrs'] = [ QTYPE.get(t) for t in rtypes ]
+        if event == ERROR:
+            r['error'] = str(data)
+        elif data is not None:
+            r['data'] = data.hex()
+        self.out.write(json.dumps(r) + "\n")
+
+    def write_binary(self,record):
+        event,t,address,protocol,id,qname,qtype,rcode,rtypes,data = record
+        host = address[0]
+        packed = socket.inet_pton(socket.AF_INET6 if ':' in host
+                                        else socket.AF_INET,host)
+        name = str(qname).encode("ascii","replace") if qname is not None \
+                                                    else b''
+        if event == ERROR:
+            data = str(data).encode("utf8","replace")
+        data = (data or b'')[:65535]
+        body = packed + name[:255] + \
+                struct.pack("!%dH" % len(rtypes),*rtypes) + data
+        self.out.write(BINARY_HEADER.pack(BINARY_HEADER.size + len(body),
+                                   event,PROTOCOLS.index(protocol)
+                                            if protocol in PROTOCOLS else 255,
+                                   t,address[1],
+                                   id or 0,qtype or 0,rcode or 0,
+                                   len(packed),len(name[:255]),len(rtypes),
+                                   len(data)) + body)
+
+def read_binary(f):
+    """
+        Read binary log records - returns tuples of (event,time,address,
+        port,protocol,id,qname,qtype,rcode,data,rtypes) - id/qname/
+        qtype/rcode are None where not set for the event
+    """
+    while True:
+        header = f.read(BINARY_HEADER.size)
+        if len(header) < BINARY_HEADER.size:
+            return
+        (length,event,protocol,t,port,id,qtype,rcode,
+                addrlen,namelen,nrr,datalen) = BINARY_HEADER.unpack(header)
+        body = f.read(length - BINARY_HEADER.size)
+        address = socket.inet_ntop(socket.AF_INET6 if addrlen == 16
+                                        else socket.AF_INET,body[:addrlen])
+        offset = addrlen
+        qname = body[offset:offset+namelen].decode("ascii")
+        offset += namelen
+        rtypes = struct.unpack("!%dH" % nrr,body[offset:offset+2*nrr])
+        offset += 2 * nrr
+        data = body[offset:offset+datalen]
+        query = event in (REQUEST,REPLY,TRUNCATED)
+        response = event in (REPLY,TRUNCATED)
+        yield (event,t,address,port,
+               PROTOCOLS[protocol] if protocol < len(PROTOCOLS) else None,
+               id if event != ERROR else None,
+               qname if query else None,
+               qtype if query else None,
+               rcode if response else None,
+               data,rtypes)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
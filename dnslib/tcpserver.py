@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SelectorTCPServer - non-blocking DNS TCP server (RFC7766)
+
+    A single event loop thread (using selectors) accepts connections and
+    reads length-prefixed messages. Complete messages are handed to a
+    fixed pool of worker threads so that pipelined queries on the same
+    connection are processed concurrently, and responses are written back
+    (by the event loop) in the order they complete.
+
+    Each message is passed to the handler class (normally DNSHandler)
+    through a socket-like Request object, so handlers written for the
+    socketserver TCPServer work unchanged (the handler sees a connection
+    containing a single message and writes its response(s) with sendall).
+
+    Connections are closed if idle (no complete query received or
+    response sent) for 'idle_timeout' seconds or open for longer than
+    'connection_timeout' seconds, and new connections are closed
+    immediately once 'max_connections' are open. Reading from a
+    connection is paused while it has 'max_pipeline' queries in progress
+    (never more than half the workers, so one connection can't occupy
+    the whole pool) or more than 'max_buffer' bytes of unsent output.
+    Workers never block on a slow client - output is always queued, and
+    a connection whose unsent output passes 'max_output' bytes (a client
+    which isn't reading) is closed.
+
+    The server is a drop in replacement for socketserver.TCPServer in
+    DNSServer (serve_forever/shutdown/server_close).
+
+    >>> from dnslib import DNSRecord,RR,QTYPE,A,TXT
+    >>> from dnslib.server import DNSHandler
+    >>> class Resolver:
+    ...     def resolve(self,request,handler):
+    ...         reply = request.reply()
+    ...         if request.q.qname == "slow.abc.com":
+    ...             time.sleep(0.5)
+    ...         if request.q.qname == "big.abc.com":
+    ...             for i in range(60):
+    ...                 reply.add_answer(RR(request.q.qname,QTYPE.TXT,ttl=60,
+    ...                                     rdata=TXT("x" * 250)))
+    ...             return reply
+    ...         reply.add_answer(RR(request.q.qname,ttl=60,rdata=A("1.2.3.4")))
+    ...         return reply
+    >>> class Logger:
+    ...     def __getattr__(self,name):
+    ...         return lambda *args: None
+    >>> server = SelectorTCPServer(("localhost",8055),DNSHandler)
+    >>> server.resolver,server.logger = Resolver(),Logger()
+    >>> server.rrl = server.metrics = None
+    >>> server.idle_timeout = 1
+    >>> thread = threading.Thread(target=server.serve_forever)
+    >>> thread.start()
+
+    Pipelined queries - the slow query is answered last
+
+    >>> sock = socket.create_connection(("localhost",8055),timeout=5)
+    >>> for name in ("slow.abc.com","a.abc.com","b.abc.com"):
+    ...     data = DNSRecord.question(name).pack()
+    ...     sock.sendall(struct.pack("!H",len(data)) + data)
+    >>> def read(sock):
+    ...     length = struct.unpack("!H",sock.recv(2,socket.MSG_WAITALL))[0]
+    ...     return DNSRecord.parse(sock.recv(length,socket.MSG_WAITALL))
+    >>> [ str(read(sock).q.qname) for i in range(3) ]
+    ['a.abc.com.', 'b.abc.com.', 'slow.abc.com.']
+
+    Idle connections are closed
+
+    >>> time.sleep(2)
+    >>> sock.recv(1)
+    b''
+    >>> sock.close()
+
+    Clients which pipeline queries but never read don't hold up the
+    workers (or other clients)
+
+    >>> server.max_buffer = 65536
+    >>> stalled = []
+    >>> for i in range(2):
+    ...     s = socket.socket()
+    ...     s.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,4096)
+    ...     s.connect(("localhost",8055))
+    ...     data = DNSRecord.question("big.abc.com","TXT").pack()
+    ...     s.sendall((struct.pack("!H",len(data)) + data) * 2000)
+    ...     stalled.append(s)
+    >>> time.sleep(1)
+    >>> a = DNSRecord.question("a.abc.com").send("localhost",8055,tcp=True,
+    ...                                          timeout=2)
+    >>> str(DNSRecord.parse(a).rr[0].rdata)
+    '1.2.3.4'
+    >>> all([ c.pending <= server.max_pipeline and len(c.outbuf) <=
+    ...         server.max_buffer + server.max_pipeline * 65537
+    ...             for c in server.connections ])
+    True
+    >>> for s in stalled:
+    ...     s.close()
+
+    >>> server.shutdown()
+    >>> server.server_close()
+    >>> thread.join()
+"""
+
+from __future__ import print_function
+
+import collections,selectors,socket,struct,sys,threading,time,traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+class Connection(object):
+
+    """
+        Per-connection state (output buffer/pending count are shared
+        with the worker threads and protected by 'lock')
+    """
+
+    def __init__(self,sock,address,now):
+        self.sock = sock
+        self.address = address
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.created = self.active = now
+        self.events = 0
+        self.eof = False
+        self.closed = False
+        self.handshake = False      # TLS handshake in progress
+        self.want = 0               # Events needed to continue handshake
+
+class Request(object):
+
+    """
+        Socket-like object passed to handler - recv returns the message
+        (with length prefix) and sendall queues output on the connection
+    """
+
+    def __init__(self,server,conn,data):
+        self.server = server
+        self.conn = conn
+        self.data = data
+
+    def recv(self,bufsize):
+        data,self.data = self.data,b''
+        return data
+
+    def sendall(self,data):
+        self.server.write(self.conn,data)
+
+class SelectorTCPServer(object):
+
+    socket_type = socket.SOCK_STREAM
+    protocol = 'tcp'            # Handler protocol (logging/metrics)
+    address_family = socket.AF_INET
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    workers = 16                # Worker threads
+    max_connections = 256       # Max open connections
+    max_pipeline = 8            # Max queries in progress per connection
+    max_buffer = 1 << 20        # Pause reading above this unsent output
+    max_output = 16 << 20       # Close connection above this unsent output
+    idle_timeout = 10           # Close idle connections (secs)
+    connection_timeout = 120    # Max connection lifetime (secs)
+
+    # Socket errors which mean 'try again' on a non-blocking socket
+    wouldblock = (BlockingIOError,InterruptedError)
+
+    def __init__(self,server_address,RequestHandlerClass):
+        self.RequestHandlerClass = RequestHandlerClass
+        self.socket = socket.socket(self.address_family,self.socket_type)
+        if self.allow_reuse_address:
+            self.socket.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        try:
+            self.socket.bind(server_address)
+            self.socket.listen(self.request_queue_size)
+        except:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+        self.wakeup_r,self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.connections = set()
+        self.ready = collections.deque()
+        self.shutdown_request = False
+        self.stopped = threading.Event()
+
+    def serve_forever(self,poll_interval=0.5):
+        self.stopped.clear()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket,selectors.EVENT_READ,self.socket)
+        self.selector.register(self.wakeup_r,selectors.EVENT_READ,
+                                                            self.wakeup_r)
+        self.pool = ThreadPoolExecutor(self.workers)
+        last_expire = time.monotonic()
+        try:
+            while not self.shutdown_request:
+                for key,events in self.selector.select(poll_interval):
+                    if key.data is self.socket:
+                        self.accept()
+                    elif key.data is self.wakeup_r:
+                        self.drain_wakeup()
+                    elif key.data.handshake:
+                        self.do_handshake(key.data)
+                    else:
+                        conn = key.data
+                        if events & selectors.EVENT_READ:
+                            self.read(conn)
+                        if events & selectors.EVENT_WRITE and not conn.closed:
+                            self.flush(conn)
+                while self.ready:
+                    conn = self.ready.popleft()
+                    if not conn.closed:
+                        self.update(conn)
+                now = time.monotonic()
+                if now - last_expire >= poll_interval:
+                    self.expire(now)
+                    last_expire = now
+        finally:
+            for conn in list(self.connections):
+                self.close(conn)
+            self.pool.shutdown(wait=False)
+            self.selector.close()
+            self.shutdown_request = False
+            self.stopped.set()
+
+    def shutdown(self):
+        self.shutdown_request = True
+        self.wakeup()
+        self.stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.wakeup_r.close()
+        self.wakeup_w.close()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def wakeup(self):
+        try:
+            self.wakeup_w.send(b'\0')
+        except (BlockingIOError,OSError):
+            pass
+
+    def drain_wakeup(self):
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError,OSError):
+            pass
+
+    def accept(self):
+        while True:
+            try:
+                sock,address = self.socket.accept()
+            except (BlockingIOError,InterruptedError):
+                return
+            except OSError:
+                # eg. EMFILE - try again on next select
+                return
+            if len(self.connections) >= self.max_connections:
+                sock.close()
+                continue
+            sock.setblocking(False)
+            conn = Connection(sock,address,time.monotonic())
+            self.connections.add(conn)
+            self.setup(conn)
+            self.update(conn)
+
+    def setup(self,conn):
+        """
+            Initialise new connection (eg. start TLS handshake)
+        """
+        pass
+
+    def do_handshake(self,conn):
+        """
+            Continue handshake (connections with conn.handshake set)
+        """
+        pass
+
+    def recv(self,conn):
+        """
+            Read available data - returns None if no data available
+            and b'' at eof
+        """
+        try:
+            return conn.sock.recv(65536)
+        except self.wouldblock:
+            return None
+
+    def read(self,conn):
+        try:
+            data = self.recv(conn)
+        except OSError:
+            self.close(conn)
+            return
+        if data is None:
+            return
+        if not data:
+            # Client has closed (or half-closed) - finish pending queries
+            conn.eof = True
+            self.update(conn)
+            return
+        conn.inbuf += data
+        self.update(conn)
+
+    def dispatch(self,conn):
+        """
+            Hand complete messages to the workers - messages stay in
+            inbuf while the connection is at its pipeline limit or has
+            too much unsent output
+        """
+        limit = min(self.max_pipeline,max(1,self.workers // 2))
+        while len(conn.inbuf) >= 2:
+            length = struct.unpack_from("!H",conn.inbuf)[0]
+            if len(conn.inbuf) < length + 2:
+                break
+            with conn.lock:
+                if conn.pending >= limit or \
+                        len(conn.outbuf) > self.max_buffer:
+                    break
+                conn.pending += 1
+            msg = bytes(conn.inbuf[:length+2])
+            del conn.inbuf[:length+2]
+            conn.active = time.monotonic()
+            self.pool.submit(self.process,conn,msg)
+
+    def process(self,conn,msg):
+        """
+            Process message (in worker thread)
+        """
+        try:
+            self.RequestHandlerClass(Request(self,conn,msg),conn.address,self)
+        except Exception:
+            self.handle_error(conn,conn.address)
+        finally:
+            with conn.lock:
+                conn.pending -= 1
+            self.ready.append(conn)
+            self.wakeup()
+
+    def write(self,conn,data):
+        """
+            Queue output for connection (in worker thread) - never blocks
+            (the connection is closed by the event loop if more than
+            max_output bytes are unsent)
+        """
+        with conn.lock:
+            if conn.closed:
+                return
+            conn.outbuf += data
+        self.ready.append(conn)
+        self.wakeup()
+
+    def flush(self,conn):
+        with conn.lock:
+            try:
+                sent = conn.sock.send(conn.outbuf)
+            except self.wouldblock:
+                sent = 0
+            except OSError:
+                sent = -1
+            if sent > 0:
+                del conn.outbuf[:sent]
+        if sent < 0:
+            self.close(conn)
+            return
+        if sent:
+            conn.active = time.monotonic()
+        self.update(conn)
+
+    def update(self,conn):
+        """
+            Dispatch queued messages and update selector registration
+            for connection (read unless eof/too many queries in progress/
+            too much unsent output, write if output pending)
+        """
+        if not conn.handshake:
+            self.dispatch(conn)
+        with conn.lock:
+            pending,output = conn.pending,len(conn.outbuf)
+        if (conn.eof and not pending and not output) or \
+                output > self.max_output:
+            self.close(conn)
+            return
+        events = 0
+        if conn.handshake:
+            events = conn.want
+        elif not conn.eof and output <= self.max_buffer and \
+                pending < min(self.max_pipeline,max(1,self.workers // 2)):
+            events |= selectors.EVENT_READ
+        if output:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events:
+            if not conn.events:
+                self.selector.register(conn.sock,events,conn)
+            elif not events:
+                self.selector.unregister(conn.sock)
+            else:
+                self.selector.modify(conn.sock,events,conn)
+            conn.events = events
+
+    def expire(self,now):
+        for conn in list(self.connections):
+            if now - conn.created > self.connection_timeout:
+                self.close(conn)
+            elif now - conn.active > self.idle_timeout:
+                with conn.lock:
+                    busy = conn.pending or conn.outbuf
+                if not busy:
+                    self.close(conn)
+
+    def close(self,conn):
+        with conn.lock:
+            conn.closed = True
+        if conn.events:
+            self.selector.unregister(conn.sock)
+            conn.events = 0
+        conn.sock.close()
+        self.connections.discard(conn)
+
+    def handle_error(self,request,client_address):
+        print('-'*40,file=sys.stderr)
+        print('Exception happened during processing of request from',
+                client_address,file=sys.stderr)
+        traceback.print_exc()
+        print('-'*40,file=sys.stderr)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
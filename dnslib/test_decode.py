@@ -45,11 +45,22 @@
     Note - unittests are dynamically generated from the test directory contents
     (matched against the --glob parameter) 
 
+    The checked-in corpus (dnslib/test) doesn't need network access - it is
+    generated from local records (--corpus) and covers each RDMAP type,
+    EDNS, name compression edge cases and malformed packets (files with a
+    ';; MALFORMED:' line, which must raise DNSError when parsed). When
+    imported (eg. 'python -m unittest dnslib.test_decode' or pytest) the
+    corpus tests are added automatically.
+
+    The corpus can also be loaded with 'load_corpus' (used as the input
+    set for benchmarks/bench_codec.py)
+
 """
 
 from __future__ import print_function
 
-from dnslib.dns import DNSRecord
+from dnslib.dns import DNSRecord,DNSHeader,DNSQuestion,DNSError,RR,EDNS0,\
+                       EDNSOption,QTYPE
 from dnslib.digparser import DigParser
 
 import argparse,binascii,code,glob,os,os.path,sys,unittest
@@ -64,6 +75,8 @@ try:
 except NameError: 
     pass
 
+TESTDIR = os.path.join(os.path.dirname(__file__),"test")
+
 class TestContainer(unittest.TestCase):
     pass
 
@@ -102,8 +115,12 @@ def new_test(domain,qtype,address="8.8.8.8",port=53,nodig=False):
                         print(";; + %s" % d2)
             return
 
-    print("Writing test file: %s-%s" % (domain,qtype))
-    with open("%s-%s" % (domain,qtype),"w") as f:
+    write_test("%s-%s" % (domain,qtype),q,a_pkt)
+
+def write_test(name,q,a_pkt):
+    print("Writing test file: %s" % name)
+    a = DNSRecord.parse(a_pkt)
+    with open(name,"w") as f:
         print(";; Sending:",file=f)
         print(";; QUERY:",binascii.hexlify(q.pack()).decode(),file=f)
         print(q,file=f)
@@ -113,20 +130,273 @@ def new_test(domain,qtype,address="8.8.8.8",port=53,nodig=False):
         print(a,file=f)
         print(file=f)
 
+def write_malformed(name,description,data):
+    print("Writing test file: %s" % name)
+    with open(name,"w") as f:
+        print(";; %s" % description,file=f)
+        print(";; MALFORMED:",binascii.hexlify(data).decode(),file=f)
+
+# Offline corpus - (domain,qtype,[zone records]) for each RDMAP type
+
+CORPUS_RECORDS = [
+    ("example.com","A",["example.com. 300 IN A 192.0.2.1",
+                        "example.com. 300 IN A 192.0.2.2"]),
+    ("example.com","AAAA",["example.com. 300 IN AAAA 2001:db8::1",
+                           "example.com. 300 IN AAAA 2001:db8:0:1:2:3:4:5"]),
+    ("www.example.com","CNAME",["www.example.com. 300 IN CNAME example.com."]),
+    ("example.com","TXT",['example.com. 300 IN TXT "v=spf1 -all"',
+                          'example.com. 300 IN TXT "one" "two" "three"',
+                          'example.com. 300 IN TXT "%s"' % ("x" * 255)]),
+    ("example.com","MX",["example.com. 300 IN MX 10 mail.example.com.",
+                         "example.com. 300 IN MX 20 mail.example.net."]),
+    ("1.2.0.192.in-addr.arpa","PTR",
+                        ["1.2.0.192.in-addr.arpa. 300 IN PTR host.example.com."]),
+    ("example.com","SOA",["example.com. 300 IN SOA ns1.example.com. "
+                          "hostmaster.example.com. 2024010100 3600 600 "
+                          "86400 300"]),
+    ("example.com","NS",["example.com. 300 IN NS ns1.example.com.",
+                         "example.com. 300 IN NS ns2.example.net."]),
+    ("example.com","NAPTR",['example.com. 300 IN NAPTR 100 10 "U" "E2U+sip" '
+                            '"!^.*$!sip:info@example.com!" .',
+                            'example.com. 300 IN NAPTR 102 10 "S" "SIP+D2T" '
+                            '"" _sip._tcp.example.com.']),
+    ("_sip._tcp.example.com","SRV",["_sip._tcp.example.com. 300 IN SRV "
+                                    "10 60 5060 sip.example.com."]),
+    ("example.com","DNSKEY",["example.com. 300 IN DNSKEY 257 3 8 "
+                             "AwEAAagAIKlVZrpC6Ia7gEzahOR+9W29euxhJhVVLOyQbS"
+                             "EW0O8gcCjFFVQUTf6v58fLjwBd0YI0EzrAcQqBGCzh/RSt"
+                             "IoO8g0NfnfL2MTJRkxoXbfDaUeVPQuYEhg37NZWAJQ9Vnm"
+                             "Vo="]),
+    ("example.com","RRSIG",["example.com. 300 IN RRSIG A 8 2 300 "
+                            "20240201000000 20240101000000 12345 example.com. "
+                            "oJB1W6WNGv+ldvQ3WDG0MQkg5IEhjRip8WTrPYGv07h108dU"
+                            "KGMeDPKijVCHX3DDKdfb+v6oB9wfuh3DTJXUAfI="]),
+    ("example.com","CAA",['example.com. 300 IN CAA 0 issue "letsencrypt.org"',
+                          'example.com. 300 IN CAA 128 iodef '
+                          '"mailto:security@example.com"']),
+    ("example.com","DS",["example.com. 300 IN DS 60485 8 2 "
+                         "D4B7D520E7BB5F0F67674A0CCEB1E3E0614B93C4F9E99B83"
+                         "83F6A1E4469DA50A"]),
+    ("example.com","NSEC",["example.com. 300 IN NSEC www.example.com. "
+                           "A NS SOA MX TXT AAAA RRSIG NSEC DNSKEY CAA"]),
+    ("example.com","NSEC3",["example.com. 300 IN NSEC3 1 0 10 AABBCCDD "
+                            "2T7B4G4VSA5SMI47K61MV5BV1A22BOJR A RRSIG",
+                            "example.com. 300 IN NSEC3 1 1 0 - "
+                            "CK0POJMG874LJREF7EFN8430QVIT8BSM NS DS RRSIG"]),
+    ("example.com","NSEC3PARAM",["example.com. 300 IN NSEC3PARAM 1 0 10 "
+                                 "AABBCCDD"]),
+    ("_443._tcp.example.com","TLSA",["_443._tcp.example.com. 300 IN TLSA "
+                                     "3 1 1 0C72AC70B745AC19998811B131D662C9"
+                                     "AC69DBDBE7CB23E5B514B56664C5D3D6"]),
+    ("_dns.example.com","SVCB",['_dns.example.com. 300 IN SVCB 1 '
+                                'dns.example.com. alpn="dot,doq" port=853']),
+    ("example.com","HTTPS",['example.com. 300 IN HTTPS 1 . alpn="h2,h3" '
+                            'ipv4hint=192.0.2.1 ipv6hint=2001:db8::1',
+                            'example.com. 300 IN HTTPS 2 svc.example.net. '
+                            'mandatory=alpn alpn=h2 no-default-alpn']),
+]
+
+def corpus_records():
+    """
+        Yield (name,query,response packet) for offline corpus
+    """
+    n = 0x1000
+
+    def question(qname,qtype,edns=None):
+        q = DNSRecord(DNSHeader(id=n + len(qname)),
+                      q=DNSQuestion(qname,getattr(QTYPE,qtype)))
+        if edns:
+            q.add_ar(edns)
+        return q
+
+    # One query/response for each RD type (plus ANY for all of them)
+    every = []
+    for qname,qtype,zone in CORPUS_RECORDS:
+        q = question(qname,qtype)
+        a = q.reply()
+        for z in zone:
+            a.add_answer(*RR.fromZone(z))
+        every.extend(zone)
+        yield ("%s-%s" % (qname,qtype),q,a.pack())
+    q = question("example.com","ANY")
+    a = q.reply()
+    for z in every:
+        a.add_answer(*RR.fromZone(z))
+    yield ("example.com-ANY",q,a.pack())
+
+    # Negative answers
+    q = question("missing.example.com","A")
+    a = q.reply()
+    a.header.rcode = 3
+    a.add_auth(*RR.fromZone(CORPUS_RECORDS[6][2][0]))
+    yield ("missing.example.com-A",q,a.pack())
+
+    # Referral (NS + glue)
+    q = question("www.example.com","A")
+    a = q.reply()
+    a.header.aa = 0
+    a.add_auth(*RR.fromZone("example.com. 172800 IN NS ns1.example.com."))
+    a.add_auth(*RR.fromZone("example.com. 172800 IN NS ns2.example.com."))
+    a.add_ar(*RR.fromZone("ns1.example.com. 172800 IN A 192.0.2.53"))
+    a.add_ar(*RR.fromZone("ns2.example.com. 172800 IN AAAA 2001:db8::53"))
+    yield ("referral-www.example.com-A",q,a.pack())
+
+    # EDNS (DO flag, cookie/client-subnet options)
+    cookie = EDNSOption(10,binascii.unhexlify("0123456789abcdef"))
+    q = question("example.com","A",EDNS0(udp_len=1232,flags="do",
+                                         opts=[cookie]))
+    a = q.reply()
+    a.add_answer(*RR.fromZone(CORPUS_RECORDS[0][2][0]))
+    a.add_ar(EDNS0(udp_len=1232,flags="do",
+                   opts=[cookie,EDNSOption(8,b"\x00\x01\x18\x00\xc0\x00\x02")]))
+    yield ("edns-example.com-A",q,a.pack())
+    q = question("example.com","TXT",EDNS0(udp_len=4096))
+    a = q.reply()
+    a.add_answer(*RR.fromZone(CORPUS_RECORDS[3][2][2]))
+    a.add_ar(EDNS0(udp_len=4096))
+    yield ("edns-example.com-TXT",q,a.pack())
+
+    # Root/max length names
+    q = question(".","NS")
+    a = q.reply()
+    for c in "abc":
+        a.add_answer(*RR.fromZone(". 518400 IN NS %s.root-servers.net." % c))
+    yield ("root-NS",q,a.pack())
+    label = "a" * 63
+    name = ".".join([label,label,label,"b" * 61])
+    q = question(name,"A")
+    a = q.reply()
+    a.add_answer(*RR.fromZone("%s. 60 IN A 192.0.2.1" % name))
+    yield ("maxlength-A",q,a.pack())
+
+    # Name compression edge cases (hand built packets)
+    for name,data in CORPUS_PACKETS:
+        a = DNSRecord.parse(binascii.unhexlify(data))
+        q = DNSRecord(DNSHeader(id=a.header.id),q=a.q)
+        yield (name,q,binascii.unhexlify(data))
+
+# Hand built response packets - name compression edge cases
+#   compression-chain:  answer rdata points to a pointer (pointer chain)
+#   compression-none:   no compression used (repacked shorter)
+#   compression-rdata:  names compressed against names in SOA rdata
+#   compression-case:   mixed case names (case preserved through pointers)
+
+CORPUS_PACKETS = [
+    ("compression-chain",
+     "12348180000100020000000003777777076578616d706c6503636f6d0000050001"
+     "c00c000500010000012c0007046d61696ec010c02d000100010000012c0004c0000201"),
+    ("compression-none",
+     "12358180000100010000000003777777076578616d706c6503636f6d0000010001"
+     "03777777076578616d706c6503636f6d00000100010000012c0004c0000201"),
+    ("compression-rdata",
+     "1236818300010000000100000578797a7a79076578616d706c6503636f6d0000010001"
+     "c012000600010000012c0027036e7331c0120a686f73746d6173746572c01278a3f174"
+     "00000e1000000258000151800000012c"),
+    ("compression-case",
+     "12378180000100010000000003575757074578416d506c4503436f4d0000010001"
+     "c00c000100010000012c0004c0000201"),
+]
+
+# Malformed packets (must raise DNSError)
+
+MALFORMED_PACKETS = [
+    ("short-header","Header truncated",
+     "1234010000010000"),
+    ("short-question","Question truncated (missing qclass)",
+     "12340100000100000000000007657861"
+     "6d706c6503636f6d000001"),
+    ("pointer-forward","Name pointer forwards past end of packet",
+     "123401000001000000000000c02000010001"),
+    ("pointer-loop","Name pointer to itself",
+     "123401000001000000000000c00c00010001"),
+    ("pointer-cycle","Name pointers forming a loop",
+     "1234010000010000000000000161c00c00010001"),
+    ("label-overrun","Label length past end of packet",
+     "1234010000010000000000003f616263"),
+    ("label-invalid","Label not valid UTF-8",
+     "12340100000100000000000002fffe0000010001"),
+    ("count-mismatch","Answer count larger than answers present",
+     "12348180000100020000000007657861"
+     "6d706c6503636f6d0000010001c00c00"
+     "0100010000003c000401020304"),
+    ("rdata-truncated","RDATA truncated",
+     "12348180000100010000000007657861"
+     "6d706c6503636f6d0000010001c00c00"
+     "0100010000003c0004010203"),
+    ("svcb-port","HTTPS port SvcParam not 2 bytes",
+     "12348180000100010000000007657861"
+     "6d706c6503636f6d0000410001c00c00"
+     "4100010000012c00080001000003000101"),
+    ("svcb-alpn","HTTPS alpn SvcParam entry longer than value",
+     "12348180000100010000000007657861"
+     "6d706c6503636f6d0000410001c00c00"
+     "4100010000012c000a00010000010003036832"),
+    ("svcb-ipv4hint","HTTPS ipv4hint SvcParam not a multiple of 4 bytes",
+     "12348180000100010000000007657861"
+     "6d706c6503636f6d0000410001c00c00"
+     "4100010000012c000a00010000040003c00002"),
+]
+
+def new_corpus():
+    """
+        Create offline corpus in current directory
+    """
+    for name,q,a_pkt in corpus_records():
+        write_test(name,q,a_pkt)
+    for name,description,data in MALFORMED_PACKETS:
+        write_malformed("malformed-%s" % name,description,
+                        binascii.unhexlify(data))
+
+def load_corpus(testdir=TESTDIR,pattern="*"):
+    """
+        Return list of (name,query data,response data) from test dir
+        (malformed packets are skipped)
+    """
+    corpus = []
+    for f in sorted(glob.glob(os.path.join(testdir,pattern))):
+        if os.path.isfile(f):
+            qdata = rdata = None
+            with open(f,'rb') as x:
+                for l in x.readlines():
+                    if l.startswith(b';; QUERY:'):
+                        qdata = binascii.unhexlify(l.split()[-1])
+                    elif l.startswith(b';; RESPONSE:'):
+                        rdata = binascii.unhexlify(l.split()[-1])
+            if qdata and rdata:
+                corpus.append((os.path.basename(f),qdata,rdata))
+    return corpus
+
 def check_decode(f,debug=False):
     errors = []
 
-    # Parse the q/a records
-    with open(f) as x:
-        q,r = DigParser(x)
-
     # Grab the hex data
+    malformed = None
     with open(f,'rb') as x:
         for l in x.readlines():
             if l.startswith(b';; QUERY:'):
                 qdata = binascii.unhexlify(l.split()[-1])
             elif l.startswith(b';; RESPONSE:'):
                 rdata = binascii.unhexlify(l.split()[-1])
+            elif l.startswith(b';; MALFORMED:'):
+                malformed = binascii.unhexlify(l.split()[-1])
+
+    # Malformed packets should raise DNSError (any other exception
+    # propagates as a test error)
+    if malformed is not None:
+        try:
+            DNSRecord.parse(malformed)
+            errors.append(('Malformed',malformed))
+        except DNSError:
+            pass
+        if debug:
+            print("ERROR\n" if errors else "OK")
+            if errors:
+                print_errors(errors)
+        return errors
+
+    # Parse the q/a records
+    with open(f) as x:
+        q,r = DigParser(x)
 
     # Parse the hex data
     qparse = DNSRecord.parse(qdata)
@@ -202,20 +472,35 @@ def print_errors(errors):
             print(DNSRecord.parse(err_data[0]))
             print("RPACK:",binascii.hexlify(err_data[1]))
             print(DNSRecord.parse(err_data[1]))
+        elif err == 'Malformed':
+            print("Malformed packet parsed without error")
+            print("DATA:",binascii.hexlify(err_data))
 
-def test_generator(f):
+def make_test(f):
     def test(self):
         self.assertEqual(check_decode(f),[])
     return test
 
+def add_tests(testdir,pattern="*"):
+    for f in glob.iglob(os.path.join(testdir,pattern)):
+        if os.path.isfile(f):
+            test_name = 'test_%s' % os.path.basename(f)
+            setattr(TestContainer,test_name,make_test(f))
+
+if __name__ != '__main__':
+    # Collect corpus when loaded by unittest/pytest
+    add_tests(TESTDIR)
+
 if __name__ == '__main__':
 
-    testdir = os.path.join(os.path.dirname(__file__),"test")
+    testdir = TESTDIR
 
     p = argparse.ArgumentParser(description="Test Decode")
     p.add_argument("--new","-n",nargs=2,
                     metavar="<domain/type>",
                     help="Create new test case (args: <domain> <type>)")
+    p.add_argument("--corpus",action='store_true',default=False,
+                    help="Create offline corpus (no network access)")
     p.add_argument("--nodig",action='store_true',default=False,
                     help="Don't test new data against DiG")
     p.add_argument("--unittest",action='store_true',default=True,
@@ -249,6 +534,8 @@ if __name__ == '__main__':
         os.chdir(args.testdir)
         if args.new:
             new_test(*args.new,nodig=args.nodig)
+        elif args.corpus:
+            new_corpus()
         elif args.interactive:
             for f in glob.iglob(args.glob):
                 if os.path.isfile(f):
@@ -262,11 +549,7 @@ if __name__ == '__main__':
                         else:
                             print("OK")
         elif args.unittest:
-            for f in glob.iglob(args.glob):
-                if os.path.isfile(f):
-                    test_name = 'test_%s' % f
-                    test = test_generator(f)
-                    setattr(TestContainer,test_name,test)
+            add_tests(".",args.glob)
             unittest.main(argv=[__name__],
                           verbosity=2 if args.verbose else 1,
                           failfast=args.failfast)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+    TLSServer - DNS over TLS (RFC7858) server
+
+    Extends SelectorTCPServer (so uses the same DNSHandler framing,
+    pipelining, timeouts and connection limits) with a non-blocking TLS
+    handshake on each new connection.
+
+    Handshake cost is only paid once per client:
+
+        - Connections are persistent (until idle_timeout) and can be
+          used for any number of (pipelined) queries
+        - A single SSLContext is shared by all connections so TLS1.2
+          session IDs and TLS1.3 session tickets allow clients to resume
+          sessions on new connections (abbreviated handshake)
+
+    The certificate/key files are checked for changes every
+    'reload_interval' seconds and reloaded without restarting (existing
+    connections continue with the old certificate). If the new files
+    can't be loaded the current certificate is kept.
+
+    >>> import os,subprocess,tempfile
+    >>> from dnslib import DNSRecord,RR,A
+    >>> from dnslib.server import DNSServer,DNSLogger
+    >>> d = tempfile.mkdtemp()
+    >>> cert,key = os.path.join(d,"cert.pem"),os.path.join(d,"key.pem")
+    >>> def mkcert(cn):
+    ...     subprocess.check_call(["openssl","req","-x509","-newkey","rsa:2048",
+    ...                            "-nodes","-days","1","-subj","/CN=" + cn,
+    ...                            "-keyout",key,"-out",cert],
+    ...                           stderr=subprocess.DEVNULL)
+    >>> mkcert("dns1.example")
+    >>> class Resolver:
+    ...     protocols = set()
+    ...     def resolve(self,request,handler):
+    ...         self.protocols.add(handler.protocol)
+    ...         reply = request.reply()
+    ...         reply.add_answer(RR(request.q.qname,ttl=60,rdata=A("1.2.3.4")))
+    ...         return reply
+    >>> server = DNSServer(Resolver(),port=8853,address="localhost",
+    ...                    logger=DNSLogger("error"),
+    ...                    certfile=cert,keyfile=key)
+    >>> server.server.reload_interval = 0.1
+    >>> server.start_thread()
+
+    >>> ctx = ssl.create_default_context(cafile=cert)
+    >>> ctx.check_hostname = False
+    >>> def connect(session=None):
+    ...     sock = socket.create_connection(("localhost",8853),timeout=5)
+    ...     return ctx.wrap_socket(sock,session=session)
+    >>> def query(sock,name):
+    ...     data = DNSRecord.question(name).pack()
+    ...     sock.sendall(struct.pack("!H",len(data)) + data)
+    ...     length = struct.unpack("!H",sock.recv(2))[0]
+    ...     data = b''
+    ...     while len(data) < length:
+    ...         data += sock.recv(length - len(data))
+    ...     return DNSRecord.parse(data)
+
+    Multiple queries on one connection
+
+    >>> s = connect()
+    >>> [ str(query(s,"q%d.abc.com" % i).rr[0].rdata) for i in range(3) ]
+    ['1.2.3.4', '1.2.3.4', '1.2.3.4']
+    >>> Resolver.protocols
+    {'dot'}
+    >>> session = s.session
+    >>> s.close()
+
+    Session resumption
+
+    >>> s = connect(session)
+    >>> str(query(s,"abc.com").rr[0].rdata), s.session_reused
+    ('1.2.3.4', True)
+    >>> s.close()
+
+    Certificate reload
+
+    >>> mkcert("dns2.example")
+    >>> time.sleep(1)
+    >>> ctx = ssl.create_default_context(cafile=cert)
+    >>> ctx.check_hostname = False
+    >>> s = connect()
+    >>> dict(x[0] for x in s.getpeercert()['subject'])['commonName']
+    'dns2.example'
+    >>> s.close()
+
+    >>> server.stop()
+    >>> server.server.server_close()
+    >>> for f in (cert,key):
+    ...     os.remove(f)
+    >>> os.rmdir(d)
+"""
+
+from __future__ import print_function
+
+import os,selectors,socket,ssl,struct,sys,time
+
+from dnslib.tcpserver import SelectorTCPServer
+
+class TLSServer(SelectorTCPServer):
+
+    protocol = 'dot'
+
+    wouldblock = (BlockingIOError,InterruptedError,
+                  ssl.SSLWantReadError,ssl.SSLWantWriteError)
+
+    reload_interval = 60        # Check certificate for changes (secs)
+
+    def __init__(self,server_address,RequestHandlerClass,
+                      certfile=None,keyfile=None):
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.cert_stat = self.stat()
+        self.context = self.create_context()
+        self.last_check = time.monotonic()
+        super(TLSServer,self).__init__(server_address,RequestHandlerClass)
+
+    def create_context(self):
+        """
+            Create server SSLContext (override to customise)
+        """
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.set_alpn_protocols(["dot"])
+        context.load_cert_chain(self.certfile,self.keyfile)
+        return context
+
+    def stat(self):
+        return [ (st.st_mtime_ns,st.st_size) for st in
+                    [ os.stat(f) for f in (self.certfile,self.keyfile) if f ] ]
+
+    def reload_certificate(self):
+        """
+            Reload certificate/key if changed - returns True if reloaded
+        """
+        try:
+            cert_stat = self.stat()
+            if cert_stat == self.cert_stat:
+                return False
+            self.context = self.create_context()
+            self.cert_stat = cert_stat
+            return True
+        except (OSError,ssl.SSLError) as e:
+            # Keep current certificate (files may be partially written)
+            print("Error reloading certificate: %s" % e,file=sys.stderr)
+            return False
+
+    def setup(self,conn):
+        # Handshake is sent as several small writes - avoid Nagle delay
+        conn.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        conn.sock = self.context.wrap_socket(conn.sock,server_side=True,
+                                             do_handshake_on_connect=False)
+        conn.handshake = True
+        self.do_handshake(conn)
+
+    def do_handshake(self,conn):
+        try:
+            conn.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            conn.want = selectors.EVENT_READ
+        except ssl.SSLWantWriteError:
+            conn.want = selectors.EVENT_WRITE
+        except OSError:
+            self.close(conn)
+            return
+        else:
+            conn.handshake = False
+            # Client may have sent query with handshake
+            if conn.sock.pending():
+                self.read(conn)
+        if not conn.closed:
+            self.update(conn)
+
+    def recv(self,conn):
+        # Decrypted data may be buffered in SSL object (not signalled by
+        # select) so read until nothing pending
+        data = b''
+        while True:
+            try:
+                chunk = conn.sock.recv(65536)
+            except self.wouldblock:
+                return data or None
+            if not chunk:
+                return data
+            data += chunk
+            if not conn.sock.pending():
+                return data
+
+    def expire(self,now):
+        super(TLSServer,self).expire(now)
+        if now - self.last_check >= self.reload_interval:
+            self.last_check = now
+            self.reload_certificate()
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
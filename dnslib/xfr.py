@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Zone transfers (AXFR/IXFR)
+
+    pack_messages   - pack RRs directly into as many response messages
+                      as needed (used by ZoneResolver to stream transfers
+                      over TCP without building a single DNSRecord)
+
+    transfer        - request AXFR/IXFR from primary and return the full
+                      zone or the incremental changes
+
+    Secondary       - thread which keeps a zone in a ZoneResolver in sync
+                      with a primary (IXFR where possible, AXFR otherwise)
+
+    Start a primary with an UPDATE journal (so it can serve IXFR)
+
+    >>> import os,tempfile
+    >>> from dnslib import RR,DNSRecord,DNSHeader,DNSQuestion,QTYPE,OPCODE,A
+    >>> from dnslib.server import DNSServer,DNSLogger
+    >>> from dnslib.zoneresolver import ZoneResolver
+    >>> zone = '''
+    ... $ORIGIN abc.com.
+    ... @       3600 SOA   ns1 admin 2014010100 3600 600 86400 60
+    ... @       3600 NS    ns1
+    ... ns1     60   A     1.2.3.4
+    ... '''
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> primary = ZoneResolver(zone,journal=path,
+    ...                        allow_update=["127.0.0.1"],
+    ...                        allow_transfer=["127.0.0.1"])
+    >>> primary.zone.add(*[ RR("h%d.abc.com" % i,rdata=A("10.0.%d.%d" % (i//256,i%256)))
+    ...                          for i in range(2000) ])
+    >>> logger = DNSLogger("-request,-reply",False)
+    >>> server = DNSServer(primary,port=8054,address="localhost",
+    ...                    tcp=True,logger=logger)
+    >>> server.start_thread()
+
+    AXFR (the zone is split over multiple messages)
+
+    >>> kind,soa,rrs = transfer("abc.com","localhost",8054,timeout=5)
+    >>> kind, soa.rdata.times[0], len(rrs)
+    ('axfr', 2014010100, 2003)
+
+    Secondary pulls full zone and then incremental changes
+
+    >>> resolver = ZoneResolver("")
+    >>> secondary = Secondary(resolver,"abc.com","localhost",8054,timeout=5)
+    >>> secondary.refresh()
+    'axfr'
+    >>> len(resolver.zone)
+    2003
+    >>> secondary.refresh()
+    'current'
+
+    >>> class Handler:
+    ...     client_address = ('127.0.0.1',12345)
+    >>> update = DNSRecord(DNSHeader(opcode=OPCODE.UPDATE),
+    ...                    q=DNSQuestion("abc.com",QTYPE.SOA),
+    ...                    auth=RR.fromZone("www.abc.com. 60 A 5.6.7.8"))
+    >>> _ = primary.update(update,Handler())
+    >>> update.auth = [ RR("h0.abc.com",QTYPE.ANY,255,0,'') ]
+    >>> _ = primary.update(update,Handler())
+    >>> secondary.refresh()
+    'ixfr'
+    >>> resolver.soa("abc.com").rdata.times[0]
+    2014010102
+    >>> for rr in resolver.zone.get("www.abc.com"):
+    ...     print(rr)
+    www.abc.com.            60      IN      A       5.6.7.8
+    >>> "h0.abc.com" in resolver.zone, len(resolver.zone)
+    (False, 2003)
+    >>> sorted(map(str,resolver.zone)) == sorted(map(str,primary.zone))
+    True
+
+    >>> server.stop()
+    >>> os.remove(path)
+"""
+
+from __future__ import print_function
+
+import socket,struct,threading
+
+from dnslib.dns import DNSRecord,DNSHeader,DNSQuestion,RR,QTYPE,RCODE,SOA
+from dnslib.label import DNSBuffer
+
+MESSAGE_SIZE = 16384
+
+class TransferError(Exception):
+    pass
+
+def pack_messages(request,rrs,limit=MESSAGE_SIZE):
+    """
+        Generator packing RRs into response messages (a new message is
+        started once the current message exceeds 'limit' bytes)
+    """
+    header = DNSHeader(id=request.header.id,
+                       bitmap=request.header.bitmap,
+                       qr=1,aa=1,ra=1,
+                       q=len(request.questions))
+    buffer = None
+    for rr in rrs:
+        if buffer is None:
+            buffer = DNSBuffer()
+            header.pack(buffer)
+            for q in request.questions:
+                q.pack(buffer)
+            count = 0
+        rr.pack(buffer)
+        count += 1
+        if buffer.offset >= limit:
+            buffer.update(6,"!H",count)
+            yield bytes(buffer.data)
+            buffer = None
+    if buffer is not None:
+        buffer.update(6,"!H",count)
+        yield bytes(buffer.data)
+
+def read_messages(sock):
+    """
+        Generator reading length-prefixed messages from TCP socket
+    """
+    data = b''
+    while True:
+        while len(data) >= 2:
+            length = struct.unpack("!H",data[:2])[0]
+            if len(data) - 2 < length:
+                break
+            yield data[2:2+length]
+            data = data[2+length:]
+        new = sock.recv(65536)
+        if not new:
+            return
+        data += new
+
+def transfer(origin,address,port=53,soa=None,timeout=None):
+    """
+        Request zone transfer from primary - IXFR if current SOA is
+        given, otherwise AXFR. Returns (kind,soa,data) where kind is:
+
+            'current'   - zone is up to date (data is None)
+            'axfr'      - data is list of zone RRs (including SOA)
+            'ixfr'      - data is list of (origin,serial_from,serial_to,
+                          deleted,added) changes (as in Journal)
+    """
+    qtype = QTYPE.IXFR if soa else QTYPE.AXFR
+    request = DNSRecord(q=DNSQuestion(origin,qtype))
+    if soa:
+        request.add_auth(soa)
+    data = request.pack()
+    sock = socket.create_connection((address,port),timeout)
+    try:
+        sock.sendall(struct.pack("!H",len(data)) + data)
+        messages = read_messages(sock)
+        msg = next(messages,None)
+        if msg is None:
+            raise TransferError("Transfer failed: no response")
+        reply = DNSRecord.parse(msg)
+        if reply.header.id != request.header.id:
+            raise TransferError("Transfer ID mismatch")
+        if reply.header.rcode != RCODE.NOERROR:
+            raise TransferError("Transfer failed: %s" %
+                                        RCODE.get(reply.header.rcode))
+        if not reply.rr or reply.rr[0].rtype != QTYPE.SOA:
+            raise TransferError("Transfer must start with SOA")
+        if soa and len(reply.rr) == 1:
+            return ('current',reply.rr[0],None)
+        return parse_transfer(origin,reply.rr[0],
+                              rr_stream(reply.rr[1:],messages),
+                              qtype == QTYPE.IXFR)
+    finally:
+        sock.close()
+
+def rr_stream(rrs,messages):
+    """
+        Generator returning RRs from first message and the remaining
+        messages in transfer
+    """
+    for rr in rrs:
+        yield rr
+    for msg in messages:
+        reply = DNSRecord.parse(msg)
+        if reply.header.rcode != RCODE.NOERROR:
+            raise TransferError("Transfer failed: %s" %
+                                        RCODE.get(reply.header.rcode))
+        for rr in reply.rr:
+            yield rr
+
+def parse_transfer(origin,soa,stream,ixfr):
+    """
+        Parse transfer RRs following the initial SOA (see RFC1995/5936)
+    """
+    def next_rr():
+        try:
+            return next(stream)
+        except StopIteration:
+            raise TransferError("Incomplete transfer")
+    serial = soa.rdata.times[0]
+    rr = next_rr()
+    if ixfr and rr.rtype == QTYPE.SOA and rr.rdata.times[0] != serial:
+        # Incremental - sequence of (old SOA,deleted,new SOA,added)
+        changes = []
+        while rr.rdata.times[0] != serial:
+            deleted = [rr]
+            rr = next_rr()
+            while rr.rtype != QTYPE.SOA:
+                deleted.append(rr)
+                rr = next_rr()
+            added = [rr]
+            rr = next_rr()
+            while rr.rtype != QTYPE.SOA:
+                added.append(rr)
+                rr = next_rr()
+            changes.append((origin,deleted[0].rdata.times[0],
+                            added[0].rdata.times[0],deleted,added))
+        return ('ixfr',soa,changes)
+    else:
+        rrs = [soa]
+        while rr.rtype != QTYPE.SOA:
+            rrs.append(rr)
+            rr = next_rr()
+        return ('axfr',soa,rrs)
+
+class Secondary(threading.Thread):
+
+    """
+        Keep zone 'origin' in ZoneResolver in sync with primary - polls
+        every SOA refresh interval (or 'interval' if given) and retries
+        failed transfers after the SOA retry interval
+    """
+
+    def __init__(self,resolver,origin,primary,port=53,interval=None,
+                      timeout=5):
+        super(Secondary,self).__init__()
+        self.daemon = True
+        self.resolver = resolver
+        self.origin = origin
+        self.primary = primary
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        """
+            Check primary for changes and apply - returns transfer kind
+            ('current'/'ixfr'/'axfr')
+        """
+        with self.resolver.lock:
+            soa = self.resolver.soa(self.origin)
+        kind,_,data = transfer(self.origin,self.primary,self.port,
+                               soa,self.timeout)
+        if kind == 'ixfr':
+            with self.resolver.lock:
+                for change in data:
+                    if not self.resolver.apply_change(*change):
+                        break
+                else:
+                    return kind
+            # Incremental changes don't follow on - fall back to AXFR
+            kind,_,data = transfer(self.origin,self.primary,self.port,
+                                   None,self.timeout)
+        if kind == 'axfr':
+            self.resolver.replace_zone(self.origin,data)
+        return kind
+
+    def run(self):
+        wait = 0
+        while not self.stopped.wait(wait):
+            try:
+                self.refresh()
+                ok = True
+            except (TransferError,socket.error,EnvironmentError):
+                ok = False
+            soa = self.resolver.soa(self.origin)
+            if self.interval:
+                wait = self.interval
+            elif soa:
+                wait = soa.rdata.times[1] if ok else soa.rdata.times[2]
+            else:
+                wait = 60
+
+    def stop(self):
+        self.stopped.set()
+
+if __name__ == '__main__':
+
+    import argparse,doctest
+
+    p = argparse.ArgumentParser(description="Zone Transfer")
+    p.add_argument("--server","-s",default="127.0.0.1:53",
+                    metavar="<address:port>",
+                    help="Primary server (default:127.0.0.1:53)")
+    p.add_argument("--serial",type=int,default=None,
+                    metavar="<serial>",
+                    help="Request IXFR from serial (default: AXFR)")
+    p.add_argument("--timeout",type=float,default=5,
+                    metavar="<timeout>",
+                    help="Timeout (default:5s)")
+    p.add_argument("zone",nargs="?",metavar="<zone>",
+                    help="Zone to transfer (run doctests if not given)")
+    args = p.parse_args()
+
+    if not args.zone:
+        doctest.testmod()
+    else:
+        address,_,port = args.server.partition(':')
+        soa = None
+        if args.serial is not None:
+            soa = RR(args.zone,QTYPE.SOA,
+                     rdata=SOA(args.zone,args.zone,(args.serial,0,0,0,0)))
+        kind,soa,data = transfer(args.zone,address,int(port or 53),
+                                 soa,args.timeout)
+        if kind == 'axfr':
+            for rr in data:
+                print(rr.toZone())
+        elif kind == 'ixfr':
+            for _,serial_from,serial_to,deleted,added in data:
+                print(";; %d -> %d" % (serial_from,serial_to))
+                for rr in deleted:
+                    print("-",rr.toZone())
+                for rr in added:
+                    print("+",rr.toZone())
+        else:
+            print(";; Up to date: %s" % soa.toZone())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+    ZoneIndex - in-memory index of zone RRs keyed by owner name
+
+    Names are compared case-insensitively (as DNSLabel.__eq__ does) so
+    the index is keyed on the lowercased label tuple rather than on the
+    DNSLabel itself (DNSLabel.__hash__ is case sensitive).
+
+    >>> from dnslib import RR
+    >>> z = ZoneIndex(RR.fromZone('''
+    ... abc.com.      60 A  1.2.3.4
+    ... abc.com.      60 MX 10 mail.abc.com.
+    ... mail.abc.com. 60 A  5.6.7.8
+    ... '''))
+    >>> len(z)
+    3
+    >>> for rr in z.get("ABC.COM"):
+    ...     print(rr)
+    abc.com.                60      IN      A       1.2.3.4
+    abc.com.                60      IN      MX      10 mail.abc.com.
+    >>> z.get("xxx.abc.com")
+    ()
+    >>> "mail.abc.com" in z
+    True
+    >>> [str(n) for n in z.names()]
+    ['abc.com.', 'mail.abc.com.']
+
+    Changes are copy-on-write per name (the RR list for a name is
+    replaced rather than modified) so a copy can be updated while
+    other threads continue to read the original
+
+    >>> z2 = z.copy()
+    >>> mx = z2.get("abc.com")[1]
+    >>> z2.remove(mx)
+    1
+    >>> z2.add(*RR.fromZone("www.abc.com. 60 CNAME abc.com."))
+    >>> len(z),len(z2)
+    (3, 3)
+    >>> [rr.rtype for rr in z.get("abc.com")]
+    [1, 15]
+    >>> [rr.rtype for rr in z2.get("abc.com")]
+    [1]
+    >>> "www.abc.com" in z, "www.abc.com" in z2
+    (False, True)
+"""
+
+from __future__ import print_function
+
+from dnslib.label import DNSLabel
+
+def name_key(name):
+    """
+        Return case-insensitive index key for name
+    """
+    if not isinstance(name,DNSLabel):
+        name = DNSLabel(name)
+    return tuple([ l.lower() for l in name.label ])
+
+def in_zone(name,origin):
+    """
+        Check if name is at or below origin
+
+        >>> in_zone("www.ABC.com","abc.com"), in_zone("abc.com","www.abc.com")
+        (True, False)
+    """
+    key,okey = name_key(name),name_key(origin)
+    return key[len(key)-len(okey):] == okey
+
+class ZoneIndex(object):
+
+    """
+        Index of RRs by (case-insensitive) owner name
+
+        The read interface (get/names/__iter__/__len__/__contains__) is
+        shared with CompiledZone so that resolvers can serve from either
+    """
+
+    def __init__(self,rrs=()):
+        self.rrsets = {}
+        self.count = 0
+        for rr in rrs:
+            self.rrsets.setdefault(name_key(rr.rname),[]).append(rr)
+            self.count += 1
+
+    def copy(self):
+        """
+            Return copy of index (RR lists are shared until modified)
+        """
+        new = ZoneIndex()
+        new.rrsets = self.rrsets.copy()
+        new.count = self.count
+        return new
+
+    def add(self,*rrs):
+        """
+            Add RR(s) to index
+        """
+        for rr in rrs:
+            key = name_key(rr.rname)
+            self.rrsets[key] = self.rrsets.get(key,[]) + [rr]
+            self.count += 1
+
+    def remove(self,rr):
+        """
+            Remove RR instance from index - returns number of RRs removed
+        """
+        key = name_key(rr.rname)
+        current = self.rrsets.get(key,[])
+        rrs = [ x for x in current if x is not rr ]
+        removed = len(current) - len(rrs)
+        if rrs:
+            self.rrsets[key] = rrs
+        elif key in self.rrsets:
+            del self.rrsets[key]
+        self.count -= removed
+        return removed
+
+    def get(self,name):
+        """
+            Return RRs for name (empty tuple if name not in zone)
+        """
+        return self.rrsets.get(name_key(name),())
+
+    def names(self):
+        """
+            Return owner names in index
+        """
+        return [ rrs[0].rname for rrs in self.rrsets.values() ]
+
+    def __iter__(self):
+        for rrs in self.rrsets.values():
+            for rr in rrs:
+                yield rr
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,name):
+        return name_key(name) in self.rrsets
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
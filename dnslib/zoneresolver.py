@@ -1,26 +1,227 @@
 # -*- coding: utf-8 -*-
 
+"""
+    ZoneResolver - serve zone file (or compiled zone image)
+
+    Text zones can be modified using RFC2136 UPDATE requests from
+    clients in 'allow_update'. Changes are applied to the in-memory
+    index, the SOA serial is incremented and (if a journal is given)
+    the change is appended to the journal, which is replayed when the
+    resolver is next started.
+
+    >>> from dnslib import DNSRecord,DNSHeader,DNSQuestion,OPCODE,A
+    >>> zone = '''
+    ... $ORIGIN abc.com.
+    ... @       3600 SOA   ns1 admin 2014010100 3600 600 86400 60
+    ... @       3600 NS    ns1
+    ... ns1     60   A     1.2.3.4
+    ... www     60   A     5.6.7.8
+    ... '''
+    >>> class Handler:
+    ...     client_address = ('127.0.0.1',12345)
+    >>> def rr(name,rtype,rclass=CLASS_ANY,rdata=''):
+    ...     # Meta RR (class ANY/NONE) with no TTL
+    ...     return RR(name,getattr(QTYPE,rtype),rclass,0,rdata)
+    >>> def update(prereq=(),update=()):
+    ...     return DNSRecord(DNSHeader(opcode=OPCODE.UPDATE),
+    ...                      q=DNSQuestion("abc.com",QTYPE.SOA),
+    ...                      rr=list(prereq),auth=list(update))
+    >>> def serial(r):
+    ...     return r.soa("abc.com").rdata.times[0]
+    >>> r = ZoneResolver(zone,allow_update=["127.0.0.0/8"])
+
+    Add RR (prerequisite - www.abc.com exists)
+
+    >>> a = r.update(update([rr("www.abc.com","ANY")],
+    ...                     RR.fromZone("www.abc.com. 60 A 9.9.9.9")),Handler())
+    >>> RCODE[a.header.rcode], serial(r)
+    ('NOERROR', 2014010101)
+    >>> [ str(x.rdata) for x in r.zone.get("www.abc.com") ]
+    ['5.6.7.8', '9.9.9.9']
+
+    Prerequisite failures (no changes made)
+
+    >>> a = r.update(update([rr("xxx.abc.com","ANY")],
+    ...                     RR.fromZone("xxx.abc.com. 60 A 9.9.9.9")),Handler())
+    >>> RCODE[a.header.rcode], serial(r)
+    ('NXDOMAIN', 2014010101)
+    >>> a = r.update(update(RR.fromZone("www.abc.com. 0 A 5.6.7.8")),Handler())
+    >>> RCODE[a.header.rcode]
+    'NXRRSET'
+    >>> a = r.update(update(RR.fromZone('''
+    ... www.abc.com. 0 A 5.6.7.8
+    ... www.abc.com. 0 A 9.9.9.9
+    ... ''')),Handler())
+    >>> RCODE[a.header.rcode]
+    'NOERROR'
+    >>> a = r.update(update([rr("www.abc.com","A",CLASS_NONE)]),Handler())
+    >>> RCODE[a.header.rcode]
+    'YXRRSET'
+
+    Delete RR / RRset / all RRsets (SOA & apex NS are protected)
+
+    >>> a = r.update(update([],[rr("www.abc.com","A",CLASS_NONE,A("5.6.7.8"))]),
+    ...              Handler())
+    >>> [ str(x.rdata) for x in r.zone.get("www.abc.com") ]
+    ['9.9.9.9']
+    >>> a = r.update(update([],[rr("www.abc.com","A")]),Handler())
+    >>> "www.abc.com" in r.zone, serial(r)
+    (False, 2014010103)
+    >>> a = r.update(update([],[rr("abc.com","ANY")]),Handler())
+    >>> sorted([ QTYPE[x.rtype] for x in r.zone.get("abc.com") ]), serial(r)
+    (['NS', 'SOA'], 2014010103)
+
+    Updates replace the index (lookups using the previous index - eg. a
+    glob match iterating the zone - are unaffected)
+
+    >>> index = r.zone
+    >>> a = r.update(update([],RR.fromZone("new.abc.com. 60 A 9.9.9.9")),
+    ...              Handler())
+    >>> "new.abc.com" in r.zone, "new.abc.com" in index, serial(r)
+    (True, False, 2014010104)
+
+    Names outside zone / unauthorised clients
+
+    >>> a = r.update(update([],RR.fromZone("www.xyz.com. 60 A 9.9.9.9")),
+    ...              Handler())
+    >>> RCODE[a.header.rcode]
+    'NOTZONE'
+    >>> class Remote:
+    ...     client_address = ('10.0.0.1',12345)
+    >>> a = r.update(update([],RR.fromZone("www.abc.com. 60 A 9.9.9.9")),
+    ...              Remote())
+    >>> RCODE[a.header.rcode]
+    'REFUSED'
+
+    UPDATE requests round-trip through the wire format
+
+    >>> u = update([rr("abc.com","SOA")],[rr("www.abc.com","ANY")])
+    >>> DNSRecord.parse(u.pack()) == u
+    True
+
+    Changes are journalled and replayed on restart
+
+    >>> import os,tempfile
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> r = ZoneResolver(zone,journal=path,allow_update=["127.0.0.1"])
+    >>> a = r.update(update([],RR.fromZone("new.abc.com. 60 TXT hello")),
+    ...              Handler())
+    >>> a = r.update(update([],[rr("www.abc.com","ANY")]),Handler())
+    >>> r = ZoneResolver(zone,journal=path)
+    >>> serial(r)
+    2014010102
+    >>> for rr in r.zone.get("new.abc.com"):
+    ...     print(rr)
+    new.abc.com.            60      IN      TXT     "hello"
+    >>> "www.abc.com" in r.zone
+    False
+    >>> os.remove(path)
+"""
+
 from __future__ import print_function
 
-import copy
+import copy,ipaddress,threading
 
-from dnslib import RR,QTYPE,RCODE
+from dnslib import RR,QTYPE,RCODE,CLASS,SOA
 from dnslib.server import DNSServer,DNSHandler,BaseResolver,DNSLogger
+from dnslib.compiledzone import CompiledZone,is_compiled
+from dnslib.journal import Journal
+from dnslib.rrl import RateLimiter
+from dnslib.xfr import Secondary,pack_messages
+from dnslib.zoneindex import ZoneIndex,name_key,in_zone
+
+# RFC2136 meta classes
+CLASS_NONE = getattr(CLASS,'None')
+CLASS_ANY = getattr(CLASS,'*')
+
+class UpdateError(Exception):
+    """
+        Abort UPDATE processing - args[0] is the response RCODE
+    """
+    pass
+
+def serial_add(serial,n=1):
+    """
+        RFC1982 serial number addition
+    """
+    return (serial + n) % 2**32
+
+def serial_gt(s1,s2):
+    """
+        RFC1982 serial number comparison (s1 > s2)
+
+        >>> serial_gt(2,1), serial_gt(1,2), serial_gt(0,2**32-1)
+        (True, False, True)
+    """
+    return (s1 < s2 and s2 - s1 > 2**31) or (s1 > s2 and s1 - s2 < 2**31)
+
+def axfr_records(zone,origin,soa):
+    """
+        AXFR response RRs - SOA, zone RRs, SOA
+    """
+    yield soa
+    for rr in zone:
+        if in_zone(rr.rname,origin) and rr.rtype != QTYPE.SOA:
+            yield rr
+    yield soa
+
+def ixfr_records(soa,changes):
+    """
+        IXFR response RRs - SOA, then for each change old SOA, deleted
+        RRs, new SOA, added RRs, and finally SOA
+    """
+    yield soa
+    for _,_,_,deleted,added in changes:
+        for rrs in (deleted,added):
+            # SOA must come first
+            for rr in sorted(rrs,key=lambda rr:rr.rtype != QTYPE.SOA):
+                yield rr
+    yield soa
 
 class ZoneResolver(BaseResolver):
     """
         Simple fixed zone file resolver.
     """
 
-    def __init__(self,zone,glob=False):
+    def __init__(self,zone,glob=False,journal=None,allow_update=None,
+                      allow_transfer=None):
         """
-            Initialise resolver from zone file. 
-            Stores RRs as a list of (label,type,rr) tuples
+            Initialise resolver from zone file or CompiledZone instance.
+            Stores RRs in a ZoneIndex (or serves directly from the
+            CompiledZone image).
             If 'glob' is True use glob match against zone file 
+            'journal' is the path of the UPDATE journal (changes in the
+            journal are replayed on startup) and 'allow_update' the
+            list of networks UPDATE requests are accepted from (default:
+            none). Compiled zones are read-only.
+            'allow_transfer' is the list of networks AXFR/IXFR requests
+            are accepted from (default: none)
         """
-        self.zone = [(rr.rname,QTYPE[rr.rtype],rr) for rr in RR.fromZone(zone)]
+        if isinstance(zone,CompiledZone):
+            self.zone = zone
+        else:
+            self.zone = ZoneIndex(RR.fromZone(zone))
         self.glob = glob
-        self.eq = 'matchGlob' if glob else '__eq__'
+        self.allow_update = [ ipaddress.ip_network(n) 
+                                    for n in allow_update or [] ]
+        self.allow_transfer = [ ipaddress.ip_network(n) 
+                                    for n in allow_transfer or [] ]
+        self.lock = threading.Lock()
+        self.journal = None
+        if journal:
+            self.journal = Journal(journal)
+            self.replay()
+
+    def match(self,qname):
+        """
+            Return RRs matching qname - for glob matches this has to
+            check every RR in the zone
+        """
+        if self.glob:
+            return [ rr for rr in self.zone if qname.matchGlob(rr.rname) ]
+        else:
+            return self.zone.get(qname)
 
     def resolve(self,request,handler):
         """
@@ -29,12 +230,11 @@ class ZoneResolver(BaseResolver):
         """
         reply = request.reply()
         qname = request.q.qname
-        qtype = QTYPE[request.q.qtype]
-        for name,rtype,rr in self.zone:
-            # Check if label & type match
-            if getattr(qname,self.eq)(name) and (qtype == rtype or 
-                                                 qtype == 'ANY' or 
-                                                 rtype == 'CNAME'):
+        qtype = request.q.qtype
+        for rr in self.match(qname):
+            rtype = rr.rtype
+            # Check if type matches
+            if qtype == rtype or qtype == QTYPE.ANY or rtype == QTYPE.CNAME:
                 # If we have a glob match fix reply label
                 if self.glob:
                     a = copy.copy(rr)
@@ -44,22 +244,313 @@ class ZoneResolver(BaseResolver):
                     reply.add_answer(rr)
                 # Check for A/AAAA records associated with reply and
                 # add in additional section
-                if rtype in ['CNAME','NS','MX','PTR']:
-                    for a_name,a_rtype,a_rr in self.zone:
-                        if a_name == rr.rdata.label and a_rtype in ['A','AAAA']:
+                if rtype in (QTYPE.CNAME,QTYPE.NS,QTYPE.MX,QTYPE.PTR):
+                    for a_rr in self.zone.get(rr.rdata.label):
+                        if a_rr.rtype in (QTYPE.A,QTYPE.AAAA):
                             reply.add_ar(a_rr)
         if not reply.rr:
             reply.header.rcode = RCODE.NXDOMAIN
         return reply
 
+    def soa(self,origin,zone=None):
+        """
+            Return SOA RR for zone apex (None if not authoritative)
+        """
+        for rr in (self.zone if zone is None else zone).get(origin):
+            if rr.rtype == QTYPE.SOA:
+                return rr
+        return None
+
+    def update(self,request,handler):
+        """
+            Process RFC2136 UPDATE request (called by DNSHandler for
+            UPDATE opcode). Updates are serialised so the prerequisite
+            checks and changes are atomic with respect to other updates,
+            and are applied to a copy of the index which replaces the
+            zone when complete (lookups see the whole update or none of it).
+        """
+        reply = request.reply()
+        try:
+            client = ipaddress.ip_address(handler.client_address[0])
+            if not any(client in n for n in self.allow_update):
+                raise UpdateError(RCODE.REFUSED)
+            if not isinstance(self.zone,ZoneIndex):
+                raise UpdateError(RCODE.REFUSED)
+            if len(request.questions) != 1 or \
+                    request.q.qtype != QTYPE.SOA or \
+                    request.q.qclass != CLASS.IN:
+                raise UpdateError(RCODE.FORMERR)
+            origin = request.q.qname
+            with self.lock:
+                soa = self.soa(origin)
+                if soa is None:
+                    raise UpdateError(RCODE.NOTAUTH)
+                self.check_prerequisites(origin,request.rr)
+                self.check_updates(origin,request.auth)
+                zone = self.zone.copy()
+                deleted,added = self.apply_updates(zone,origin,soa,
+                                                   request.auth)
+                if deleted or added:
+                    self.commit(zone,origin,soa,deleted,added)
+                    self.zone = zone
+        except UpdateError as e:
+            reply.header.rcode = e.args[0]
+        return reply
+
+    def check_prerequisites(self,origin,prereqs):
+        """
+            Check prerequisite section (RFC2136 3.2)
+        """
+        rrsets = {}
+        for rr in prereqs:
+            if rr.ttl != 0:
+                raise UpdateError(RCODE.FORMERR)
+            if not in_zone(rr.rname,origin):
+                raise UpdateError(RCODE.NOTZONE)
+            rrs = self.zone.get(rr.rname)
+            if rr.rclass == CLASS_ANY:
+                if rr.rdata:
+                    raise UpdateError(RCODE.FORMERR)
+                if rr.rtype == QTYPE.ANY:
+                    if not rrs:
+                        raise UpdateError(RCODE.NXDOMAIN)
+                elif not [ x for x in rrs if x.rtype == rr.rtype ]:
+                    raise UpdateError(RCODE.NXRRSET)
+            elif rr.rclass == CLASS_NONE:
+                if rr.rdata:
+                    raise UpdateError(RCODE.FORMERR)
+                if rr.rtype == QTYPE.ANY:
+                    if rrs:
+                        raise UpdateError(RCODE.YXDOMAIN)
+                elif [ x for x in rrs if x.rtype == rr.rtype ]:
+                    raise UpdateError(RCODE.YXRRSET)
+            elif rr.rclass == CLASS.IN:
+                key = (name_key(rr.rname),rr.rtype)
+                rrsets.setdefault(key,(rr.rname,[]))[1].append(rr.rdata)
+            else:
+                raise UpdateError(RCODE.FORMERR)
+        # Value dependent RRset checks (RRset must match exactly)
+        for (_,rtype),(rname,expected) in rrsets.items():
+            rdata = [ x.rdata for x in self.zone.get(rname) if x.rtype == rtype ]
+            if not (all(x in rdata for x in expected) and 
+                    all(x in expected for x in rdata)):
+                raise UpdateError(RCODE.NXRRSET)
+
+    def check_updates(self,origin,updates):
+        """
+            Prescan update section (RFC2136 3.4.1)
+        """
+        for rr in updates:
+            if not in_zone(rr.rname,origin):
+                raise UpdateError(RCODE.NOTZONE)
+            if rr.rclass == CLASS.IN:
+                if rr.rtype in (QTYPE.ANY,QTYPE.AXFR,QTYPE.IXFR,QTYPE.OPT):
+                    raise UpdateError(RCODE.FORMERR)
+            elif rr.rclass == CLASS_ANY:
+                if rr.ttl != 0 or rr.rdata or \
+                        rr.rtype in (QTYPE.AXFR,QTYPE.IXFR):
+                    raise UpdateError(RCODE.FORMERR)
+            elif rr.rclass == CLASS_NONE:
+                if rr.ttl != 0 or \
+                        rr.rtype in (QTYPE.ANY,QTYPE.AXFR,QTYPE.IXFR):
+                    raise UpdateError(RCODE.FORMERR)
+            else:
+                raise UpdateError(RCODE.FORMERR)
+
+    def apply_updates(self,zone,origin,soa,updates):
+        """
+            Apply update section to zone index (RFC2136 3.4.2) - returns
+            lists of deleted and added RRs
+        """
+        deleted,added = [],[]
+        apex = name_key(origin)
+        for rr in updates:
+            rrs = zone.get(rr.rname)
+            at_apex = name_key(rr.rname) == apex
+            if rr.rclass == CLASS.IN:
+                if rr.rtype == QTYPE.SOA:
+                    # Replace SOA only if serial is newer
+                    if at_apex and serial_gt(rr.rdata.times[0],
+                                             soa.rdata.times[0]):
+                        new = RR(soa.rname,QTYPE.SOA,CLASS.IN,rr.ttl,rr.rdata)
+                        zone.remove(soa)
+                        zone.add(new)
+                        deleted.append(soa)
+                        added.append(new)
+                        soa = new
+                    continue
+                # CNAME can't coexist with other data
+                cname = [ x for x in rrs if x.rtype == QTYPE.CNAME ]
+                if rr.rtype == QTYPE.CNAME:
+                    if len(cname) != len(rrs):
+                        continue
+                elif cname:
+                    continue
+                if [ x for x in rrs if x.rtype == rr.rtype and 
+                                       x.rdata == rr.rdata ]:
+                    continue
+                for x in cname:
+                    zone.remove(x)
+                    deleted.append(x)
+                new = RR(rr.rname,rr.rtype,CLASS.IN,rr.ttl,rr.rdata)
+                zone.add(new)
+                added.append(new)
+            elif rr.rclass == CLASS_ANY:
+                for x in rrs:
+                    if at_apex and x.rtype in (QTYPE.SOA,QTYPE.NS):
+                        continue
+                    if rr.rtype == QTYPE.ANY or x.rtype == rr.rtype:
+                        zone.remove(x)
+                        deleted.append(x)
+            else:
+                if rr.rtype == QTYPE.SOA:
+                    continue
+                ns = [ x for x in rrs if x.rtype == QTYPE.NS ]
+                for x in rrs:
+                    if x.rtype == rr.rtype and x.rdata == rr.rdata:
+                        # Don't delete last NS at apex
+                        if at_apex and x.rtype == QTYPE.NS and len(ns) == 1:
+                            continue
+                        zone.remove(x)
+                        deleted.append(x)
+        return deleted,added
+
+    def commit(self,zone,origin,soa,deleted,added):
+        """
+            Increment SOA serial (unless the update replaced the SOA)
+            and journal change - on journal failure SERVFAIL is returned
+            (and the updated index isn't used)
+        """
+        if not [ rr for rr in added if rr.rtype == QTYPE.SOA ]:
+            times = (serial_add(soa.rdata.times[0]),) + soa.rdata.times[1:]
+            new = RR(soa.rname,QTYPE.SOA,soa.rclass,soa.ttl,
+                     SOA(soa.rdata.mname,soa.rdata.rname,times))
+            zone.remove(soa)
+            zone.add(new)
+            deleted.insert(0,soa)
+            added.insert(0,new)
+        if self.journal:
+            serial_to = self.soa(origin,zone).rdata.times[0]
+            try:
+                self.journal.append(origin,soa.rdata.times[0],serial_to,
+                                    deleted,added)
+            except (IOError,OSError):
+                raise UpdateError(RCODE.SERVFAIL)
+
+    def replay(self):
+        """
+            Replay journalled changes which follow on from the serial
+            of the loaded zone (changes already in the zone file are
+            skipped) - returns number of changes applied
+        """
+        n = 0
+        for change in self.journal:
+            origin,serial_from,_,_,_ = change
+            soa = self.soa(origin)
+            if soa is None or soa.rdata.times[0] != serial_from:
+                continue
+            self.apply_change(*change,journal=False)
+            n += 1
+        return n
+
+    def apply_change(self,origin,serial_from,serial_to,deleted,added,
+                          journal=True):
+        """
+            Apply change (from journal or IXFR) if it follows on from
+            the current serial - returns True if applied. The caller
+            should hold the lock.
+        """
+        soa = self.soa(origin)
+        if soa is None or soa.rdata.times[0] != serial_from:
+            return False
+        zone = self.zone.copy()
+        for rr in deleted:
+            for x in zone.get(rr.rname):
+                if x.rtype == rr.rtype and x.rdata == rr.rdata:
+                    zone.remove(x)
+                    break
+        zone.add(*added)
+        if journal and self.journal:
+            self.journal.append(origin,serial_from,serial_to,deleted,added)
+        self.zone = zone
+        return True
+
+    def replace_zone(self,origin,rrs):
+        """
+            Replace contents of zone (eg. from AXFR) - RRs for other
+            zones are kept
+        """
+        with self.lock:
+            zone = ZoneIndex([ rr for rr in self.zone 
+                                    if not in_zone(rr.rname,origin) ])
+            zone.add(*rrs)
+            self.zone = zone
+
+    def transfer(self,request,handler):
+        """
+            Zone transfer (called by DNSHandler for AXFR/IXFR) - generator
+            returning packed response messages.
+
+            AXFR is streamed from a snapshot of the index (so updates can
+            continue) and IXFR is served from the journal (falling back
+            to AXFR if the journal doesn't cover the requested serial).
+            Over UDP IXFR returns the current SOA (client should retry
+            over TCP) and AXFR is not supported.
+        """
+        reply = request.reply()
+        origin = request.q.qname
+        client = ipaddress.ip_address(handler.client_address[0])
+        if not any(client in n for n in self.allow_transfer):
+            reply.header.rcode = RCODE.REFUSED
+            yield reply.pack()
+            return
+        with self.lock:
+            soa = self.soa(origin)
+            zone = self.zone
+            if isinstance(zone,ZoneIndex):
+                zone = zone.copy()
+            changes = None
+            if soa and request.q.qtype == QTYPE.IXFR:
+                client_soa = [ rr for rr in request.auth 
+                                    if rr.rtype == QTYPE.SOA ]
+                if not client_soa:
+                    reply.header.rcode = RCODE.FORMERR
+                elif not serial_gt(soa.rdata.times[0],
+                                   client_soa[0].rdata.times[0]):
+                    changes = []
+                elif self.journal:
+                    changes = self.journal.changes(origin,
+                                            client_soa[0].rdata.times[0])
+                    if changes and changes[-1][2] != soa.rdata.times[0]:
+                        changes = None
+        if soa is None:
+            reply.header.rcode = RCODE.NOTAUTH
+        elif handler.protocol == 'udp':
+            if request.q.qtype == QTYPE.IXFR:
+                reply.add_answer(soa)
+            else:
+                reply.header.rcode = RCODE.FORMERR
+        if reply.header.rcode or reply.rr:
+            yield reply.pack()
+        elif changes == []:
+            # Up to date
+            for msg in pack_messages(request,[soa]):
+                yield msg
+        elif changes:
+            for msg in pack_messages(request,ixfr_records(soa,changes)):
+                yield msg
+        else:
+            for msg in pack_messages(request,axfr_records(zone,origin,soa)):
+                yield msg
+
 if __name__ == '__main__':
 
     import argparse,sys,time
 
     p = argparse.ArgumentParser(description="Zone DNS Resolver")
-    p.add_argument("--zone","-z",required=True,
+    p.add_argument("--zone","-z",default=None,
                         metavar="<zone-file>",
-                        help="Zone file ('-' for stdin)")
+                        help="Zone file or compiled zone image ('-' for stdin)")
     p.add_argument("--port","-p",type=int,default=53,
                         metavar="<port>",
                         help="Server port (default:53)")
@@ -73,18 +564,43 @@ if __name__ == '__main__':
                     help="Max UDP packet length (default:0)")
     p.add_argument("--tcp",action='store_true',default=False,
                         help="TCP server (default: UDP only)")
+    p.add_argument("--journal","-j",default=None,
+                    metavar="<journal>",
+                    help="UPDATE journal (replayed on startup)")
+    p.add_argument("--allow-update",action='append',default=[],
+                    metavar="<network>",
+                    help="Accept UPDATE requests from network (can be repeated)")
+    p.add_argument("--allow-transfer",action='append',default=[],
+                    metavar="<network>",
+                    help="Accept AXFR/IXFR requests from network (can be repeated)")
+    p.add_argument("--secondary",default=None,
+                    metavar="<zone>@<primary>[:<port>]",
+                    help="Run as secondary for zone (transfer from primary)")
+    p.add_argument("--rrl",type=float,default=0,
+                    metavar="<rate>",
+                    help="Response rate limit per client network/name (responses/sec, default: 0 = off)")
     p.add_argument("--log",default="request,reply,truncated,error",
                     help="Log hooks to enable (default: +request,+reply,+truncated,+error,-recv,-send,-data)")
     p.add_argument("--log-prefix",action='store_true',default=False,
                     help="Log prefix (timestamp/handler/resolver) (default: False)")
     args = p.parse_args()
     
-    if args.zone == '-':
+    if not (args.zone or args.secondary):
+        p.error("Either --zone or --secondary required")
+
+    if not args.zone:
+        args.zone = ""
+    elif args.zone == '-':
         args.zone = sys.stdin
+    elif is_compiled(args.zone):
+        args.zone = CompiledZone(args.zone)
     else:
         args.zone = open(args.zone)
 
-    resolver = ZoneResolver(args.zone,args.glob)
+    resolver = ZoneResolver(args.zone,args.glob,
+                            journal=args.journal,
+                            allow_update=args.allow_update,
+                            allow_transfer=args.allow_transfer)
     logger = DNSLogger(args.log,args.log_prefix)
 
     print("Starting Zone Resolver (%s:%d) [%s]" % (
@@ -92,17 +608,28 @@ if __name__ == '__main__':
                         args.port,
                         "UDP/TCP" if args.tcp else "UDP"))
 
-    for rr in resolver.zone:
-        print("    | ",rr[2].toZone(),sep="")
+    if isinstance(resolver.zone,CompiledZone):
+        print("    | <%d RRs from compiled zone: %s>" % (len(resolver.zone),
+                                                       resolver.zone.path))
+    else:
+        for rr in resolver.zone:
+            print("    | ",rr.toZone(),sep="")
     print()
 
     if args.udplen:
         DNSHandler.udplen = args.udplen
 
+    if args.secondary:
+        origin,_,primary = args.secondary.partition('@')
+        address,_,port = primary.partition(':')
+        secondary = Secondary(resolver,origin,address,int(port or 53))
+        secondary.start()
+
     udp_server = DNSServer(resolver,
                            port=args.port,
                            address=args.address,
-                           logger=logger)
+                           logger=logger,
+                           rrl=RateLimiter(args.rrl) if args.rrl else None)
     udp_server.start_thread()
 
     if args.tcp: